@@ -0,0 +1,276 @@
+import asyncio
+import logging
+import time
+
+import jinja2
+from aiohttp import web
+
+import constants
+import utils
+from metrics import Metrics
+from web import Web
+
+
+class AsyncWeb(Web):
+    """
+    The web server for streaming & control, running on a single asyncio event loop instead of Flask's threaded server.
+    Serves the same routes as Web with a constant number of threads no matter how many clients are connected.
+    Frames are encoded by the same encoder thread as in Web, and blocking work is handed to the loop's executor so the
+    event loop never waits on the vision loop.
+
+    Attributes
+    ----------
+
+    loop : asyncio.AbstractEventLoop
+        - the event loop the server runs on
+    encoded : asyncio.Event
+        - set and replaced after every encoded frame, awaited by stream clients
+    templates : jinja2.Environment
+        - loads the HTML templates
+    """
+
+    def __init__(self, main, resize: bool = False):
+        """
+        :param main: The Main in which the target recognition loop is being run.
+        :param resize: Whether the frame should be resized, False by default.
+        """
+        super().__init__(main, resize)
+        self.loop = None
+        self.encoded = None
+        self.templates = jinja2.Environment(loader=jinja2.FileSystemLoader('templates'))
+
+    def on_encoded(self):
+        """
+        Wake up the stream clients on the event loop.
+        """
+        if self.loop:
+            self.loop.call_soon_threadsafe(self.notify_clients)
+
+    def notify_clients(self):
+        """
+        Release every client waiting for a frame, and create a new event for the next one.
+        """
+        encoded, self.encoded = self.encoded, asyncio.Event()
+        encoded.set()
+
+    async def index(self, request):
+        """
+        Returns the HTML template.
+        """
+        if self.main.results.networktables:
+            filename = self.main.nt.get_item('match data', 'Enter file name')
+        else:
+            filename = time.strftime("%d-%m-%Y-%H-%M-%S")
+        html = self.templates.get_template('index.html').render(initial_filename=filename,
+                                                                url_for=lambda name: '/stream.mjpg',
+                                                                overlay_transport='websocket',
+                                                                stages=constants.WEB_STAGES)
+        return web.Response(text=html, content_type='text/html')
+
+    async def video_feed(self, request):
+        """
+        Stream frames, or an intermediate stage on /stream/{stage}.mjpg, with the same query parameters as
+        video_feed in Web.
+        See: stream_frame() in Web
+        """
+        stage = request.match_info.get('stage')
+        if stage is not None and stage not in constants.WEB_STAGES:
+            raise web.HTTPNotFound(text='Unknown stage')
+        width = int(request.query['width']) if 'width' in request.query else None
+        quality = min(max(int(request.query.get('quality', constants.WEB_STREAM_QUALITY)), 1), 100)
+        fps = float(request.query['fps']) if 'fps' in request.query else None
+        auto = 'auto' in request.query
+
+        response = web.StreamResponse()
+        response.headers['Content-Type'] = 'multipart/x-mixed-replace; boundary=frame'
+        await response.prepare(request)
+
+        level = len(constants.WEB_STREAM_LEVELS) // 2
+        fast_frames = 0
+        budget = 1 / (fps or constants.WEB_STREAM_AUTO_FPS)
+        key = (stage,) + (constants.WEB_STREAM_LEVELS[level] if auto else (width, quality))
+        self.subscribe(key, 1)
+        try:
+            last_id = 0
+            last_time = 0
+            while True:
+                if fps:
+                    await asyncio.sleep(max(last_time + 1 / fps - time.time(), 0))
+                while self.variants[key]['id'] == last_id:
+                    await self.encoded.wait()
+                jpg, last_id = self.variants[key]['jpeg'], self.variants[key]['id']
+                last_time = time.time()
+                # Waits until the frame was written to the client
+                await response.write(b'--frame\r\n'b'Content-Type: image/jpeg\r\n\r\n' + jpg + b'\r\n')
+                if not auto:
+                    continue
+                new_level, fast_frames = self.adapt_level(level, fast_frames, time.time() - last_time, budget)
+                if new_level != level:
+                    level = new_level
+                    self.subscribe((stage,) + constants.WEB_STREAM_LEVELS[level], 1)
+                    self.subscribe(key, -1)
+                    key = (stage,) + constants.WEB_STREAM_LEVELS[level]
+                    last_id = 0
+        except (ConnectionResetError, asyncio.CancelledError):
+            pass
+        finally:
+            self.subscribe(key, -1)
+        return response
+
+    async def overlay(self, request):
+        """
+        Annotations of every frame as JSON over a WebSocket, drawn over the stream by the web UI.
+        See: stream_overlay() in Web
+        """
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.subscribe_overlay(1)
+        try:
+            last_id = 0
+            while not ws.closed:
+                while self.overlay_id == last_id:
+                    await self.encoded.wait()
+                overlay_json, last_id = self.overlay_json, self.overlay_id
+                await ws.send_str(overlay_json)
+        except (ConnectionResetError, asyncio.CancelledError):
+            pass
+        finally:
+            self.subscribe_overlay(-1)
+        return ws
+
+    async def metrics_route(self, request):
+        """
+        Performance metrics, in the same formats as the metrics route in Web.
+        """
+        snapshot = self.metrics_snapshot()
+        if request.query.get('format') == 'prometheus' or 'text/plain' in request.headers.get('Accept', ''):
+            return web.Response(text=Metrics.prometheus(snapshot), content_type='text/plain')
+        return web.json_response(snapshot)
+
+    async def save(self, request):
+        """
+        Post route that saves HSV values.
+        See: save_hsv_values() in FileHSV in file_hsv.py; save_hsv_values() in Trackbars in trackbars.py
+        """
+        await self.loop.run_in_executor(None, self.main.hsv_handler.save_hsv_values)
+        return web.Response(status=204)
+
+    async def hsv(self, request):
+        """
+        Get or change the HSV ranges and morphology kernel sizes, as in the hsv route in Web.
+        See: tuning(), tune() in Web
+        """
+        if not self.can_tune():
+            raise web.HTTPNotFound(text='Tuning is not available')
+        if request.method == 'POST':
+            try:
+                data = await request.json()
+                await self.loop.run_in_executor(None, self.tune, data)
+            except (AttributeError, TypeError, ValueError) as e:
+                raise web.HTTPBadRequest(text='Invalid values: {}'.format(e))
+        return web.json_response(self.tuning())
+
+    async def dump(self, request):
+        """
+        Dump the flight recorder, as in the dump route in Web.
+        See: trigger() in FlightRecorder in flight_recorder.py
+        """
+        if getattr(self.main, 'flight_recorder', None) is None:
+            raise web.HTTPNotFound(text='Flight recorder is not running')
+        self.main.flight_recorder.trigger('web')
+        return web.Response(status=204)
+
+    async def trace_route(self, request):
+        """
+        Get whether the run is traced, or start or stop tracing, as in the trace route in Web.
+        See: Tracer in tracing.py
+        """
+        action = (await request.read()).decode('utf-8') if request.method == 'POST' else None
+        try:
+            # Stopping writes the trace
+            return web.json_response(await self.loop.run_in_executor(None, self.trace, action))
+        except ValueError:
+            raise web.HTTPBadRequest(text='Invalid action: {}'.format(action))
+
+    async def profile_route(self, request):
+        """
+        Get the state of the profiler, or request a profile of the loop, as in the profile route in Web.
+        See: Profiler in profiler.py
+        """
+        if getattr(self.main, 'profiler', None) is None:
+            raise web.HTTPNotFound(text='Profiling is not available')
+        if request.method == 'POST':
+            try:
+                self.profile(await request.json() if request.body_exists else {})
+            except (AttributeError, TypeError, ValueError) as e:
+                raise web.HTTPBadRequest(text='Invalid profile: {}'.format(e))
+        return web.json_response(self.main.profiler.state())
+
+    async def update(self, request):
+        """
+        Post route to change target.
+        See: change_name(name) in Main in main.py
+        """
+        target = (await request.read()).decode('utf-8')
+        await self.loop.run_in_executor(None, self.main.change_name, target)
+        return web.Response(status=204)
+
+    async def record(self, request):
+        """
+        Start recording.
+        See: start_recording(title) in Display in display.py
+        """
+        filename = (await request.read()).decode('utf-8')
+        if filename:
+            await self.loop.run_in_executor(None, self.main.display.start_recording, filename)
+        else:
+            logging.warning('File name not present')
+        return web.Response(status=204)
+
+    async def stop_recording(self, request):
+        """
+        Stop recording.
+        See: stop_recording() in Display in display.py
+        """
+        await self.loop.run_in_executor(None, self.main.display.stop_recording)
+        return web.Response(status=204)
+
+    def create_app(self) -> web.Application:
+        """
+        :return: The application with all routes.
+        """
+        app = web.Application()
+        app.router.add_get('/', self.index)
+        app.router.add_get('/stream.mjpg', self.video_feed)
+        app.router.add_get('/stream/{stage}.mjpg', self.video_feed)
+        app.router.add_get('/overlay', self.overlay)
+        app.router.add_get('/metrics', self.metrics_route)
+        app.router.add_post('/save', self.save)
+        app.router.add_get('/hsv', self.hsv)
+        app.router.add_post('/hsv', self.hsv)
+        app.router.add_post('/dump', self.dump)
+        app.router.add_get('/trace', self.trace_route)
+        app.router.add_post('/trace', self.trace_route)
+        app.router.add_get('/profile', self.profile_route)
+        app.router.add_post('/profile', self.profile_route)
+        app.router.add_post('/update', self.update)
+        app.router.add_post('/record', self.record)
+        app.router.add_post('/stopRecording', self.stop_recording)
+        return app
+
+    def serve(self):
+        """
+        Start the web server on a new event loop, print out ip and port for ease of use, and bind to all IPs.
+        """
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.encoded = asyncio.Event()
+        runner = web.AppRunner(self.create_app())
+        self.loop.run_until_complete(runner.setup())
+        self.loop.run_until_complete(web.TCPSite(runner, '0.0.0.0', 5802).start())
+        logging.info('Async web server: http://{}:5802'.format(utils.get_ip()))
+        self.loop.run_forever()
+
+
+if __name__ == "__main__":
+    help(AsyncWeb)
@@ -35,3 +35,100 @@ CAMERA_HEIGHT = 4
 REALSENSE_TIMEOUT_MS = 2000
 
 NT_RATE = 0.01
+
+# Fraction of the bay width added on each side when running the hatch network on bays only
+NEURAL_ROI_MARGIN = 1
+
+# Run the neural network every this many frames, and track the last detections in between
+NEURAL_DETECT_INTERVAL = 1
+# Run the neural network early if a tracked box's score (detection score * match score) drops below this
+NEURAL_TRACKER_MIN_SCORE = 0.5
+# Fraction of the box size searched around it when tracking
+NEURAL_TRACKER_SEARCH_MARGIN = 0.25
+# Log detected and tracked frame counts every this many frames
+NEURAL_TRACKER_LOG_FRAMES = 300
+
+# Port for sending measurements over UDP
+UDP_PORT = 5800
+# The least seconds between logged UDP send errors
+UDP_ERROR_LOG_SECONDS = 5
+
+# Seconds of measurement history used for estimating target velocity
+EXTRAPOLATION_WINDOW = 0.3
+# The longest time in seconds to extrapolate measurements ahead
+EXTRAPOLATION_MAX_LEAD = 0.15
+# Log extrapolation errors every this many measurements
+EXTRAPOLATION_LOG_FRAMES = 300
+
+# Default JPEG quality of the web stream
+WEB_STREAM_QUALITY = 20
+# Width (None for full size) and JPEG quality levels of the automatic web stream, from lowest to highest
+WEB_STREAM_LEVELS = [(160, 15), (240, 20), (320, 30), (None, 50), (None, 80)]
+# Frame rate the automatic web stream tries to keep
+WEB_STREAM_AUTO_FPS = 15
+# Number of fast frames before the automatic web stream moves up a level
+WEB_STREAM_AUTO_UPGRADE_FRAMES = 30
+
+# Number of frames stage durations and FPS are calculated over for the metrics route
+METRICS_WINDOW = 300
+
+# Intermediate images that can be streamed from the web server, only computed while streamed
+WEB_STAGES = ['mask', 'hsv', 'threshold', 'morphology', 'edges']
+
+# Largest morphology kernel size that can be set from the web UI
+WEB_MAX_KERNEL_SIZE = 15
+
+# Number of frames that can wait to be written to a recording before new frames are dropped
+RECORDING_QUEUE_SIZE = 60
+# Number of frames the recording frame rate is measured from
+RECORDING_FPS_FRAMES = 30
+# Size in bytes after which a new recording file is started
+RECORDING_MAX_BYTES = 500 * 1024 * 1024
+# Duration in seconds after which a new recording file is started
+RECORDING_MAX_SECONDS = 300
+
+# Number of frames a raw recording holds, the oldest are overwritten after that
+RAW_RECORDING_SLOTS = 1800
+# Seconds the loop waits for the next frame of a replayed raw recording
+RAW_CAMERA_TIMEOUT = 1
+
+# Seconds of frames the flight recorder dumps
+FLIGHT_RECORDER_SECONDS = 10
+# The most bytes of frames the flight recorder keeps in memory
+FLIGHT_RECORDER_BUDGET = 256 * 1024 * 1024
+# Seconds after a flight recorder dump before another one can be requested
+FLIGHT_RECORDER_COOLDOWN = 5
+# Change in angle (degrees) and distance (meters) between frames that dumps the flight recorder
+FLIGHT_RECORDER_ANGLE_JUMP = 15
+FLIGHT_RECORDER_DISTANCE_JUMP = 1
+
+# The most times per second local display windows are refreshed
+LOCAL_DISPLAY_FPS = 30
+
+# Stages whose durations are logged for every frame
+LOGGER_STAGES = ['mask', 'contours', 'filter', 'measure', 'publish', 'total']
+# Number of frames after which log records are written
+LOGGER_BUFFER_ROWS = 1000
+# The longest time in seconds before log records are written
+LOGGER_FLUSH_SECONDS = 5
+
+# Values up to this many seconds are counted in the first bucket of latency histograms
+HISTOGRAM_LOWEST = 1e-6
+# Values from this many seconds on are counted in the last bucket of latency histograms
+HISTOGRAM_HIGHEST = 10
+# Relative width of a latency histogram bucket
+HISTOGRAM_PRECISION = 0.01
+# Seconds between latency percentile reports to the log and networktables
+METRICS_REPORT_SECONDS = 10
+
+# The most spans kept by the tracer, the oldest are dropped
+TRACE_MAX_EVENTS = 100000
+
+# Frames profiled when neither frames nor seconds are requested
+PROFILER_FRAMES = 300
+# The longest a profile runs, in seconds
+PROFILER_MAX_SECONDS = 60
+# Seconds between samples of the sampling profiler
+PROFILER_SAMPLE_INTERVAL = 0.005
+# Number of functions in profile summaries
+PROFILER_TOP = 20
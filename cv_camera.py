@@ -4,6 +4,7 @@ from threading import Thread
 import cv2
 
 import constants
+from tracing import tracer
 
 
 class CVCamera(Thread):
@@ -20,6 +21,8 @@ class CVCamera(Thread):
         - a flag indicating the run's shut down
     frame
         - the current frame read from self.camera
+    frame_number : int
+        - the number of frames read from self.camera, used for counting frames that were never processed
     """
     def __init__(self, port, exposure=0, contrast=7):
         """
@@ -34,10 +37,11 @@ class CVCamera(Thread):
         self.set_exposure(exposure)
         self.exit = False
         self.frame = None
+        self.frame_number = 0
         logging.info(
             'Contrast: {} Exposure: {} FPS: {}'.format(contrast, exposure, self.camera.get(constants.CAMERA_FPS))
         )
-        super().__init__(daemon=True)  # Initialize thread
+        super().__init__(daemon=True, name='camera')  # Initialize thread
 
     def run(self):
         """
@@ -47,7 +51,10 @@ class CVCamera(Thread):
         while True:
             if self.exit:
                 break
-            self.frame = self.camera.read()[1]
+            # Traced with the time spent waiting for the frame
+            with tracer.span('capture', frame_number=self.frame_number + 1):
+                self.frame = self.camera.read()[1]
+            self.frame_number += 1
 
     def release(self):
         """
@@ -0,0 +1,67 @@
+import argparse
+import itertools
+import time
+
+import numpy as np
+
+import utils
+from raw_recording import RawReader
+
+
+def get_args():
+    """
+    Add command line arguments.
+    :return: Parsed arguments
+    """
+    parser = argparse.ArgumentParser()
+    # Add raw recording argument
+    parser.add_argument('-file', default='recordings/depth.raw', dest='file', type=str,
+                        help='Raw recording with depth, e.g. from main_2019.py -raw-record recordings/depth.raw')
+    # Add bounding box argument
+    parser.add_argument('-box', default=[100, 60, 300, 200], dest='box', nargs=4, type=int,
+                        help='Bounding box to measure: x1 y1 x2 y2')
+    # Add repeats argument
+    parser.add_argument('-repeats', default=20, dest='repeats', help='Repeats per frame', type=int)
+    return parser.parse_args()
+
+
+def pixel_median(depth, x1, y1, x2, y2, scale):
+    """
+    The previous hatch measurement, reading every 5th pixel of the box one by one.
+    :param depth: Depth array, in raw units.
+    :param scale: Meters per depth unit.
+    :return: Median distance.
+    """
+    distances = []
+    for x, y in itertools.product(range(int(x1), int(x2), 5), range(int(y1), int(y2), 5)):
+        distances.append(float(depth[y, x]) * scale)
+    return np.median(distances)
+
+
+def benchmark(function, frames, box, scale, repeats):
+    """
+    :return: Average time per call in milliseconds, and the results for the last repeat of every frame.
+    """
+    results = []
+    start = time.perf_counter()
+    for depth in frames:
+        for _ in range(repeats):
+            result = function(depth, *box, scale=scale)
+        results.append(result)
+    return (time.perf_counter() - start) * 1000 / (len(frames) * repeats), results
+
+
+if __name__ == '__main__':
+    args = get_args()
+    reader = RawReader(args.file)
+    # Copied out of the mapped file, so reading it from disk isn't timed
+    frames = [np.array(depth) for _, _, _, depth in (reader[i] for i in range(len(reader))) if depth is not None]
+    if not frames:
+        raise SystemExit('No depth frames recorded in {}'.format(args.file))
+    old_time, old_results = benchmark(pixel_median, frames, args.box, reader.depth_scale, args.repeats)
+    new_time, new_results = benchmark(utils.region_depth_stats, frames, args.box, reader.depth_scale, args.repeats)
+    print('Frames: {} Box: {}'.format(len(frames), args.box))
+    print('Pixel by pixel: {:.3f} ms'.format(old_time))
+    print('Vectorized:     {:.3f} ms ({:.1f}x)'.format(new_time, old_time / new_time))
+    for old, (median, trimmed_mean) in zip(old_results, new_results):
+        print('Median with zeros: {:.3f} Median: {} Trimmed mean: {}'.format(old, median, trimmed_mean))
@@ -1,8 +1,10 @@
 import logging
-import os
 
 import cv2
 
+from local_display import LocalDisplay
+from recorder import Recorder
+
 
 class Display:
     """
@@ -15,10 +17,12 @@ class Display:
         - fourcc code to pass to the video writer when recording
     is_recording : bool
         - recording flag
-    out
-        - defined as a video writer if recording is requested
+    recorder : Recorder
+        - writes the recorded frames in its own thread, defined if recording is requested
     camera_provider : cv_camera.CVCamera or pi_camera.PICamera or realsense.RealSense
         - the camera provider from which frames are received.
+    local_display : LocalDisplay
+        - shows frames locally in its own thread, created when a frame is first shown
     """
     def __init__(self, provider):
         """
@@ -28,7 +32,8 @@ class Display:
         """
         self.codec = cv2.VideoWriter_fourcc(*'XVID')
         self.is_recording = False
-        self.out = None
+        self.recorder = None
+        self.local_display = None
         self.camera_provider = provider
         self.camera_provider.start()
 
@@ -39,6 +44,12 @@ class Display:
         """
         return self.camera_provider.frame
 
+    def get_frame_number(self) -> int:
+        """
+        :return: Number of the most current frame from the camera provider.
+        """
+        return self.camera_provider.frame_number
+
     def change_exposure(self, new_exposure: int):
         """
         Change the exposure through the camera provider.
@@ -50,11 +61,25 @@ class Display:
         """
         Release the camera, save the recording, and destroy all windows.
         """
-        # TODO: Replace the following two lines with the "stop_recording" function
-        if self.out:
-            self.out.release()
+        self.stop_recording(wait=True)
         self.camera_provider.release()
-        cv2.destroyAllWindows()
+        if self.local_display:
+            self.local_display.stop()
+
+    def get_local_display(self) -> LocalDisplay:
+        """
+        :return: The thread all local windows, trackbars included, are handled by, started on first use.
+        """
+        if self.local_display is None:
+            self.local_display = LocalDisplay()
+            self.local_display.start()
+        return self.local_display
+
+    def quit_requested(self) -> bool:
+        """
+        :return: Whether q or escape was pressed in a local window, False if there are none.
+        """
+        return self.local_display is not None and self.local_display.quit.is_set()
 
     def start_recording(self, title):
         """
@@ -62,32 +87,37 @@ class Display:
         :param title: The title under which the recording file is saved.
         """
         logging.info('Starting recording with title {}'.format(title))
-        if not os.path.isdir('recordings'):
-            os.makedirs('recordings')
+        self.stop_recording()
+        self.recorder = Recorder(title, self.codec)
+        self.recorder.start()
         self.is_recording = True
-        self.out = cv2.VideoWriter('recordings/{}.avi'.format(title), self.codec, 30.0, self.camera_provider.get_resolution())
 
-    def stop_recording(self):
+    def stop_recording(self, wait: bool = False):
         """
-        Stop recording, save the recording into the file, and release the video writer.
+        Stop recording. The recorder saves the queued frames into the file and releases the video writer.
+        :param wait: Whether to wait until the file is saved.
         """
-        if self.out:
-            logging.info('Releasing video recorder')
-            self.out.release()
+        recorder, self.recorder = self.recorder, None
+        self.is_recording = False
+        if recorder:
+            recorder.stop(wait)
 
-    def process_frame(self, frame, title: str, show: bool):
+    def process_frame(self, frame, title: str, show: bool, data: dict = None):
         """
         Show and or record frame.
         :param frame: OpenCV frame.
         :param title: Title of window where frame will be displayed.
         :param show: Show or don't show on local display.
+        :param data: The frame's results, written to the recording's sidecar file.
+        See: Recorder in recorder.py
         """
-        # Show frame
+        # Show frame, drawn by the local display's thread
         if show:
-            cv2.imshow(title, frame)
-        # Record frame
-        if self.is_recording and title == 'image' and self.out:
-            self.out.write(frame)
+            self.get_local_display().show(title, frame)
+        # Record frame, written by the recorder's thread
+        recorder = self.recorder
+        if self.is_recording and title == 'image' and recorder:
+            recorder.write(frame, data)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,110 @@
+import logging
+from collections import deque
+
+import numpy as np
+
+import constants
+
+
+class Extrapolator:
+    """
+    Keeps a short history of a target's measurements, and estimates where the target will be at a later time.
+    The robot keeps moving between capturing a frame and acting on its measurements, so the raw measurements are
+    already old when they are used.
+
+    Every new measurement is also compared to what was extrapolated for its capture time from the previous ones, so
+    running on replayed footage shows whether extrapolating is better than holding the last measurement.
+
+    Attributes
+    ----------
+
+    window : float
+        - seconds of history used for estimating velocity
+    max_lead : float
+        - the longest time in seconds to extrapolate ahead of the last measurement
+    history : deque
+        - capture timestamp, angle and distance of recent measurements
+    errors : deque
+        - extrapolated and held angle and distance errors of recent measurements
+    """
+
+    def __init__(self, window: float = constants.EXTRAPOLATION_WINDOW,
+                 max_lead: float = constants.EXTRAPOLATION_MAX_LEAD):
+        """
+        :param window: Seconds of history used for estimating velocity.
+        :param max_lead: The longest time in seconds to extrapolate ahead of the last measurement.
+        """
+        self.window = window
+        self.max_lead = max_lead
+        self.history = deque()
+        self.errors = deque(maxlen=constants.EXTRAPOLATION_LOG_FRAMES)
+        self.count = 0
+
+    def add(self, timestamp: float, angle, distance):
+        """
+        Add a measurement to the history. The history is cleared when the target is lost.
+        :param timestamp: Capture time of the frame, in seconds.
+        :param angle: Angle to the target, None if not seen.
+        :param distance: Distance to the target, None if not measured.
+        """
+        if angle is None:
+            self.history.clear()
+            return
+        if len(self.history) >= 2:
+            self.validate(timestamp, angle, distance)
+        self.history.append((timestamp, angle, distance))
+        while timestamp - self.history[0][0] > self.window:
+            self.history.popleft()
+
+    def velocity(self) -> (float, float):
+        """
+        Estimate velocity with a linear fit over the history.
+        :return: Angular velocity in degrees per second and radial velocity in meters per second, None if unknown.
+        """
+        timestamps, angles, distances = zip(*self.history)
+        timestamps = np.array(timestamps) - timestamps[-1]
+        angular_velocity = None
+        radial_velocity = None
+        if len(timestamps) >= 2 and timestamps[0] < 0:
+            angular_velocity = np.polyfit(timestamps, angles, 1)[0]
+        measured = [(t, d) for t, d in zip(timestamps, distances) if d is not None]
+        if len(measured) >= 2 and measured[0][0] < measured[-1][0]:
+            radial_velocity = np.polyfit(*zip(*measured), 1)[0]
+        return angular_velocity, radial_velocity
+
+    def extrapolate(self, timestamp: float) -> (float, float):
+        """
+        :param timestamp: Time to extrapolate to, in seconds.
+        :return: Extrapolated angle and distance, the last measurement if velocity is unknown, None if not seen.
+        """
+        if not self.history:
+            return None, None
+        last_timestamp, angle, distance = self.history[-1]
+        lead = min(max(timestamp - last_timestamp, 0), self.max_lead)
+        angular_velocity, radial_velocity = self.velocity()
+        if angular_velocity is not None:
+            angle += angular_velocity * lead
+        if distance is not None and radial_velocity is not None:
+            distance += radial_velocity * lead
+        return angle, distance
+
+    def validate(self, timestamp: float, angle, distance):
+        """
+        Compare a new measurement to the one extrapolated for it and to the last one, and log the mean errors
+        periodically.
+        """
+        extrapolated_angle, extrapolated_distance = self.extrapolate(timestamp)
+        _, last_angle, last_distance = self.history[-1]
+        distance_errors = (None, None)
+        if None not in (distance, extrapolated_distance, last_distance):
+            distance_errors = (abs(extrapolated_distance - distance), abs(last_distance - distance))
+        self.errors.append((abs(extrapolated_angle - angle), abs(last_angle - angle)) + distance_errors)
+        self.count += 1
+        if self.count % constants.EXTRAPOLATION_LOG_FRAMES == 0:
+            errors = np.array(self.errors, dtype=float)
+            logging.info('Extrapolation error: angle {:.3f} (held {:.3f}) distance {:.3f} (held {:.3f})'.format(
+                *np.nanmean(errors, axis=0)))
+
+
+if __name__ == "__main__":
+    help(Extrapolator)
@@ -33,9 +33,30 @@ class FileHSV:
 
     def save_hsv_values(self):
         """
-        Dry method to match the one in Trackbars.
+        Save the current values, including changes made from the web UI, to self.file.
         """
-        pass
+        self.file.save_file(self.hsv_values)
+
+    def set_hsv(self, hsv: dict):
+        """
+        Replace the HSV ranges. The values are swapped in a single assignment, so a frame never sees half of them.
+
+        See: hsv() in web.py
+        :param hsv: HSV values, in the format of get_hsv(). Missing keys are left unchanged.
+        """
+        self.hsv_values = dict(self.hsv_values, **hsv)
+
+    def get_morphology(self) -> dict:
+        """
+        :return: Morphology kernel sizes saved with the HSV values, empty for the target's defaults.
+        """
+        return self.hsv_values.get('morphology', {})
+
+    def set_morphology(self, morphology: dict):
+        """
+        :param morphology: Morphology kernel sizes to save with the HSV values.
+        """
+        self.hsv_values = dict(self.hsv_values, morphology=dict(self.get_morphology(), **morphology))
 
     def reload(self):
         """
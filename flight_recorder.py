@@ -0,0 +1,174 @@
+import json
+import logging
+import os
+import time
+from threading import Thread, Event
+
+import numpy as np
+
+import constants
+from raw_recording import RawWriter
+
+
+class FlightRecorder:
+    """
+    Keeps the last seconds of raw frames and their results in memory, and dumps them to disk when something went wrong,
+    so bad detections can be replayed without recording whole matches to the SD card.
+
+    Frames are copied into slots allocated once at the size of the first frame, as many as fit in the memory budget.
+    A dump is requested by the web UI, by the robot over networktables, or by an anomaly in the measurements, and is
+    written by its own thread as a raw recording with a JSON results file next to it.
+
+    Uses: Replayed with the -replay argument, the results compared with the replay's.
+    See: RawWriter in raw_recording.py, RawCamera in raw_camera.py
+
+    Attributes
+    ----------
+
+    seconds : float
+        - how far back a dump goes
+    budget : int
+        - the most bytes of frames kept in memory
+    color : np.array
+        - the color frames of all slots, allocated at the first frame
+    depth : np.array
+        - the raw depth frames of all slots, if the camera has depth
+    entries : list
+        - frame id, capture timestamp, whether depth was kept and the results of every slot
+    count : int
+        - the number of frames added
+    """
+
+    def __init__(self, seconds: float = constants.FLIGHT_RECORDER_SECONDS,
+                 budget: int = constants.FLIGHT_RECORDER_BUDGET):
+        """
+        :param seconds: How far back a dump goes.
+        :param budget: The most bytes of frames kept in memory.
+        """
+        self.seconds = seconds
+        self.budget = budget
+        self.color = None
+        self.depth = None
+        self.depth_scale = 0
+        self.entries = []
+        self.count = 0
+        self.requested = Event()
+        self.reason = None
+        self.last_dump = 0
+        self.last_measurement = None
+        Thread(target=self.dump_thread, daemon=True).start()
+
+    def allocate(self, frame: np.array, depth: np.array = None):
+        """
+        Allocate as many slots as fit in the memory budget.
+        """
+        frame_bytes = frame.nbytes + (0 if depth is None else depth.nbytes)
+        slots = max(self.budget // frame_bytes, 1)
+        self.color = np.empty((slots,) + frame.shape, frame.dtype)
+        if depth is not None:
+            self.depth = np.empty((slots,) + depth.shape, depth.dtype)
+        self.entries = [None] * slots
+        logging.info('Flight recorder keeping {} frames, {:.0f} MB'.format(slots, slots * frame_bytes / 2 ** 20))
+
+    def add(self, frame_id: int, timestamp: float, frame: np.array, depth: np.array = None, depth_scale: float = 0,
+            results: dict = None):
+        """
+        Keep a frame and its results, in place of the oldest frame.
+        :param frame_id: Id of the frame in the loop.
+        :param timestamp: Capture time of the frame.
+        :param frame: Color frame, before anything was drawn on it.
+        :param depth: Raw depth frame, None if the camera has no depth.
+        :param depth_scale: Meters per depth unit.
+        :param results: Detections and measurements of the frame, JSON-serializable.
+        """
+        if self.color is None:
+            self.depth_scale = depth_scale
+            self.allocate(frame, depth)
+        slot = self.count % len(self.entries)
+        np.copyto(self.color[slot], frame)
+        has_depth = depth is not None and self.depth is not None
+        if has_depth:
+            np.copyto(self.depth[slot], depth)
+        self.entries[slot] = (frame_id, timestamp, has_depth, results or {})
+        self.count += 1
+
+    def check(self, angle, distance):
+        """
+        Request a dump if a measurement jumped too far from the last one, which is usually a bad detection.
+        :param angle: Angle to the target, None if not seen.
+        :param distance: Distance to the target, None if not measured.
+        """
+        last, self.last_measurement = self.last_measurement, (angle, distance)
+        if last is None or angle is None or last[0] is None:
+            return
+        if abs(angle - last[0]) > constants.FLIGHT_RECORDER_ANGLE_JUMP:
+            self.trigger('anomaly')
+        elif distance is not None and last[1] is not None and \
+                abs(distance - last[1]) > constants.FLIGHT_RECORDER_DISTANCE_JUMP:
+            self.trigger('anomaly')
+
+    def trigger(self, reason: str):
+        """
+        Request a dump, unless one was requested recently. Returns right away.
+        :param reason: Why the dump was requested, added to the file name.
+        """
+        now = time.time()
+        if now - self.last_dump < constants.FLIGHT_RECORDER_COOLDOWN:
+            return
+        self.last_dump = now
+        self.reason = reason
+        logging.info('Flight recorder dump requested by {}'.format(reason))
+        self.requested.set()
+
+    def dump_thread(self):
+        """
+        Wait for dump requests, and dump off the vision thread.
+        """
+        while True:
+            self.requested.wait()
+            self.requested.clear()
+            try:
+                self.dump(self.reason)
+            except OSError as e:
+                logging.error('Flight recorder dump failed: {}'.format(e))
+
+    def dump(self, reason: str):
+        """
+        Write the frames of the last seconds to a raw recording, and their results to a JSON file.
+        The vision thread keeps adding frames meanwhile, so frames overwritten before they were written are skipped.
+        :param reason: Why the dump was requested, added to the file name.
+        """
+        count = self.count
+        if not count:
+            return
+        slots = len(self.entries)
+        positions = range(max(count - slots, 0), count)
+        end_timestamp = self.entries[(count - 1) % slots][1]
+        positions = [position for position in positions
+                     if end_timestamp - self.entries[position % slots][1] <= self.seconds]
+        filename = 'recordings/flight-{}-{}'.format(time.strftime('%d-%m-%Y-%H-%M-%S'), reason)
+        frame = self.color[0]
+        writer = RawWriter(filename + '.raw', (frame.shape[1], frame.shape[0]),
+                           None if self.depth is None else (self.depth.shape[2], self.depth.shape[1]),
+                           self.depth_scale, len(positions))
+        results = []
+        for position in positions:
+            slot = position % slots
+            frame_id, timestamp, has_depth, frame_results = self.entries[slot]
+            color = self.color[slot].copy()
+            depth = self.depth[slot].copy() if has_depth else None
+            # Skip the frame if the slot was reused while it was copied, add() copies into the slot of the frame at
+            # count - slots before counting it
+            if self.count - slots >= position:
+                continue
+            writer.write(frame_id, timestamp, color, depth)
+            results.append(dict(frame_results, frame_id=frame_id, timestamp=timestamp))
+        writer.close()
+        with open(filename + '.json', 'w') as f:
+            # Numpy numbers are written as floats
+            json.dump({'reason': reason, 'frames': results}, f, default=float)
+        logging.info('Flight recorder dumped {} frames to {}'.format(len(results), os.path.abspath(filename)))
+
+
+if __name__ == "__main__":
+    help(FlightRecorder)
@@ -0,0 +1,90 @@
+import math
+
+import numpy as np
+
+import constants
+
+
+class Histogram:
+    """
+    A fixed-memory latency histogram in the style of HdrHistogram: buckets grow logarithmically, so every recorded
+    value is kept within a set relative precision from microseconds to seconds, and recording is a single increment.
+
+    Uses: Per stage and end-to-end frame latencies in Metrics.
+    See: Metrics in metrics.py
+
+    Attributes
+    ----------
+
+    counts : np.array
+        - the number of values recorded into every bucket
+    count : int
+        - the number of values recorded
+    max : float
+        - the largest value recorded, kept exactly
+    """
+
+    def __init__(self, lowest: float = constants.HISTOGRAM_LOWEST, highest: float = constants.HISTOGRAM_HIGHEST,
+                 precision: float = constants.HISTOGRAM_PRECISION):
+        """
+        :param lowest: Values up to this are counted in the first bucket.
+        :param highest: Values from this on are counted in the last bucket.
+        :param precision: Relative width of a bucket, e.g. 0.01 for values within 1%.
+        """
+        self.lowest = lowest
+        self.log_ratio = math.log1p(precision)
+        self.counts = np.zeros(int(math.log(highest / lowest) / self.log_ratio) + 2, np.int64)
+        self.count = 0
+        self.max = 0
+
+    def record(self, value: float):
+        """
+        :param value: Value to count, e.g. a duration in seconds.
+        """
+        if value <= self.lowest:
+            index = 0
+        else:
+            index = min(int(math.log(value / self.lowest) / self.log_ratio) + 1, len(self.counts) - 1)
+        self.counts[index] += 1
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def percentiles(self, percentiles: list) -> list:
+        """
+        :param percentiles: Percentiles to get, 0 to 100.
+        :return: The upper bound of the bucket of every percentile, at most the largest value. 0 if empty.
+        """
+        if not self.count:
+            return [0] * len(percentiles)
+        cumulative = np.cumsum(self.counts)
+        indexes = np.searchsorted(cumulative, [max(math.ceil(p / 100 * self.count), 1) for p in percentiles])
+        return [min(self.lowest * math.exp(index * self.log_ratio), self.max) for index in indexes]
+
+    def summary(self) -> dict:
+        """
+        :return: p50, p90, p99, max and count.
+        """
+        p50, p90, p99 = self.percentiles([50, 90, 99])
+        return {'p50': p50, 'p90': p90, 'p99': p99, 'max': self.max, 'count': self.count}
+
+    def add(self, other):
+        """
+        Count the values of another histogram with the same buckets in this one.
+        :param other: Histogram to add.
+        """
+        self.counts += other.counts
+        self.count += other.count
+        self.max = max(self.max, other.max)
+
+    def reset(self):
+        """
+        Forget all recorded values.
+        """
+        self.counts[:] = 0
+        self.count = 0
+        self.max = 0
+
+
+if __name__ == "__main__":
+    help(Histogram)
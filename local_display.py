@@ -0,0 +1,92 @@
+import time
+from threading import Thread, Lock, Event
+
+import cv2
+
+import constants
+
+
+class LocalDisplay(Thread):
+    """
+    Shows frames in local windows from its own thread, so drawing windows and handling keys never runs in the vision
+    loop. Only the latest frame of every window is kept, and windows are refreshed at a capped rate.
+    All OpenCV window calls are made from this thread, since they aren't thread safe. Other windows, such as the HSV
+    trackbars, are handled by tasks run on every refresh.
+
+    Uses: Created by Display when a frame is first shown locally, or for the trackbars.
+    See: process_frame(), quit_requested() in Display in display.py
+
+    Attributes
+    ----------
+
+    fps : float
+        - the most times per second windows are refreshed
+    frames : dict
+        - the latest frame of every window not shown yet, by window title
+    tasks : list
+        - functions called from this thread on every refresh
+    quit : Event
+        - set when q or escape is pressed in a window
+    exit : bool
+        - a flag indicating the run's shut down
+    """
+
+    def __init__(self, fps: float = constants.LOCAL_DISPLAY_FPS):
+        """
+        :param fps: The most times per second windows are refreshed.
+        """
+        super().__init__(daemon=True)
+        self.fps = fps
+        self.frames = {}
+        self.tasks = []
+        self.lock = Lock()
+        self.quit = Event()
+        self.exit = False
+
+    def show(self, title: str, frame):
+        """
+        Replace the frame waiting to be shown in a window. Never blocks.
+        :param title: Title of the window.
+        :param frame: Frame to show. It must not be changed afterwards.
+        """
+        with self.lock:
+            self.frames[title] = frame
+
+    def add_task(self, task):
+        """
+        Call a function from this thread on every refresh, for OpenCV window calls other than showing frames.
+        :param task: Function without arguments.
+        """
+        with self.lock:
+            self.tasks.append(task)
+
+    def run(self):
+        """
+        Implementation of "abstract" Thread run method, shows the latest frames and handles keys until exit.
+        """
+        interval = 1 / self.fps
+        while not self.exit:
+            start = time.time()
+            with self.lock:
+                frames, self.frames = self.frames, {}
+                tasks = list(self.tasks)
+            for task in tasks:
+                task()
+            for title, frame in frames.items():
+                cv2.imshow(title, frame)
+            # Handles window events while waiting for the next refresh
+            k = cv2.waitKey(max(int((start + interval - time.time()) * 1000), 1)) & 0xFF
+            if k in (27, 113):
+                self.quit.set()
+        cv2.destroyAllWindows()
+
+    def stop(self):
+        """
+        Close the windows and stop the thread.
+        """
+        self.exit = True
+        self.join()
+
+
+if __name__ == "__main__":
+    help(LocalDisplay)
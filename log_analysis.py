@@ -0,0 +1,405 @@
+import argparse
+import glob
+import html
+import math
+import os
+
+from histogram import Histogram
+from logger import Logger
+
+# Header of logs written before column logging, times of day are in seconds
+LEGACY_HEADER = 'Time;Latency;Sees potential targets?;Sees target?'
+# Summary rows of the terminal and HTML tables, by summary key
+SUMMARY_ROWS = [('duration', 'Duration (s)'), ('frames', 'Frames'), ('fps', 'FPS'),
+                ('detection', 'Detection rate (%)'), ('potential', 'Potential target rate (%)'),
+                ('p50', 'Latency p50 (ms)'), ('p90', 'Latency p90 (ms)'), ('p99', 'Latency p99 (ms)'),
+                ('max', 'Latency max (ms)'), ('gaps', 'Camera stalls'), ('longest_gap', 'Longest stall (s)')]
+# Headers of the stage, timeline and camera stall tables
+STAGE_HEADERS = ['Stage', 'p50 (ms)', 'p90 (ms)', 'p99 (ms)', 'max (ms)']
+TIMELINE_HEADERS = ['Start (s)', 'Frames', 'FPS', 'p50 (ms)', 'p99 (ms)', 'max (ms)', 'Detection (%)']
+GAP_HEADERS = ['At (s)', 'Stall (s)']
+# Colors of the runs in the HTML plots
+COLORS = ['#1f77b4', '#d62728', '#2ca02c', '#ff7f0e', '#9467bd', '#8c564b']
+
+
+def get_args():
+    """
+    Add command line arguments.
+    :return: Parsed arguments
+    """
+    parser = argparse.ArgumentParser(description='Analyse the logs of vision runs, and compare runs side by side')
+    # Add logs argument
+    parser.add_argument('logs', default=['logs/*.csv'], nargs='*', type=str,
+                        help='Log files or patterns, logs/*.csv or logs/*.cols, every file is a run')
+    # Add interval argument
+    parser.add_argument('-interval', default=10, dest='interval', help='Seconds per timeline row', type=float)
+    # Add gap argument
+    parser.add_argument('-gap', default=0.5, dest='gap', help='Seconds between frames counted as a camera stall',
+                        type=float)
+    # Add timeline argument
+    parser.add_argument('-no-timeline', action='store_false', default=True, dest='timeline',
+                        help='Don\'t print the timelines of the runs')
+    # Add HTML argument
+    parser.add_argument('-html', default=None, dest='html', help='Write an HTML report to this file', type=str)
+    return parser.parse_args()
+
+
+def read_csv(filename: str):
+    """
+    Read a CSV log row by row.
+    :param filename: Log written by Logger in logger.py, logs/*.csv.
+    :return: A generator of the rows by column name, and the resolution of the times in seconds.
+    """
+    with open(filename, 'r') as f:
+        # The first line is the run's arguments
+        f.readline()
+        header = f.readline().strip()
+        if header == LEGACY_HEADER:
+            yield 1
+            day = 0
+            last = None
+            for line in f:
+                values = line.strip().split(';')
+                if len(values) < 4:
+                    continue
+                hours, minutes, seconds = (int(value) for value in values[0].split('-'))
+                time = day + hours * 3600 + minutes * 60 + seconds
+                # Runs past midnight
+                if last is not None and time < last:
+                    day += 24 * 3600
+                    time += 24 * 3600
+                last = time
+                yield {'time': time, 'latency': float(values[1]), 'potential_target': values[2] == 'True',
+                       'target': values[3] == 'True'}
+        else:
+            yield 0
+            columns = header.split(';')
+            for line in f:
+                values = line.strip().split(';')
+                if len(values) == len(columns):
+                    yield dict(zip(columns, (float(value) for value in values)))
+
+
+def read_columns(filename: str):
+    """
+    Read a column log row by row.
+    :param filename: Log written by Logger in logger.py, logs/*.cols.
+    :return: A generator of the rows by column name, and the resolution of the times in seconds.
+    """
+    yield 0
+    for chunk in Logger.iterate(filename):
+        columns = list(chunk)
+        for values in zip(*(chunk[column].tolist() for column in columns)):
+            yield dict(zip(columns, values))
+
+
+def read(filename: str):
+    """
+    :return: A generator of the rows of a CSV or column log, and the resolution of the times in seconds.
+    """
+    rows = read_columns(filename) if filename.endswith('.cols') else read_csv(filename)
+    return next(rows), rows
+
+
+def valid(value) -> bool:
+    """
+    :return: Whether a logged value was measured.
+    """
+    return value is not None and not math.isnan(value)
+
+
+class Run:
+    """
+    Statistics of a run, collected row by row so logs of any length are analysed in constant memory.
+
+    Attributes
+    ----------
+
+    name : str
+        - the log's file name
+    interval : float
+        - seconds per timeline row
+    gap : float
+        - seconds between frames counted as a camera stall
+    timeline : list
+        - start, frames, FPS, latency percentiles and detection rates of every interval
+    gaps : list
+        - seconds since the start and length of every camera stall
+    stages : dict
+        - the durations of every pipeline stage over the whole run
+    """
+
+    def __init__(self, name: str, interval: float, gap: float):
+        """
+        :param name: The log's file name.
+        :param interval: Seconds per timeline row.
+        :param gap: Seconds between frames counted as a camera stall.
+        """
+        self.name = name
+        self.interval = interval
+        self.gap = gap
+        self.timeline = []
+        self.gaps = []
+        self.stages = {}
+        self.latency = Histogram()
+        self.bucket_latency = Histogram()
+        self.start = None
+        self.last = None
+        self.frames = 0
+        self.targets = 0
+        self.potential_targets = 0
+        self.bucket = None
+        self.bucket_frames = 0
+        self.bucket_targets = 0
+        self.bucket_potential_targets = 0
+
+    def add(self, row: dict):
+        """
+        Count a logged frame.
+        :param row: Logged values by column name.
+        """
+        time = row['time']
+        if self.start is None:
+            self.start = time
+            self.bucket = 0
+        elif time - self.last > self.gap:
+            self.gaps.append((self.last - self.start, time - self.last))
+        self.last = time
+        bucket = int((time - self.start) // self.interval)
+        if bucket != self.bucket:
+            self.end_bucket()
+            self.bucket = bucket
+        # Capture to the end of the frame if measured, else capture to the end of the measurements
+        latency = row.get('total_seconds')
+        if not valid(latency):
+            latency = row.get('latency')
+        if valid(latency):
+            self.latency.record(latency)
+            self.bucket_latency.record(latency)
+        for column, value in row.items():
+            if column.endswith('_seconds') and valid(value):
+                self.stages.setdefault(column[:-len('_seconds')], Histogram()).record(value)
+        self.frames += 1
+        self.bucket_frames += 1
+        target = bool(row.get('target'))
+        potential_target = bool(row.get('potential_target'))
+        self.targets += target
+        self.bucket_targets += target
+        self.potential_targets += potential_target
+        self.bucket_potential_targets += potential_target
+
+    def end_bucket(self):
+        """
+        Add the current interval to the timeline, and start counting the next one.
+        """
+        if not self.bucket_frames:
+            return
+        start = self.bucket * self.interval
+        # The last interval may be shorter
+        duration = min(self.interval, self.last - self.start - start) or self.interval
+        summary = self.bucket_latency.summary()
+        self.timeline.append({'start': start, 'frames': self.bucket_frames, 'fps': self.bucket_frames / duration,
+                              'p50': summary['p50'], 'p99': summary['p99'], 'max': summary['max'],
+                              'detection': self.bucket_targets / self.bucket_frames,
+                              'potential': self.bucket_potential_targets / self.bucket_frames})
+        self.bucket_latency.reset()
+        self.bucket_frames = 0
+        self.bucket_targets = 0
+        self.bucket_potential_targets = 0
+
+    def summary(self) -> dict:
+        """
+        :return: The statistics of the whole run, rates in percent and latencies in milliseconds.
+        """
+        duration = (self.last - self.start) if self.frames else 0
+        frames = max(self.frames, 1)
+        latency = self.latency.summary()
+        return {'duration': duration, 'frames': self.frames, 'fps': self.frames / duration if duration else 0,
+                'detection': 100 * self.targets / frames, 'potential': 100 * self.potential_targets / frames,
+                'p50': 1000 * latency['p50'], 'p90': 1000 * latency['p90'], 'p99': 1000 * latency['p99'],
+                'max': 1000 * latency['max'], 'gaps': len(self.gaps),
+                'longest_gap': max((length for _, length in self.gaps), default=0)}
+
+
+def analyse(filename: str, interval: float, gap: float) -> Run:
+    """
+    :param filename: CSV or column log.
+    :param interval: Seconds per timeline row.
+    :param gap: Seconds between frames counted as a camera stall.
+    :return: The statistics of the run.
+    """
+    resolution, rows = read(filename)
+    # Frames a second apart are normal in logs with times in whole seconds
+    run = Run(os.path.basename(filename), max(interval, resolution), max(gap, resolution))
+    for row in rows:
+        if valid(row.get('time')):
+            run.add(row)
+    run.end_bucket()
+    return run
+
+
+def number(value) -> str:
+    """
+    :return: A number formatted for tables.
+    """
+    if isinstance(value, int):
+        return str(value)
+    return '{:.1f}'.format(value) if abs(value) >= 10 else '{:.2f}'.format(value)
+
+
+def table(headers: list, rows: list) -> str:
+    """
+    :param headers: Titles of the columns.
+    :param rows: Values of the rows, numbers are formatted.
+    :return: The rows as a text table aligned by column.
+    """
+    cells = [headers] + [[value if isinstance(value, str) else number(value) for value in row] for row in rows]
+    widths = [max(len(row[i]) for row in cells) for i in range(len(headers))]
+    lines = ['  '.join(cell.rjust(width) if i else cell.ljust(width) for i, (cell, width) in
+                       enumerate(zip(row, widths))) for row in cells]
+    lines.insert(1, '  '.join('-' * width for width in widths))
+    return '\n'.join(lines)
+
+
+def summary_rows(runs: list) -> list:
+    """
+    :return: The rows of the summary table, with the change from the first run if two runs are compared.
+    """
+    summaries = [run.summary() for run in runs]
+    rows = []
+    for key, title in SUMMARY_ROWS:
+        row = [title] + [summary[key] for summary in summaries]
+        if len(runs) == 2:
+            row.append(summaries[1][key] - summaries[0][key])
+        rows.append(row)
+    return rows
+
+
+def summary_headers(runs: list) -> list:
+    """
+    :return: The headers of the summary table.
+    """
+    return [''] + [run.name for run in runs] + (['Change'] if len(runs) == 2 else [])
+
+
+def stage_rows(run: Run) -> list:
+    """
+    :return: The rows of the stage latency table of a run, in milliseconds.
+    """
+    rows = []
+    for stage, histogram in run.stages.items():
+        summary = histogram.summary()
+        rows.append([stage] + [1000 * summary[key] for key in ('p50', 'p90', 'p99', 'max')])
+    return rows
+
+
+def timeline_rows(run: Run) -> list:
+    """
+    :return: The rows of the timeline table of a run.
+    """
+    return [[number(row['start']), row['frames'], row['fps'], 1000 * row['p50'], 1000 * row['p99'],
+             1000 * row['max'], 100 * row['detection']] for row in run.timeline]
+
+
+def print_report(runs: list, timeline: bool):
+    """
+    Print the tables of the runs.
+    :param runs: Analysed runs.
+    :param timeline: Whether to print the timeline of every run.
+    """
+    print(table(summary_headers(runs), summary_rows(runs)))
+    for run in runs:
+        print('\n{}'.format(run.name))
+        if run.stages:
+            print(table(STAGE_HEADERS, stage_rows(run)))
+        if timeline and run.timeline:
+            print()
+            print(table(TIMELINE_HEADERS, timeline_rows(run)))
+        if run.gaps:
+            print()
+            print(table(GAP_HEADERS, [[at, length] for at, length in
+                                      sorted(run.gaps, key=lambda gap: gap[1], reverse=True)[:10]]))
+
+
+def html_table(headers: list, rows: list) -> str:
+    """
+    :return: The rows as an HTML table.
+    """
+    cells = [''.join('<th>{}</th>'.format(html.escape(header)) for header in headers)]
+    for row in rows:
+        cells.append(''.join('<td>{}</td>'.format(html.escape(value if isinstance(value, str) else number(value)))
+                             for value in row))
+    return '<table>{}</table>'.format(''.join('<tr>{}</tr>'.format(row) for row in cells))
+
+
+def svg_plot(title: str, runs: list, key: str, scale: float = 1, width: int = 800, height: int = 220) -> str:
+    """
+    Plot a timeline value of every run as lines, over seconds since the start of the run.
+    :param title: Title of the plot.
+    :param runs: Analysed runs.
+    :param key: Timeline value to plot.
+    :param scale: Factor of the plotted values, e.g. 1000 for milliseconds.
+    :param width: Width of the plot in pixels.
+    :param height: Height of the plot in pixels.
+    :return: The plot as an inline SVG.
+    """
+    margin = 40
+    series = [[(row['start'], row[key] * scale) for row in run.timeline] for run in runs]
+    points = [point for line in series for point in line]
+    if not points:
+        return ''
+    x_max = max(x for x, _ in points) or 1
+    y_max = max(y for _, y in points) or 1
+    elements = ['<text x="{}" y="15">{}</text>'.format(margin, html.escape(title)),
+                '<line x1="{0}" y1="{1}" x2="{2}" y2="{1}" stroke="#888"/>'.format(margin, height - margin,
+                                                                                   width - 10),
+                '<line x1="{0}" y1="25" x2="{0}" y2="{1}" stroke="#888"/>'.format(margin, height - margin),
+                '<text x="2" y="30">{}</text>'.format(number(y_max)),
+                '<text x="2" y="{}">0</text>'.format(height - margin),
+                '<text x="{}" y="{}" text-anchor="end">{} s</text>'.format(width - 10, height - margin + 15,
+                                                                           number(x_max))]
+    for i, line in enumerate(series):
+        coordinates = ' '.join('{:.1f},{:.1f}'.format(margin + x / x_max * (width - margin - 10),
+                                                      height - margin - y / y_max * (height - margin - 25))
+                               for x, y in line)
+        elements.append('<polyline fill="none" stroke="{}" stroke-width="1.5" points="{}"/>'.format(
+            COLORS[i % len(COLORS)], coordinates))
+    return '<svg width="{}" height="{}" font-size="12">{}</svg>'.format(width, height, ''.join(elements))
+
+
+def write_html(filename: str, runs: list):
+    """
+    Write a self-contained HTML report of the runs, with the runs' timelines plotted together.
+    :param filename: Report file.
+    :param runs: Analysed runs.
+    """
+    legend = ' '.join('<span style="color: {}">&#9632; {}</span>'.format(COLORS[i % len(COLORS)],
+                                                                         html.escape(run.name))
+                      for i, run in enumerate(runs))
+    sections = ['<h1>Vision runs</h1>', html_table(summary_headers(runs), summary_rows(runs)),
+                '<h2>Timelines</h2>', '<p>{}</p>'.format(legend),
+                svg_plot('FPS', runs, 'fps'), svg_plot('Latency p50 (ms)', runs, 'p50', 1000),
+                svg_plot('Latency p99 (ms)', runs, 'p99', 1000),
+                svg_plot('Detection rate (%)', runs, 'detection', 100)]
+    for run in runs:
+        sections.append('<h2>{}</h2>'.format(html.escape(run.name)))
+        if run.stages:
+            sections.append(html_table(STAGE_HEADERS, stage_rows(run)))
+        if run.gaps:
+            sections.append('<h3>Camera stalls</h3>')
+            sections.append(html_table(GAP_HEADERS, [[at, length] for at, length in run.gaps]))
+    with open(filename, 'w') as f:
+        f.write('<!DOCTYPE html><html><head><meta charset="utf-8"><title>Vision runs</title><style>'
+                'body {font-family: sans-serif} table {border-collapse: collapse; margin: 10px 0} '
+                'td, th {border: 1px solid #ccc; padding: 2px 8px; text-align: right} svg {display: block}'
+                '</style></head><body>' + '\n'.join(sections) + '</body></html>')
+
+
+if __name__ == '__main__':
+    args = get_args()
+    filenames = [filename for pattern in args.logs for filename in sorted(glob.glob(pattern)) or [pattern]]
+    runs = [analyse(filename, args.interval, args.gap) for filename in filenames]
+    print_report(runs, args.timeline)
+    if args.html:
+        write_html(args.html, runs)
+        print('\nReport written to {}'.format(os.path.abspath(args.html)))
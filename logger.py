@@ -1,40 +1,195 @@
+import atexit
+import io
+import os
+import struct
 import time
+from threading import Thread, Condition, Lock
+
+import numpy as np
+
+import constants
 from file import File
 
+# Columns of every frame's record, stage durations are taken from the main's metrics
+COLUMNS = [('time', '<f8'), ('frame_id', '<i8'), ('latency', '<f4'), ('potential_target', '?'), ('target', '?'),
+           ('contours', '<i4'), ('filtered_contours', '<i4'), ('angle', '<f4'), ('distance', '<f4'),
+           ('field_angle', '<f4')] + [('{}_seconds'.format(stage), '<f4') for stage in constants.LOGGER_STAGES]
+# CSV format of every column
+CSV_FORMAT = ['%.3f', '%d', '%.4f', '%d', '%d', '%d', '%d', '%.3f', '%.3f', '%.3f'] + ['%.5f'] * len(constants.LOGGER_STAGES)
+
 
 class Logger:
-    def __init__(self, main):
+    """
+    Logs a record of every frame for analysing runs.
+
+    Records are kept in memory in preallocated columns, and written by a background thread when the buffer fills up,
+    every few seconds and at shutdown, so the loop never touches the file system.
+    Logs are written as compressed column chunks, loaded with load(), and optionally exported as semicolon-separated
+    CSV with the run's arguments on its first line.
+
+    Attributes
+    ----------
+
+    main : main.Main
+        - the main whose frames are logged, its arguments are written to the log
+    file : File
+        - the CSV file, None if CSV export is off
+    columns_file : File
+        - the file of compressed column chunks
+    buffer : np.array
+        - the records of the frames since the last flush, one field per column
+    row : int
+        - the number of records in buffer
+    pending : list
+        - full buffers waiting to be written
+    """
+
+    def __init__(self, main, csv: bool = True, buffer_rows: int = constants.LOGGER_BUFFER_ROWS,
+                 flush_seconds: float = constants.LOGGER_FLUSH_SECONDS):
+        """
+        :param main: The main whose frames are logged.
+        :param csv: Whether to also write the log as CSV.
+        :param buffer_rows: Number of records after which the buffer is written.
+        :param flush_seconds: The longest time in seconds before records are written.
+        """
         self.main = main
+        self.flush_seconds = flush_seconds
         name = time.strftime('%d-%m-%Y %H-%M-%S')
-        data = []
-        data.append(str(self.main.results) + '\n')
-        data.append('Time;Latency;Sees potential targets?;Sees target?\n')
         folder = 'logs'
-        extension = 'csv'
-        self.file = File(name, None, folder, extension)
-        with open(self.file.get_filename(), 'a') as log:
-            log.writelines(data)
-
-    def record_latency(self):
-        data = []
-        current_time = '{}'.format(time.strftime('%H-%M-%S'))
-        data.append(current_time)
-        data.append(';')
-        latency = '{:.3f}'.format(time.time() - self.main.timer)
-        data.append(latency)
-        data.append(';')
-
-        with open(self.file.get_filename(), 'a') as log:
-            log.writelines(data)
-
-    def record_contours(self):
-        data = []
-        potential_target = '{}'.format(self.main.is_potential_target)
-        data.append(potential_target)
-        data.append(';')
-        target = '{}'.format(self.main.is_target)
-        data.append(target)
-        data.append('\n')
-
-        with open(self.file.get_filename(), 'a') as log:
-            log.writelines(data)
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        self.file = File(name, None, folder, 'csv') if csv else None
+        self.columns_file = File(name, None, folder, 'cols')
+        self.dtype = np.dtype(COLUMNS)
+        # Template for new buffers, missing measurements are NaN
+        self.empty = np.zeros(buffer_rows, self.dtype)
+        for column, dtype in COLUMNS:
+            if np.dtype(dtype).kind == 'f':
+                self.empty[column] = np.nan
+        self.buffer = self.empty.copy()
+        self.row = 0
+        self.pending = []
+        self.flush_requested = False
+        self.condition = Condition()
+        self.write_lock = Lock()
+        self.closed = False
+
+        if self.file:
+            with open(self.file.get_filename(), 'a') as log:
+                log.writelines([str(self.main.results) + '\n', ';'.join(self.dtype.names) + '\n'])
+        self.write_chunk({'args': np.array([str(self.main.results)])})
+        Thread(target=self.flush_thread, daemon=True).start()
+        atexit.register(self.close)
+
+    def record(self, **values):
+        """
+        Record a frame. Columns missing from values are left empty, and values that aren't columns are ignored.
+        :param values: Values by column name, None for missing measurements.
+        """
+        for column, value in values.items():
+            if value is not None and column in self.dtype.fields:
+                self.buffer[column][self.row] = value
+        self.row += 1
+        if self.row == len(self.buffer) or self.flush_requested:
+            self.swap()
+
+    def swap(self):
+        """
+        Hand the recorded rows to the flush thread, and start a new buffer.
+        """
+        with self.condition:
+            self.pending.append(self.buffer[:self.row])
+            self.flush_requested = False
+            self.condition.notify()
+        self.buffer = self.empty.copy()
+        self.row = 0
+
+    def flush_thread(self):
+        """
+        Request the loop's records every flush_seconds, and write them.
+        """
+        while True:
+            with self.condition:
+                if not self.condition.wait_for(lambda: self.pending, self.flush_seconds):
+                    # Swapped by the loop at its next record
+                    self.flush_requested = True
+                    self.condition.wait_for(lambda: self.pending)
+            # Taken and written under write_lock, so close() can't write later records first
+            with self.write_lock:
+                with self.condition:
+                    pending, self.pending = self.pending, []
+                self.write(pending)
+
+    def write(self, chunks: list):
+        """
+        Write records to the column file, and to the CSV file if requested. Called with write_lock held.
+        :param chunks: Arrays of records.
+        """
+        rows = np.concatenate(chunks) if chunks else np.zeros(0, self.dtype)
+        if not len(rows):
+            return
+        self.write_chunk({column: rows[column] for column in self.dtype.names})
+        if self.file:
+            with open(self.file.get_filename(), 'a') as log:
+                np.savetxt(log, rows, delimiter=';', fmt=CSV_FORMAT)
+
+    def write_chunk(self, arrays: dict):
+        """
+        Append a compressed chunk of arrays to the column file, prefixed by its length.
+        """
+        data = io.BytesIO()
+        np.savez_compressed(data, **arrays)
+        with open(self.columns_file.get_filename(), 'ab') as f:
+            f.write(struct.pack('<I', data.getbuffer().nbytes))
+            f.write(data.getbuffer())
+
+    def close(self):
+        """
+        Write the remaining records. Called at shutdown.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        with self.write_lock:
+            with self.condition:
+                pending, self.pending = self.pending + [self.buffer[:self.row]], []
+            self.write(pending)
+
+    @staticmethod
+    def iterate(filename: str):
+        """
+        Read a column file chunk by chunk, without loading all of it.
+        :param filename: File written by a Logger, logs/*.cols.
+        :return: A generator of the chunks of records, as arrays by column name.
+        """
+        with open(filename, 'rb') as f:
+            while True:
+                header = f.read(4)
+                if len(header) < 4:
+                    break
+                with np.load(io.BytesIO(f.read(struct.unpack('<I', header)[0]))) as chunk:
+                    if 'args' not in chunk:
+                        yield {column: chunk[column] for column in chunk.files}
+
+    @staticmethod
+    def load(filename: str) -> np.array:
+        """
+        Load a column file.
+        :param filename: File written by a Logger, logs/*.cols.
+        :return: All records, one field per column.
+        """
+        chunks = list(Logger.iterate(filename))
+        dtype = np.dtype(COLUMNS)
+        records = np.zeros(sum(len(chunk['time']) for chunk in chunks), dtype)
+        start = 0
+        for chunk in chunks:
+            end = start + len(chunk['time'])
+            for column, values in chunk.items():
+                if column in dtype.fields:
+                    records[column][start:end] = values
+            start = end
+        return records
+
+
+if __name__ == "__main__":
+    help(Logger)
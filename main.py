@@ -6,16 +6,26 @@ from importlib import import_module
 
 import cv2
 
+import constants
 import nt_handler
+import udp_handler
 import utils
 from cv_camera import CVCamera
 from display import Display
+from extrapolation import Extrapolator
 from file_hsv import FileHSV
+from flight_recorder import FlightRecorder
 from pi_camera import PICamera
+from raw_camera import RawCamera
+from raw_recording import RawWriter
 from realsense import RealSense
 from trackbars import Trackbars
 from web import Web
 from logger import Logger
+from metrics import Metrics
+from overlay import Overlay
+from profiler import Profiler
+from tracing import tracer
 
 logging.basicConfig(format='[%(levelname)s] %(message)s', level=logging.INFO, handlers=[
     logging.FileHandler('vision.log', mode='w'),
@@ -42,6 +52,14 @@ def get_args():
     -help_main/-hm : bool
         whether the help() for main will be shown upon launch
         :default False
+    -async-web : bool
+        whether the web server runs on asyncio instead of Flask's threaded server
+        :name async_web
+        :default False
+    -overlay : bool
+        whether annotations will be sent to the web UI as vector shapes instead of being drawn on the frame
+        :name overlay
+        :default False
     -local : bool
         whether the display frame will be shown on current screen
         :name local
@@ -64,6 +82,39 @@ def get_args():
         :name robot
         :options 'genesis', 'driving_robot'
         :default 'genesis'
+    -nt-keys : bool
+        whether the measurements will be sent as separate networktables keys, as in older robot code, instead of a
+        single packet per frame
+        :name nt_keys
+        :default False
+    -nt-server : str
+        the address of the networktables server
+        :name nt_server
+        :default None, derived from the team number
+    -udp : str
+        the host to send the measurements to over UDP, in addition to networktables
+        :name udp
+        :default None
+    -udp-port : int
+        the port to send the measurements to over UDP
+        :name udp_port
+        :default constants.UDP_PORT
+    -replay : str
+        a raw recording to replay instead of using the camera
+        :name replay
+        :default None
+    -raw-record : str
+        the file to losslessly record raw frames to, in addition to recording from the web UI
+        :name raw_record
+        :default None
+    -no-csv-log : bool
+        whether the frame log is also exported as CSV, in addition to the compressed column log
+        :name csv_log
+        :default True
+    -flight-recorder : bool
+        whether the last seconds of frames are kept in memory, to be dumped to disk on request or on anomalies
+        :name flight_recorder
+        :default False
     :return: Parsed arguments, each variable stored as a variable with its key as its name.
     """
     parser = argparse.ArgumentParser()
@@ -79,6 +130,14 @@ def get_args():
     parser.add_argument('-help-main', '-hm', action='store_true', default=False,
                         dest='help_main',
                         help='Display the main\'s documentation')
+    # Add async web server argument
+    parser.add_argument('-async-web', action='store_true', default=False,
+                        dest='async_web',
+                        help='Use the asyncio web server instead of Flask')
+    # Add overlay argument
+    parser.add_argument('-overlay', action='store_true', default=False,
+                        dest='overlay',
+                        help='Send annotations to the web UI as vector shapes instead of drawing them on the frame')
     # Add local ui argument
     parser.add_argument('-local', action='store_true', default=False,
                         dest='local',
@@ -91,6 +150,35 @@ def get_args():
     parser.add_argument('-target', default='example_target', dest='target', help='Target file', type=str)
     # Add robot argument
     parser.add_argument('-robot', default='genesis', help='robot', type=str, choices=['genesis', 'driving_robot'])
+    # Add networktables keys argument
+    parser.add_argument('-nt-keys', action='store_true', default=False,
+                        dest='nt_keys',
+                        help='Send measurements as separate networktables keys instead of packets')
+    # Add networktables server argument
+    parser.add_argument('-nt-server', default=None, dest='nt_server',
+                        help='Networktables server address, derived from the team number by default', type=str)
+    # Add UDP host argument
+    parser.add_argument('-udp', default=None, dest='udp', type=str,
+                        help='Also send measurements over UDP to this host, e.g. the robot')
+    # Add UDP port argument
+    parser.add_argument('-udp-port', default=constants.UDP_PORT, dest='udp_port', help='UDP port', type=int)
+    # Add replay argument
+    parser.add_argument('-replay', default=None, dest='replay', type=str,
+                        help='Replay a raw recording instead of using the camera')
+    # Add raw recording argument
+    parser.add_argument('-raw-record', default=None, dest='raw_record', type=str,
+                        help='Record raw frames losslessly to this file')
+    # Add CSV log argument
+    parser.add_argument('-no-csv-log', action='store_false', default=True,
+                        dest='csv_log',
+                        help='Only write the compressed column log, without the CSV export')
+    # Add flight recorder argument
+    parser.add_argument('-flight-recorder', action='store_true', default=False,
+                        dest='flight_recorder',
+                        help='Keep the last seconds of frames in memory, dumped from the web UI, the robot or anomalies')
+    # Add trace argument
+    parser.add_argument('-trace', action='store_true', default=False, dest='trace',
+                        help='Trace the pipeline from the start, written to the logs folder at shutdown')
     return parser.parse_args()
 
 
@@ -119,6 +207,11 @@ class Main:
         - streaming handler, if streaming is requested in self.results
     nt : nt_handler.NT
         - networktables handler, if networktbales are requested in self.results
+    metrics : Metrics
+        - per stage timings and counters of the loop, served by self.web
+    target : TargetBase
+        - the target being recognised by the loop, tuned from the web UI
+        See: hsv() in web.py
     stop : bool
         - a variable checked at the end of each loop, notifies if a shut down is requested
         See: loop()
@@ -137,7 +230,10 @@ class Main:
             return
 
         # Set the camera provider
-        if self.results.camera == 'pi':
+        if self.results.replay:
+            logging.info('Replaying raw recording {}'.format(self.results.replay))
+            camera_provider = RawCamera(self.results.replay)
+        elif self.results.camera == 'pi':
             camera_provider = PICamera()
             logging.info('Using PI Camera provider')
         elif self.results.camera == 'realsense':
@@ -152,21 +248,45 @@ class Main:
         # Create the display
         self.display = Display(provider=camera_provider)
         if self.results.local:
-            self.hsv_handler = Trackbars(self.name)
+            self.hsv_handler = Trackbars(self.name, self.display.get_local_display())
         else:
             self.hsv_handler = FileHSV(self.name)
 
+        # Performance metrics, served by the web server
+        self.metrics = Metrics()
+        # Profiles the loop when requested by the web server or the robot
+        self.profiler = Profiler()
+
         # Create the web server
         if self.results.web:
-            self.web = Web(self)
+            if self.results.async_web:
+                from async_web import AsyncWeb
+                self.web = AsyncWeb(self)
+            else:
+                self.web = Web(self)
             self.web.start_thread()
 
         # Create the networktables server
         if self.results.networktables:
-            self.nt = nt_handler.NT(self.name)
+            self.nt = nt_handler.NT(self.name, self.results.nt_server)
+            # Seconds ahead of now the robot wants extrapolated measurements for
+            self.nt.subscribe('extrapolation_lead', 0)
+            # Set by the robot to dump the flight recorder
+            self.nt.subscribe('dump', False)
+            # Set by the robot to a number of frames to profile
+            self.nt.subscribe('profile', 0)
+
+        # Create the UDP sender
+        if self.results.udp:
+            self.udp = udp_handler.UDP(self.results.udp, self.results.udp_port)
 
-        self.logger = Logger(self)
+        self.logger = Logger(self, self.results.csv_log)
 
+        self.raw_writer = None
+        self.flight_recorder = FlightRecorder() if self.results.flight_recorder else None
+        if self.results.trace:
+            tracer.start()
+        self.target = None
         self.stop = False
 
     def change_name(self, name):
@@ -189,6 +309,25 @@ class Main:
         # Stop the current loop
         self.stop = True
 
+    def get_raw_depth(self):
+        """
+        :return: The camera's raw depth frame, None if it has no depth.
+        """
+        provider = self.display.camera_provider
+        return provider.get_raw_depth() if hasattr(provider, 'get_raw_depth') else None
+
+    def record_raw(self, frame_id: int, timestamp: float, frame, depth):
+        """
+        Write the camera's frame, and its depth if it has any, to the raw recording. The recording is created at the
+        size of the first frame.
+        See: RawWriter in raw_recording.py
+        """
+        if self.raw_writer is None:
+            self.raw_writer = RawWriter(self.results.raw_record, (frame.shape[1], frame.shape[0]),
+                                        None if depth is None else (depth.shape[1], depth.shape[0]),
+                                        getattr(self.display.camera_provider, 'depth_scale', 0))
+        self.raw_writer.write(frame_id, timestamp, frame, depth)
+
     def loop(self):
         """
         Recognises the target repeatedly. Utilises all handlers initialised in __init__.
@@ -203,15 +342,25 @@ class Main:
         self.stop = False
         # Load the target class from the 'targets' directory
         target = import_module('targets.{}'.format(self.name)).Target(self)
+        # Use the morphology saved with the HSV values, and let the web UI tune the target
+        target.set_morphology(self.hsv_handler.get_morphology())
+        self.target = target
         time.sleep(1)
         # Change camera exposure based on the target
         self.display.change_exposure(target.exposure)
         # Timer for FPS counter
         self.timer = time.time()
-        avg = 0
+        frame_id = 0
+        frame_number = self.display.get_frame_number()
+        extrapolator = Extrapolator()
+        published_profile = self.profiler.result
+        last_dump_input = False
         while True:
+            tracer.begin_frame(frame_id + 1)
             # Get initial frame
-            frame = self.display.get_frame()
+            with tracer.span('get_frame'):
+                frame = self.display.get_frame()
+            timestamp = time.time()
             # If the frame could not be read, flag it as unreadable to avoid errors
             if frame is None:
                 if not printed:
@@ -219,54 +368,161 @@ class Main:
                     printed = True
                 continue
             else:
-                self.logger.record_latency()
+                latency = time.time() - self.timer
                 printed = False
+                frame_id += 1
+                # Start or stop a requested profile between frames
+                self.profiler.frame()
+                # Count frames from the camera that were never processed
+                last_frame_number, frame_number = frame_number, self.display.get_frame_number()
+                self.metrics.increment('dropped_frames', max(frame_number - last_frame_number - 1, 0))
+            depth = self.get_raw_depth() if self.results.raw_record or self.flight_recorder else None
+            if self.results.raw_record:
+                with self.metrics.time('raw_record'):
+                    self.record_raw(frame_id, timestamp, frame, depth)
             # Copy the initial frame for analysis and display, respectively
             original = frame.copy()
-            contour_image = frame.copy()
+            # With an overlay, annotations are recorded as shapes instead of being drawn on the frame
+            contour_image = Overlay(frame.shape) if self.results.overlay else frame.copy()
             # Show FPS
-            avg = utils.calculate_fps(contour_image, time.time(), self.timer, avg)
+            utils.calculate_fps(contour_image, self.metrics.frame_times)
             self.timer = time.time()
+            # Apply morphology changed from the web UI between frames
+            target.apply_morphology()
+            # Only keep the intermediate images that are streamed
+            target.requested_stages = self.web.requested_stages() if self.results.web else set()
+            target.stage_images = {}
             # Create a mask
-            mask = target.create_mask(frame, self.hsv_handler.get_hsv())
+            with self.metrics.time('mask'):
+                mask = target.create_mask(frame, self.hsv_handler.get_hsv())
             # Get all contours
-            contours, hierarchy = target.find_contours(mask)
+            with self.metrics.time('contours'):
+                contours, hierarchy = target.find_contours(mask)
             self.is_potential_target = bool(contours)
             # Filter contours
-            filtered_contours = target.filter_contours(contours, hierarchy)
+            with self.metrics.time('filter'):
+                filtered_contours = target.filter_contours(contours, hierarchy)
             self.is_target = bool(filtered_contours)
+            self.metrics.set('contours', len(contours))
+            self.metrics.set('filtered_contours', len(filtered_contours))
             # Draw contours
-            target.draw_contours(filtered_contours, contour_image)
-            self.logger.record_contours()
+            with tracer.span('draw'):
+                target.draw_contours(filtered_contours, contour_image)
             # Find distance, angle, and other measurements if stated
-            angle, distance, field_angle, additional_data = target.measurements(contour_image, filtered_contours)
-            if self.results.web:
-                # Stream frame
-                self.web.frame = contour_image
-            # Display frame
-            self.display.process_frame(contour_image, 'image', self.results.local)
-            # Display mask
-            self.display.process_frame(utils.bitwise_and(original, mask), 'mask', self.results.local)
+            with self.metrics.time('measure'):
+                angle, distance, field_angle, additional_data = target.measurements(contour_image, filtered_contours)
+            # Send measurements over UDP right away
+            if self.results.udp:
+                self.udp.send(frame_id, timestamp, (angle, distance, field_angle))
+            stages = target.stage_images
+            if 'mask' in target.requested_stages or self.results.local:
+                stages['mask'] = utils.bitwise_and(original, mask)
+            # Keep the frame and its results in case they need to be dumped
+            if self.flight_recorder:
+                with self.metrics.time('flight_recorder'):
+                    self.flight_recorder.add(frame_id, timestamp, original, depth,
+                                             getattr(self.display.camera_provider, 'depth_scale', 0),
+                                             {'target': self.name, 'hsv': self.hsv_handler.get_hsv(),
+                                              'contours': len(contours), 'filtered_contours': len(filtered_contours),
+                                              'angle': angle, 'distance': distance, 'field_angle': field_angle})
+                    self.flight_recorder.check(angle, distance)
+                # Dump once when the robot raises the flag, and lower it for the next request
+                dump_input = bool(self.results.networktables and self.nt.get_inputs()['dump'])
+                if dump_input and not last_dump_input:
+                    self.flight_recorder.trigger('robot')
+                    self.nt.set_item('dump', False)
+                last_dump_input = dump_input
+            # Extrapolate measurements to when they are sent
+            extrapolated_angle, extrapolated_distance = None, None
+            if target.extrapolation:
+                extrapolator.add(timestamp, angle, distance)
+                lead = self.nt.get_inputs()['extrapolation_lead'] if self.results.networktables else 0
+                extrapolated_angle, extrapolated_distance = extrapolator.extrapolate(time.time() + lead)
+            # The frame's results for the recording's sidecar file
+            data = None
+            if self.display.is_recording:
+                data = {'frame_id': frame_id, 'timestamp': timestamp, 'target': self.name,
+                        'hsv': self.hsv_handler.get_hsv(), 'morphology': target.morphology,
+                        'inputs': self.nt.get_inputs() if self.results.networktables else {},
+                        'detections': [cv2.boundingRect(cnt) for cnt in filtered_contours],
+                        'measurements': [angle, distance, field_angle],
+                        'extrapolated': [extrapolated_angle, extrapolated_distance]}
+            with tracer.span('display'):
+                if self.results.overlay:
+                    if self.results.web:
+                        # Stream the frame and its annotations separately
+                        self.web.set_frame(frame, contour_image.data(), stages)
+                    # Only draw the annotations if the frame is displayed or recorded
+                    if self.results.local or self.display.is_recording:
+                        self.display.process_frame(contour_image.render(frame.copy()), 'image', self.results.local,
+                                                   data)
+                else:
+                    if self.results.web:
+                        # Stream frame
+                        self.web.set_frame(contour_image, stages=stages)
+                    # Display frame
+                    self.display.process_frame(contour_image, 'image', self.results.local, data)
+                # Display mask
+                if self.results.local:
+                    self.display.process_frame(stages['mask'], 'mask', self.results.local)
             # Send measurements to networktables, if requested, and if measurements were returned
             if self.results.networktables:
-                if distance is not None:
-                    self.nt.set_item('distance', distance)
-                if angle is not None:
-                    self.nt.set_item('angle', angle)
-                if field_angle is not None:
-                    self.nt.set_item('field_angle', field_angle)
-            # TODO: Send additional data
+                with self.metrics.time('publish'):
+                    if self.results.nt_keys:
+                        if distance is not None:
+                            self.nt.set_item('distance', distance)
+                        if angle is not None:
+                            self.nt.set_item('angle', angle)
+                        if field_angle is not None:
+                            self.nt.set_item('field_angle', field_angle)
+                        if target.extrapolation and extrapolated_angle is not None:
+                            self.nt.set_item('extrapolated_angle', extrapolated_angle)
+                            if extrapolated_distance is not None:
+                                self.nt.set_item('extrapolated_distance', extrapolated_distance)
+                    else:
+                        self.nt.set_packet('measurements', frame_id, timestamp, (angle, distance, field_angle),
+                                           additional_data=additional_data)
+                        if target.extrapolation:
+                            self.nt.set_packet('extrapolated', frame_id, timestamp,
+                                               (extrapolated_angle, extrapolated_distance, field_angle))
+                    self.nt.flush()
+            self.metrics.frame(timestamp)
+            # Report latency percentiles periodically
+            if self.metrics.report_due():
+                latencies = self.metrics.report()
+                if self.results.networktables:
+                    self.nt.set_latencies(latencies)
+            # Profile the next frames if requested by the robot, and send back the top functions when done
+            if self.results.networktables:
+                profile_frames = self.nt.get_inputs()['profile']
+                if profile_frames:
+                    try:
+                        self.profiler.request(frames=int(profile_frames))
+                    except ValueError as e:
+                        logging.warning('Profile not started: {}'.format(e))
+                    self.nt.set_item('profile', 0)
+                if self.profiler.result is not published_profile:
+                    published_profile = self.profiler.result
+                    self.nt.set_profile(published_profile)
+            self.logger.record(time=timestamp, frame_id=frame_id, latency=latency,
+                               potential_target=self.is_potential_target, target=self.is_target,
+                               contours=len(contours), filtered_contours=len(filtered_contours),
+                               angle=angle, distance=distance, field_angle=field_angle,
+                               **{'{}_seconds'.format(stage): duration for stage, duration in
+                                  self.metrics.last().items()})
+            tracer.end_frame()
             if self.stop:
                 # If stop signal was sent, call loop again to start with new name
                 logging.warning('Restarting...')
                 self.loop()
                 break
-            # Stop the code if q is pressed
-            k = cv2.waitKey(1) & 0xFF  # Large wait time to remove freezing
-            if k in (27, 113):
+            # Stop the code if q is pressed in a local window
+            if self.display.quit_requested():
                 logging.warning('Q pressed, stopping...')
                 # Release the camera and close all windows
                 self.display.release()
+                if self.raw_writer:
+                    self.raw_writer.close()
                 break
 
 
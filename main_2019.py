@@ -10,13 +10,22 @@ import imutils
 
 import constants
 import nt_handler
+import udp_handler
 import utils
 from cv_camera import CVCamera
 from display import Display
+from extrapolation import Extrapolator
+from metrics import Metrics
+from overlay import Overlay
 from file_hsv import FileHSV
+from flight_recorder import FlightRecorder
 from pi_camera import PICamera
+from profiler import Profiler
+from raw_camera import RawCamera
+from raw_recording import RawWriter
 from realsense import RealSense
 from trackbars import Trackbars
+from tracing import tracer
 from web import Web
 
 logging.basicConfig(format='[%(levelname)s] %(message)s', level=logging.INFO, handlers=[
@@ -38,6 +47,14 @@ def get_args():
     parser.add_argument('-networktables', '-nt', action='store_true', default=False,
                         dest='networktables',
                         help='Initiate network tables')
+    # Add async web server argument
+    parser.add_argument('-async-web', action='store_true', default=False,
+                        dest='async_web',
+                        help='Use the asyncio web server instead of Flask')
+    # Add overlay argument
+    parser.add_argument('-overlay', action='store_true', default=False,
+                        dest='overlay',
+                        help='Send annotations to the web UI as vector shapes instead of drawing them on the frame')
     # Add local ui argument
     parser.add_argument('-local', action='store_true', default=False,
                         dest='local',
@@ -49,6 +66,38 @@ def get_args():
     parser.add_argument('-port', default=0, dest='port', help='Camera port', type=int)
     # Add robot argument
     parser.add_argument('-robot', default='genesis', help='robot', type=str, choices=['genesis', 'driving_robot'])
+    # Add neural region of interest argument
+    parser.add_argument('-roi', action='store_true', default=False,
+                        dest='roi',
+                        help='Run the hatch network only on the bays above reflector pairs')
+    # Add networktables keys argument
+    parser.add_argument('-nt-keys', action='store_true', default=False,
+                        dest='nt_keys',
+                        help='Send measurements as separate networktables keys instead of packets')
+    # Add neural detection interval argument
+    parser.add_argument('-detect-interval', default=constants.NEURAL_DETECT_INTERVAL, dest='detect_interval',
+                        help='Run the neural network every this many frames and track in between', type=int)
+    # Add networktables server argument
+    parser.add_argument('-nt-server', default=None, dest='nt_server',
+                        help='Networktables server address, derived from the team number by default', type=str)
+    # Add UDP host argument
+    parser.add_argument('-udp', default=None, dest='udp', type=str,
+                        help='Also send measurements over UDP to this host, e.g. the robot')
+    # Add UDP port argument
+    parser.add_argument('-udp-port', default=constants.UDP_PORT, dest='udp_port', help='UDP port', type=int)
+    # Add replay argument
+    parser.add_argument('-replay', default=None, dest='replay', type=str,
+                        help='Replay a raw recording instead of using the RealSense')
+    # Add raw recording argument
+    parser.add_argument('-raw-record', default=None, dest='raw_record', type=str,
+                        help='Record raw color and depth frames losslessly to this file')
+    # Add flight recorder argument
+    parser.add_argument('-flight-recorder', action='store_true', default=False,
+                        dest='flight_recorder',
+                        help='Keep the last seconds of frames in memory, dumped from the web UI, the robot or anomalies')
+    # Add trace argument
+    parser.add_argument('-trace', action='store_true', default=False, dest='trace',
+                        help='Trace the pipeline from the start, written to the logs folder at shutdown')
     return parser.parse_args()
 
 
@@ -56,11 +105,18 @@ class Main:
     def __init__(self):
         self.name = 'hatch'  # Neural target
         self.results = get_args()
-        self.realsense = RealSense(constants.REALSENSE_SN)
+        if self.results.replay:
+            self.realsense = RawCamera(self.results.replay)
+        else:
+            self.realsense = RealSense(constants.REALSENSE_SN)
+        self.raw_writer = None
         self.camera_provider = self.realsense
         time.sleep(1)  # Let realsense run a bit before setting exposure
         self.realsense.set_exposure(10)
-        if self.results.camera == 'pi':
+        if self.results.replay:
+            logging.info('Replaying raw recording {}'.format(self.results.replay))
+            camera_provider = self.realsense
+        elif self.results.camera == 'pi':
             camera_provider = PICamera()
             logging.info('Using PI Camera provider')
         elif self.results.camera == 'realsense':
@@ -73,18 +129,42 @@ class Main:
             sys.exit(1)
 
         self.display = Display(provider=camera_provider)
+        # Performance metrics, served by the web server
+        self.metrics = Metrics()
+        # Profiles the loop when requested by the web server or the robot
+        self.profiler = Profiler()
         if self.results.local:
             # self.tape_hsv_handler = Trackbars('2019_tape')
-            self.cargo_hsv_handler = Trackbars('cargo_simple')
+            self.cargo_hsv_handler = Trackbars('cargo_simple', self.display.get_local_display())
             self.tape_hsv_handler = FileHSV('2019_tape')
         else:
             self.tape_hsv_handler = FileHSV('2019_tape')
             self.cargo_hsv_handler = FileHSV('cargo_simple')
         if self.results.web:
-            self.web = Web(self)
+            if self.results.async_web:
+                from async_web import AsyncWeb
+                self.web = AsyncWeb(self)
+            else:
+                self.web = Web(self)
             self.web.start_thread()  # Run web server
         if self.results.networktables:
-            self.nt = nt_handler.NT('2019')
+            self.nt = nt_handler.NT('2019', self.results.nt_server)
+            # Driver selected mode
+            self.nt.subscribe('target_type')
+            self.nt.subscribe('game_piece')
+            # Seconds ahead of now the robot wants extrapolated measurements for
+            self.nt.subscribe('extrapolation_lead', 0)
+            # Set by the robot to dump the flight recorder
+            self.nt.subscribe('dump', False)
+            # Set by the robot to a number of frames to profile
+            self.nt.subscribe('profile', 0)
+        if self.results.udp:
+            self.udp = udp_handler.UDP(self.results.udp, self.results.udp_port)
+        self.flight_recorder = FlightRecorder() if self.results.flight_recorder else None
+        if self.results.trace:
+            tracer.start()
+        # Loaded on first use, see get_hatch()
+        self.hatch = None
         self.stop = False
 
     def loop(self):
@@ -95,14 +175,17 @@ class Main:
         logging.info('Loading targets......')
         tape = import_module('targets.2019_tape').Target(self)
         cargo_simple = import_module('targets.cargo_simple').Target(self)
-        # hatch = import_module('neural_targets.hatch').Target(self)
         logging.info('Loading targets complete')
 
-        # Timer for FPS counter
-        timer = time.time()
-        avg = 0
+        frame_id = 0
+        frame_number = self.realsense.frame_number
+        tape_extrapolator = Extrapolator()
+        published_profile = self.profiler.result
+        last_dump_input = False
         while True:
+            tracer.begin_frame(frame_id + 1)
             frame = self.realsense.frame
+            timestamp = time.time()
 
             if frame is None:
                 if not printed:
@@ -111,50 +194,82 @@ class Main:
                 continue
             else:
                 printed = False
+                frame_id += 1
+                # Start or stop a requested profile between frames
+                self.profiler.frame()
+                # Count frames from the camera that were never processed
+                last_frame_number, frame_number = frame_number, self.realsense.frame_number
+                self.metrics.increment('dropped_frames', max(frame_number - last_frame_number - 1, 0))
+                depth = self.realsense.get_raw_depth() if self.results.raw_record or self.flight_recorder else None
+                if self.results.raw_record:
+                    with self.metrics.time('raw_record'):
+                        self.record_raw(frame_id, timestamp, frame, depth)
 
             # Separate frames for display purposes
             original = frame.copy()
-            contour_image = frame.copy()
+            # With an overlay, annotations are recorded as shapes instead of being drawn on the frame
+            contour_image = Overlay(frame.shape) if self.results.overlay else frame.copy()
+
+            # Only keep the intermediate images that are streamed
+            requested_stages = self.web.requested_stages() if self.results.web else set()
+            for target in (tape, cargo_simple):
+                target.requested_stages = requested_stages
+                target.stage_images = {}
 
             # ---- Classic detection
 
-            mask = tape.create_mask(frame, self.tape_hsv_handler.get_hsv())
-            contours, hierarchy = tape.find_contours(mask)
-            filtered_contours = tape.filter_contours(contours, hierarchy)
+            with self.metrics.time('mask'):
+                mask = tape.create_mask(frame, self.tape_hsv_handler.get_hsv())
+            with self.metrics.time('contours'):
+                contours, hierarchy = tape.find_contours(mask)
+            with self.metrics.time('filter'):
+                filtered_contours = tape.filter_contours(contours, hierarchy)
+            self.metrics.set('contours', len(contours))
+            self.metrics.set('filtered_contours', len(filtered_contours))
             # Draw contours
-            tape.draw_contours(filtered_contours, contour_image)
-            rocket = self.results.networktables and self.nt.get_item('target_type', 'rocket') == 'rocket'
-            rocket_hatch = rocket and self.nt.get_item('game_piece', 'hatch') == 'hatch'
-            rocket_cargo = rocket and self.nt.get_item('game_piece', 'hatch') == 'cargo'
+            with tracer.span('draw'):
+                tape.draw_contours(filtered_contours, contour_image)
+            # Read the driver selected mode once per frame
+            inputs = self.nt.get_inputs() if self.results.networktables else {}
+            target_type = inputs.get('target_type')
+            game_piece = inputs.get('game_piece')
+            rocket = self.results.networktables and (target_type or 'rocket') == 'rocket'
+            rocket_hatch = rocket and (game_piece or 'hatch') == 'hatch'
+            rocket_cargo = rocket and (game_piece or 'hatch') == 'cargo'
 
             # Find distance and angle
-            tape_angle, tape_distance, tape_field_angle, data = tape.measurements(contour_image, filtered_contours,
-                                                                                  rocket_hatch, rocket_cargo, False)
+            with self.metrics.time('measure'):
+                tape_angle, tape_distance, tape_field_angle, data = tape.measurements(contour_image, filtered_contours,
+                                                                                      rocket_hatch, rocket_cargo,
+                                                                                      False)
             pair = data[0] if data else None
 
             hatch_angle = None
             hatch_distance = None
 
             # Cargo ship
-            neural = self.results.networktables and self.nt.get_item('target_type', 'rocket') in ['cargoship',
-                                                                                                  'floor_hatch']
+            neural = self.results.networktables and target_type in ['cargoship', 'floor_hatch']
             if neural:
                 # ---- Neural detection
 
-                boxes = hatch.boxes(original)
+                hatch = self.get_hatch()
 
-                # Draw on frame
-                hatch.draw(contour_image, boxes)
+                pairs = data[1] if data else None
 
-                target_type = self.nt.get_item('target_type', 'rocket')
+                if target_type == 'cargoship' and self.results.roi:
+                    # Only look for hatches in the bays above the pairs
+                    boxes = hatch.roi_boxes(original, [self.bay_region(pair, frame) for pair in pairs or [] if pair])
+                else:
+                    boxes = hatch.track(original)
 
-                pairs = data[1] if data else None
+                # Draw on frame
+                hatch.draw(contour_image, boxes)
 
                 if target_type == 'cargoship':
 
                     hatch_pairs, non_hatch_pairs = self.match_hatches(pairs, boxes, frame, contour_image)
 
-                    if self.nt.get_item('game_piece', 'hatch') == 'hatch':
+                    if (game_piece or 'hatch') == 'hatch':
                         chosen_pair = tape.get_closest_pair(non_hatch_pairs)
                     else:
 
@@ -162,70 +277,190 @@ class Main:
 
                         chosen_pair = tape.get_closest_pair(non_cargo_pairs)
 
-                    tape_angle, tape_distance, tape_field_angle = tape.calculate(chosen_pair, original)
+                    tape_angle, tape_distance, tape_field_angle = tape.calculate(chosen_pair, original, game_piece or 'cargo')
                     if chosen_pair:
                         # Draw chosen pair on screen
                         x, y, w, h = cv2.boundingRect(chosen_pair[0])
                         x2, y2, w2, h2 = cv2.boundingRect(chosen_pair[1])
-                        cv2.rectangle(contour_image, (x + w, y + h), (x2, y2), (123, 92, 249), 3)
+                        utils.draw_rectangle(contour_image, (x + w, y + h), (x2, y2), (123, 92, 249), 3)
 
                 else:
                     hatch_angle, hatch_distance, bounding_box = hatch.measurements(frame, boxes)
             else:
                 if pair:
-                    tape_angle, tape_distance, tape_field_angle = tape.calculate(pair, original)
+                    tape_angle, tape_distance, tape_field_angle = tape.calculate(pair, original, game_piece or 'cargo')
 
             cargo_angle = None
             cargo_distance = None
 
-            if self.results.networktables and self.nt.get_item('target_type', 'sandstorm') == 'floor_cargo':
+            if self.results.networktables and target_type == 'floor_cargo':
                 cargo_angle, cargo_distance, field_angle, additional_data = self.simple_cargo_detection(cargo_simple,
                                                                                                         frame,
                                                                                                         contour_image)
 
             # Show FPS
-            avg = utils.calculate_fps(contour_image, time.time(), timer, avg)
-            timer = time.time()
-            self.web.frame = contour_image
-            # Display
-            self.display.process_frame(contour_image, 'Image', self.results.local)
-            self.display.process_frame(utils.bitwise_and(original, mask), 'Reflector mask', self.results.local)
+            utils.calculate_fps(contour_image, self.metrics.frame_times)
 
             # Compensation for cameras not being in the center
             if tape_distance and tape_angle is not None:
                 tape_distance, tape_angle = self.compensate_center(tape_distance, tape_angle)
 
+            # Send measurements over UDP right away
+            if self.results.udp:
+                self.udp.send(frame_id, timestamp,
+                              (tape_angle, tape_distance, tape_field_angle),
+                              (hatch_angle if hatch_distance else None, hatch_distance, None),
+                              (cargo_angle if cargo_distance else None, cargo_distance, None))
+
+            # Extrapolate tape measurements to when they are sent
+            tape_extrapolated_angle, tape_extrapolated_distance = None, None
+            if tape.extrapolation:
+                tape_extrapolator.add(timestamp, tape_angle, tape_distance)
+                lead = inputs['extrapolation_lead'] if self.results.networktables else 0
+                tape_extrapolated_angle, tape_extrapolated_distance = tape_extrapolator.extrapolate(time.time() + lead)
+
+            # The frame's results for the recording's sidecar file
+            data = None
+            if self.display.is_recording:
+                data = {'frame_id': frame_id, 'timestamp': timestamp, 'hsv': self.tape_hsv_handler.get_hsv(),
+                        'inputs': inputs,
+                        'detections': {'tape': [cv2.boundingRect(cnt) for cnt in filtered_contours],
+                                       'hatches': [{'class': box['class'], 'score': float(box['score']),
+                                                    'box': [float(v) for v in box['box']]}
+                                                   for box in boxes] if neural else []},
+                        'measurements': {'tape': [tape_angle, tape_distance, tape_field_angle],
+                                         'hatch': [hatch_angle, hatch_distance],
+                                         'cargo': [cargo_angle, cargo_distance]},
+                        'extrapolated': [tape_extrapolated_angle, tape_extrapolated_distance]}
+            # The tape's stages take precedence over the cargo's, which only adds its edges
+            stages = dict(cargo_simple.stage_images, **tape.stage_images)
+            if 'mask' in requested_stages or self.results.local:
+                stages['mask'] = utils.bitwise_and(original, mask)
+            with tracer.span('display'):
+                if self.results.overlay:
+                    # Stream the frame and its annotations separately
+                    self.web.set_frame(frame, contour_image.data(), stages)
+                    # Only draw the annotations if the frame is displayed or recorded
+                    if self.results.local or self.display.is_recording:
+                        self.display.process_frame(contour_image.render(frame.copy()), 'image', self.results.local,
+                                                   data)
+                else:
+                    self.web.set_frame(contour_image, stages=stages)
+                    # Display
+                    self.display.process_frame(contour_image, 'image', self.results.local, data)
+                if self.results.local:
+                    self.display.process_frame(stages['mask'], 'Reflector mask', self.results.local)
+
+            # Keep the frame and its results in case they need to be dumped
+            if self.flight_recorder:
+                with self.metrics.time('flight_recorder'):
+                    self.flight_recorder.add(frame_id, timestamp, original, depth, self.realsense.depth_scale,
+                                             {'inputs': inputs, 'hsv': self.tape_hsv_handler.get_hsv(),
+                                              'contours': len(contours), 'filtered_contours': len(filtered_contours),
+                                              'tape': (tape_angle, tape_distance, tape_field_angle),
+                                              'hatch': (hatch_angle, hatch_distance),
+                                              'cargo': (cargo_angle, cargo_distance)})
+                    self.flight_recorder.check(tape_angle, tape_distance)
+                # Dump once when the robot raises the flag, and lower it for the next request
+                dump_input = bool(inputs.get('dump'))
+                if dump_input and not last_dump_input:
+                    self.flight_recorder.trigger('robot')
+                    self.nt.set_item('dump', False)
+                last_dump_input = dump_input
+
             # Set values in network tables
             if self.results.networktables:
-                # Tape
-                self.nt.set_item('tape_seen', tape_angle is not None)
-                if tape_angle is not None:
-                    self.nt.set_item('tape_angle', tape_angle)
-                    if tape_distance:
-                        self.nt.set_item('tape_distance', tape_distance)
-                    if tape_field_angle is not None:
-                        self.nt.set_item('tape_field_angle', tape_field_angle)
-                # Hatch
-                self.nt.set_item('hatch_seen', bool(hatch_distance))
-                if hatch_distance:
-                    self.nt.set_item('hatch_angle', hatch_angle)
-                    self.nt.set_item('hatch_distance', hatch_distance)
-                # Cargo
-                self.nt.set_item('cargo_seen', bool(cargo_distance))
-                if cargo_distance:
-                    self.nt.set_item('cargo_angle', cargo_angle)
-                    self.nt.set_item('cargo_distance', cargo_distance)
+                with self.metrics.time('publish'):
+                    if not self.results.nt_keys:
+                        # Tape, hatch and cargo in a single packet
+                        self.nt.set_packet('measurements', frame_id, timestamp,
+                                           (tape_angle, tape_distance, tape_field_angle),
+                                           (hatch_angle if hatch_distance else None, hatch_distance, None),
+                                           (cargo_angle if cargo_distance else None, cargo_distance, None))
+                        if tape.extrapolation:
+                            self.nt.set_packet('extrapolated', frame_id, timestamp,
+                                               (tape_extrapolated_angle, tape_extrapolated_distance, tape_field_angle))
+                        self.nt.flush()
+                    else:
+                        # Tape
+                        self.nt.set_item('tape_seen', tape_angle is not None)
+                        if tape_angle is not None:
+                            self.nt.set_item('tape_angle', tape_angle)
+                            if tape_distance:
+                                self.nt.set_item('tape_distance', tape_distance)
+                            if tape_field_angle is not None:
+                                self.nt.set_item('tape_field_angle', tape_field_angle)
+                            if tape_extrapolated_angle is not None:
+                                self.nt.set_item('tape_extrapolated_angle', tape_extrapolated_angle)
+                            if tape_extrapolated_distance is not None:
+                                self.nt.set_item('tape_extrapolated_distance', tape_extrapolated_distance)
+                        # Hatch
+                        self.nt.set_item('hatch_seen', bool(hatch_distance))
+                        if hatch_distance:
+                            self.nt.set_item('hatch_angle', hatch_angle)
+                            self.nt.set_item('hatch_distance', hatch_distance)
+                        # Cargo
+                        self.nt.set_item('cargo_seen', bool(cargo_distance))
+                        if cargo_distance:
+                            self.nt.set_item('cargo_angle', cargo_angle)
+                            self.nt.set_item('cargo_distance', cargo_distance)
+                        self.nt.flush()
+            self.metrics.frame(timestamp)
+            # Report latency percentiles periodically
+            if self.metrics.report_due():
+                latencies = self.metrics.report()
+                if self.results.networktables:
+                    self.nt.set_latencies(latencies)
+            # Profile the next frames if requested by the robot, and send back the top functions when done
+            if self.results.networktables:
+                profile_frames = self.nt.get_inputs()['profile']
+                if profile_frames:
+                    try:
+                        self.profiler.request(frames=int(profile_frames))
+                    except ValueError as e:
+                        logging.warning('Profile not started: {}'.format(e))
+                    self.nt.set_item('profile', 0)
+                if self.profiler.result is not published_profile:
+                    published_profile = self.profiler.result
+                    self.nt.set_profile(published_profile)
+            tracer.end_frame()
             if self.stop:
                 # If stop signal was sent we call loop again to start with new name
                 logging.warning('Restarting...')
                 self.loop()
                 break
-            k = cv2.waitKey(1) & 0xFF  # large wait time to remove freezing
-            if k in (27, 113):
+            # Stop the code if q is pressed in a local window
+            if self.display.quit_requested():
                 logging.warning('Q pressed, stopping...')
                 self.display.release()
+                if self.raw_writer:
+                    self.raw_writer.close()
                 break
 
+    def record_raw(self, frame_id: int, timestamp: float, frame, depth):
+        """
+        Write the RealSense's color and depth frames to the raw recording. The recording is created at the size of the
+        first frames.
+        See: RawWriter in raw_recording.py
+        """
+        if self.raw_writer is None:
+            self.raw_writer = RawWriter(self.results.raw_record, (frame.shape[1], frame.shape[0]),
+                                        None if depth is None else (depth.shape[1], depth.shape[0]),
+                                        self.realsense.depth_scale)
+        self.raw_writer.write(frame_id, timestamp, frame, depth)
+
+    def get_hatch(self):
+        """
+        Load the hatch network on first use, since loading TensorFlow and the graph slows down startup and neural
+        detection is only used in some modes.
+        :return: The hatch neural target.
+        """
+        if self.hatch is None:
+            logging.info('Loading hatch network......')
+            self.hatch = import_module('neural_targets.hatch').Target(self)
+            logging.info('Loading hatch network complete')
+        return self.hatch
+
     def compensate_center(self, distance, center_angle):
         """
         Compensate for cameras being offset on the genesis profile.
@@ -268,6 +503,36 @@ class Main:
         return cargo_simple.measurements(contour_image,
                                          filtered_contours)
 
+    @staticmethod
+    def bay_bounds(pair):
+        """
+        Get the bounds of the bay above a reflector pair, in which a hatch would be placed.
+        :param pair: Reflection tape pair
+        :return: Inner x of the right reflector, inner x of the left reflector, lowest y and highest y of the bay
+        """
+        reflector_x1, reflector_y1, reflector_w1, reflector_h1 = cv2.boundingRect(pair[0])
+        reflector_x2, reflector_y2, reflector_w2, reflector_h2 = cv2.boundingRect(pair[1])
+        reflector_x2 = reflector_x2 + reflector_w2
+        bay_highest_y = max(reflector_y1, reflector_y2)
+        bay_lowest_y = min(reflector_y1 - (3 * reflector_h1),
+                           reflector_y2 - (3 * reflector_h2))
+        return reflector_x1, reflector_x2, bay_lowest_y, bay_highest_y
+
+    @staticmethod
+    def bay_region(pair, frame):
+        """
+        Region of the frame to run the hatch network on for a reflector pair.
+        The bay is widened on both sides, since a hatch is wider than the gap between the reflectors.
+        :param pair: Reflection tape pair
+        :param frame: Original frame
+        :return: x1, y1, x2, y2 of the region, clipped to the frame
+        """
+        reflector_x1, reflector_x2, bay_lowest_y, bay_highest_y = Main.bay_bounds(pair)
+        margin = (reflector_x1 - reflector_x2) * constants.NEURAL_ROI_MARGIN
+        rows, cols = frame.shape[:2]
+        return (max(reflector_x2 - margin, 0), max(bay_lowest_y, 0),
+                min(reflector_x1 + margin, cols), min(bay_highest_y, rows))
+
     @staticmethod
     def match_hatches(pairs, boxes, frame, contour_image):
         """
@@ -290,18 +555,15 @@ class Main:
                         middle_hatch_x = (hatch_x1 + hatch_x2) / 2
                         middle_hatch_y = (hatch_y1 - hatch_y2) / 2
 
-                        reflector_x1, reflector_y1, reflector_w1, reflector_h1 = cv2.boundingRect(pair[0])
-                        reflector_x2, reflector_y2, reflector_w2, reflector_h2 = cv2.boundingRect(pair[1])
-                        reflector_x2 = reflector_x2 + reflector_w2
-                        bay_highest_y = max(reflector_y1, reflector_y2)
-                        bay_lowest_y = min(reflector_y1 - (3 * reflector_h1),
-                                           reflector_y2 - (3 * reflector_h2))
+                        reflector_x1, reflector_x2, bay_lowest_y, bay_highest_y = Main.bay_bounds(pair)
+                        reflector_w1 = cv2.boundingRect(pair[0])[2]
+                        reflector_y2 = cv2.boundingRect(pair[1])[1]
 
                         if reflector_x2 < middle_hatch_x < reflector_x1 and bay_lowest_y < middle_hatch_y < bay_highest_y:
-                            cv2.rectangle(contour_image,
-                                          (int(reflector_x2 - reflector_w1), int(reflector_y2)),
-                                          (int(hatch_x2), int(hatch_y2)),
-                                          (10, 50, 200), 3)
+                            utils.draw_rectangle(contour_image,
+                                                 (int(reflector_x2 - reflector_w1), int(reflector_y2)),
+                                                 (int(hatch_x2), int(hatch_y2)),
+                                                 (10, 50, 200), 3)
                             has_hatch = True
                     if has_hatch:
                         hatch_pairs.append(pair)
@@ -341,14 +603,7 @@ class Main:
                             continue
                         middle_hatch_x = (hatch_x1 + hatch_x2) / 2
                         middle_hatch_y = (hatch_y1 - hatch_y2) / 2
-                        reflector_x1, reflector_y1, reflector_w1, reflector_h1 = cv2.boundingRect(
-                            pair[0])
-                        reflector_x2, reflector_y2, reflector_w2, reflector_h2 = cv2.boundingRect(
-                            pair[1])
-                        reflector_x2 = reflector_x2 + reflector_w2
-                        bay_highest_y = max(reflector_y1, reflector_y2)
-                        bay_lowest_y = min(reflector_y1 - (3 * reflector_h1),
-                                           reflector_y2 - (3 * reflector_h2))
+                        reflector_x1, reflector_x2, bay_lowest_y, bay_highest_y = self.bay_bounds(pair)
 
                         if reflector_x2 < middle_hatch_x < reflector_x1 and \
                                 bay_lowest_y < middle_hatch_y < bay_highest_y:
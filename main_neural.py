@@ -2,11 +2,12 @@ import argparse
 import logging
 import sys
 import time
+from collections import deque
 from importlib import import_module
 
-import cv2
 import tensorflow as tf
 
+import constants
 import nt_handler
 import utils
 from cv_camera import CVCamera
@@ -34,6 +35,10 @@ def get_args():
     parser.add_argument('-networktables', '-nt', action='store_true', default=False,
                         dest='networktables',
                         help='Initiate network tables')
+    # Add async web server argument
+    parser.add_argument('-async-web', action='store_true', default=False,
+                        dest='async_web',
+                        help='Use the asyncio web server instead of Flask')
     # Add local ui argument
     parser.add_argument('-local', action='store_true', default=False,
                         dest='local',
@@ -46,6 +51,12 @@ def get_args():
     parser.add_argument('-target', default='hatch', dest='target', help='Target file', type=str)
     # Add robot argument
     parser.add_argument('-robot', default='genesis', help='robot', type=str, choices=['genesis', 'driving_robot'])
+    # Add neural detection interval argument
+    parser.add_argument('-detect-interval', default=constants.NEURAL_DETECT_INTERVAL, dest='detect_interval',
+                        help='Run the neural network every this many frames and track in between', type=int)
+    # Add networktables server argument
+    parser.add_argument('-nt-server', default=None, dest='nt_server',
+                        help='Networktables server address, derived from the team number by default', type=str)
     return parser.parse_args()
 
 
@@ -69,10 +80,14 @@ class Main:
             sys.exit(1)
         self.display = Display(provider=camera_provider)
         if self.results.web:
-            self.web = Web(self)
+            if self.results.async_web:
+                from async_web import AsyncWeb
+                self.web = AsyncWeb(self)
+            else:
+                self.web = Web(self)
             self.web.start_thread()  # Run web server
         if self.results.networktables:
-            self.nt = nt_handler.NT(self.name)
+            self.nt = nt_handler.NT(self.name, self.results.nt_server)
         self.stop = False
         self.session = None
 
@@ -97,9 +112,8 @@ class Main:
         # We dynamically load classes in order to provide a modular base
         target = import_module('neural_targets.{}'.format(self.name)).Target(self)
         self.display.change_exposure(target.exposure)
-        # Timer for FPS counter
-        timer = time.time()
-        avg = 0
+        # End times of the last frames, for the FPS counter
+        frame_times = deque(maxlen=constants.METRICS_WINDOW)
         while True:
             frame = self.display.get_frame()
             if frame is None:
@@ -110,13 +124,13 @@ class Main:
             else:
                 printed = False
             # Get bounding boxes
-            boxes = target.boxes(frame)
+            boxes = target.track(frame)
             # Draw on frame
             target.draw(frame, boxes)
             angle, distance, bounding_box = target.measurements(frame, boxes)
             # Show FPS
-            avg = utils.calculate_fps(frame, time.time(), timer, avg)
-            timer = time.time()
+            frame_times.append(time.time())
+            utils.calculate_fps(frame, frame_times)
             # Web
             self.web.frame = frame
             # Display
@@ -131,8 +145,8 @@ class Main:
                 logging.warning('Restarting...')
                 self.loop()
                 break
-            k = cv2.waitKey(1) & 0xFF  # large wait time to remove freezing
-            if k in (27, 113):
+            # Stop the code if q is pressed in a local window
+            if self.display.quit_requested():
                 logging.warning('Q pressed, stopping...')
                 self.display.release()
                 self.session.close()
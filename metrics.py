@@ -0,0 +1,237 @@
+import atexit
+import logging
+import os
+import resource
+import time
+from collections import deque
+from contextlib import contextmanager
+from threading import Lock
+
+import numpy as np
+
+import constants
+from histogram import Histogram
+from tracing import tracer
+
+
+class Metrics:
+    """
+    Collects performance metrics of the vision process, for the /metrics route of the web server.
+
+    Attributes
+    ----------
+
+    stages : dict
+        - the durations in seconds of the last frames, for every pipeline stage
+    counters : dict
+        - totals since the start of the run, such as dropped frames
+    gauges : dict
+        - the last value of measurements that go up and down, such as contour counts
+    frame_times : deque
+        - the times the last frames were processed at, for FPS
+    histograms : dict
+        - the durations of every stage since the last report, 'total' being capture to the end of the frame
+    totals : dict
+        - the durations of every stage until the last report, logged at shutdown
+    """
+
+    def __init__(self, window: int = constants.METRICS_WINDOW):
+        """
+        :param window: Number of frames stage durations and FPS are calculated over.
+        """
+        self.window = window
+        self.stages = {}
+        self.counters = {}
+        self.gauges = {}
+        self.frame_times = deque(maxlen=window)
+        self.histograms = {}
+        self.totals = {}
+        self.last_report = time.time()
+        self.lock = Lock()
+        self.last_cpu = (time.time(), self.cpu_time())
+        atexit.register(self.log_totals)
+
+    @contextmanager
+    def time(self, stage: str, **args):
+        """
+        Time a pipeline stage, and trace it if tracing.
+        :param stage: Name of the stage.
+        :param args: Values shown with the stage's span in traces.
+        See: span() in Tracer in tracing.py
+        """
+        start = time.perf_counter()
+        try:
+            with tracer.span(stage, **args):
+                yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def record(self, stage: str, seconds: float):
+        """
+        :param stage: Name of the stage.
+        :param seconds: Duration of the stage.
+        """
+        with self.lock:
+            if stage not in self.stages:
+                self.stages[stage] = deque(maxlen=self.window)
+                self.histograms[stage] = Histogram()
+            self.stages[stage].append(seconds)
+            self.histograms[stage].record(seconds)
+
+    def last(self) -> dict:
+        """
+        :return: The last duration of every stage, in seconds.
+        """
+        with self.lock:
+            return {stage: durations[-1] for stage, durations in self.stages.items() if durations}
+
+    def increment(self, name: str, amount: int = 1):
+        """
+        :param name: Name of the counter.
+        :param amount: Amount to add.
+        """
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set(self, name: str, value):
+        """
+        :param name: Name of the gauge.
+        :param value: New value.
+        """
+        self.gauges[name] = value
+
+    def frame(self, timestamp: float = None):
+        """
+        Mark the end of a frame.
+        :param timestamp: Capture time of the frame, for the end-to-end 'total' stage.
+        """
+        now = time.time()
+        self.frame_times.append(now)
+        if timestamp is not None:
+            self.record('total', now - timestamp)
+
+    def fps(self) -> float:
+        """
+        :return: Frames per second over the last frames, 0 if unknown.
+        """
+        frame_times = list(self.frame_times)
+        if len(frame_times) > 1 and frame_times[-1] > frame_times[0]:
+            return (len(frame_times) - 1) / (frame_times[-1] - frame_times[0])
+        return 0
+
+    def report_due(self) -> bool:
+        """
+        :return: Whether constants.METRICS_REPORT_SECONDS passed since the last report.
+        """
+        return time.time() - self.last_report >= constants.METRICS_REPORT_SECONDS
+
+    def report(self) -> dict:
+        """
+        Log the p50, p90, p99 and max duration of every stage since the last report, and start a new window.
+        :return: The summary of every stage, in seconds.
+        See: summary() in Histogram in histogram.py
+        """
+        with self.lock:
+            summaries = {stage: histogram.summary() for stage, histogram in self.histograms.items()
+                         if histogram.count}
+            for stage, histogram in self.histograms.items():
+                self.totals.setdefault(stage, Histogram()).add(histogram)
+                histogram.reset()
+        self.last_report = time.time()
+        logging.info('Latency ms (p50/p90/p99/max) over {} frames: {}'.format(
+            summaries.get('total', {}).get('count', 0), self.format(summaries)))
+        return summaries
+
+    def log_totals(self):
+        """
+        Log the p50, p90, p99 and max duration of every stage over the whole run. Called at shutdown.
+        """
+        with self.lock:
+            totals = {stage: Histogram() for stage in self.histograms}
+            for stage, histogram in totals.items():
+                histogram.add(self.histograms[stage])
+                if stage in self.totals:
+                    histogram.add(self.totals[stage])
+            summaries = {stage: histogram.summary() for stage, histogram in totals.items() if histogram.count}
+        if summaries:
+            logging.info('Latency ms (p50/p90/p99/max) over the run: {}'.format(self.format(summaries)))
+
+    @staticmethod
+    def format(summaries: dict) -> str:
+        """
+        :param summaries: Summary of every stage, in seconds.
+        :return: The summaries in milliseconds, on one line.
+        """
+        return ', '.join('{} {:.1f}/{:.1f}/{:.1f}/{:.1f}'.format(stage, *(summary[name] * 1000 for name in
+                                                                          ('p50', 'p90', 'p99', 'max')))
+                         for stage, summary in summaries.items())
+
+    @staticmethod
+    def cpu_time() -> float:
+        """
+        :return: User and system CPU seconds used by the process.
+        """
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return usage.ru_utime + usage.ru_stime
+
+    @staticmethod
+    def rss() -> int:
+        """
+        :return: Resident memory of the process in bytes, peak resident memory if the current one is unavailable.
+        """
+        try:
+            with open('/proc/self/statm', 'r') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError):
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def snapshot(self) -> dict:
+        """
+        :return: All metrics, with p50, p90, p99 and max of every stage in seconds. CPU use is a percentage of a
+        single core since the last snapshot.
+        """
+        with self.lock:
+            stages = {stage: np.array(durations) for stage, durations in self.stages.items() if durations}
+            counters = dict(self.counters)
+        now, cpu = time.time(), self.cpu_time()
+        last_time, last_cpu = self.last_cpu
+        self.last_cpu = (now, cpu)
+        return {
+            'stages': {stage: dict(zip(('p50', 'p90', 'p99'), np.percentile(durations, [50, 90, 99]).tolist()),
+                                   max=float(durations.max()))
+                       for stage, durations in stages.items()},
+            'fps': self.fps(),
+            'counters': counters,
+            'gauges': dict(self.gauges),
+            'cpu_percent': (cpu - last_cpu) / (now - last_time) * 100 if now > last_time else 0,
+            'rss_bytes': self.rss()
+        }
+
+    @staticmethod
+    def prometheus(snapshot: dict) -> str:
+        """
+        :param snapshot: Metrics returned by snapshot().
+        :return: The metrics in the Prometheus text format.
+        """
+        lines = ['# TYPE vision_stage_seconds summary']
+        for stage, percentiles in snapshot['stages'].items():
+            for name, quantile in (('p50', '0.5'), ('p90', '0.9'), ('p99', '0.99'), ('max', '1')):
+                lines.append('vision_stage_seconds{{stage="{}",quantile="{}"}} {}'.format(stage, quantile,
+                                                                                          percentiles[name]))
+        lines.append('# TYPE vision_fps gauge')
+        lines.append('vision_fps {}'.format(snapshot['fps']))
+        for name, value in snapshot['counters'].items():
+            lines.append('# TYPE vision_{}_total counter'.format(name))
+            lines.append('vision_{}_total {}'.format(name, value))
+        for name, value in snapshot['gauges'].items():
+            lines.append('# TYPE vision_{} gauge'.format(name))
+            lines.append('vision_{} {}'.format(name, float(value)))
+        lines.append('# TYPE process_cpu_percent gauge')
+        lines.append('process_cpu_percent {}'.format(snapshot['cpu_percent']))
+        lines.append('# TYPE process_resident_memory_bytes gauge')
+        lines.append('process_resident_memory_bytes {}'.format(snapshot['rss_bytes']))
+        return '\n'.join(lines) + '\n'
+
+
+if __name__ == "__main__":
+    help(Metrics)
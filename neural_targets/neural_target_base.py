@@ -1,9 +1,13 @@
 from abc import ABC, abstractmethod
 from typing import Tuple, Optional
 
+import logging
+
 import cv2
+import numpy as np
 import tensorflow as tf
 
+import constants
 import utils
 
 
@@ -25,29 +29,152 @@ class NeuralTargetBase(ABC):
 
         self.main.session = tf.Session(graph=self.graph, config=config)
 
+        # Tracking between detections
+        self.detect_interval = getattr(self.main.results, 'detect_interval', constants.NEURAL_DETECT_INTERVAL)
+        self.tracked = None  # Last boxes, with the grayscale template of each box
+        self.frames_since_detection = 0
+        self.detected_frames = 0
+        self.tracked_frames = 0
+
     def boxes(self, image):
         """
         :param image: Image to run network on
-        :return:
+        :return: Bounding boxes of detected objects
+        """
+        return self.run([image])[0]
+
+    def track(self, image):
         """
-        inp = cv2.resize(image, (300, 300))
-        inp = cv2.cvtColor(inp, cv2.COLOR_BGR2RGB)
+        Run the network every detect_interval frames, and track the last boxes with template matching in between.
+        The network is run early if nothing was detected, or if a box is lost or its tracking score drops.
+        :param image: Image to run network or tracker on
+        :return: Bounding boxes of detected or tracked objects
+        """
+        if self.detect_interval <= 1:
+            return self.boxes(image)
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        boxes = None
+        if self.tracked and self.frames_since_detection < self.detect_interval - 1:
+            boxes = self.track_boxes(gray)
+        if boxes is None:
+            boxes = self.boxes(image)
+            self.tracked = [(box, self.template(gray, box['box'])) for box in boxes]
+            self.frames_since_detection = 0
+            self.detected_frames += 1
+        else:
+            self.frames_since_detection += 1
+            self.tracked_frames += 1
+        if (self.detected_frames + self.tracked_frames) % constants.NEURAL_TRACKER_LOG_FRAMES == 0:
+            logging.info('Detect interval: {} Detected frames: {} Tracked frames: {}'.format(self.detect_interval,
+                                                                                             self.detected_frames,
+                                                                                             self.tracked_frames))
+        return boxes
+
+    def track_boxes(self, gray):
+        """
+        Find the last boxes in a search window around them, and track them from where they were found.
+        :param gray: Grayscale image to track in
+        :return: Tracked bounding boxes, None if any box was lost or its score dropped
+        """
+        rows, cols = gray.shape
+        boxes = []
+        tracked = []
+        for box, template in self.tracked:
+            if template is None:
+                return None
+            x1, x2, y1, y2 = utils.bounding_box_coords(box['box'], gray)
+            height, width = template.shape
+            margin = int(max(width, height) * constants.NEURAL_TRACKER_SEARCH_MARGIN)
+            search_x1, search_y1 = max(int(x1) - margin, 0), max(int(y1) - margin, 0)
+            search_x2, search_y2 = min(int(x1) + width + margin, cols), min(int(y1) + height + margin, rows)
+            window = gray[search_y1:search_y2, search_x1:search_x2]
+            if window.shape[0] < height or window.shape[1] < width:
+                return None
+            _, match, _, (match_x, match_y) = cv2.minMaxLoc(cv2.matchTemplate(window, template,
+                                                                              cv2.TM_CCOEFF_NORMED))
+            score = box['score'] * match
+            if score < constants.NEURAL_TRACKER_MIN_SCORE:
+                return None
+            new_x1 = search_x1 + match_x
+            new_y1 = search_y1 + match_y
+            new_box = [new_y1 / rows, new_x1 / cols, (new_y1 + height) / rows, (new_x1 + width) / cols]
+            boxes.append({"class": box['class'], "score": score, "box": new_box})
+            # Tracked from its new position and appearance, scored by its detection score
+            tracked.append((dict(box, box=new_box), self.template(gray, new_box)))
+        self.tracked = tracked
+        return boxes
+
+    @staticmethod
+    def template(gray, bounding_box):
+        """
+        :param gray: Grayscale image
+        :param bounding_box: Bounding box of a detected object
+        :return: The part of the image inside the bounding box, None if it is too small to track
+        """
+        x1, x2, y1, y2 = utils.bounding_box_coords(bounding_box, gray)
+        template = gray[max(int(y1), 0):int(y2), max(int(x1), 0):int(x2)]
+        if min(template.shape) < 4:
+            return None
+        return template.copy()
+
+    def roi_boxes(self, image, regions):
+        """
+        Run the network only on regions of the image, batched into a single inference call.
+        Boxes are mapped back to be relative to the whole image, so they can be used like the output of boxes().
+        :param image: Image to crop regions from
+        :param regions: List of (x1, y1, x2, y2) pixel regions
+        :return: Bounding boxes of detected objects in all regions
+        """
+        rows, cols = image.shape[:2]
+        crops = []
+        crop_regions = []
+        for x1, y1, x2, y2 in regions:
+            x1, x2 = max(int(x1), 0), min(int(x2), cols)
+            y1, y2 = max(int(y1), 0), min(int(y2), rows)
+            if x2 - x1 < 2 or y2 - y1 < 2:
+                continue
+            crops.append(image[y1:y2, x1:x2])
+            crop_regions.append((x1, y1, x2, y2))
+        if not crops:
+            return []
+        boxes = []
+        for (x1, y1, x2, y2), crop_boxes in zip(crop_regions, self.run(crops)):
+            for box in crop_boxes:
+                box_y1, box_x1, box_y2, box_x2 = box['box']
+                # Convert from crop relative coordinates to image relative coordinates
+                box['box'] = [(y1 + box_y1 * (y2 - y1)) / rows,
+                              (x1 + box_x1 * (x2 - x1)) / cols,
+                              (y1 + box_y2 * (y2 - y1)) / rows,
+                              (x1 + box_x2 * (x2 - x1)) / cols]
+                boxes.append(box)
+        return boxes
+
+    def run(self, images):
+        """
+        Run the network on a batch of images.
+        :param images: List of images to run network on
+        :return: List of bounding boxes for every image
+        """
+        inp = np.stack([cv2.cvtColor(cv2.resize(image, (300, 300)), cv2.COLOR_BGR2RGB) for image in images])
         # Run the model
         out = self.main.session.run([self.num_detections,
                                      self.detection_scores,
                                      self.detection_boxes,
                                      self.detection_classes
                                      ],
-                                    feed_dict={'image_tensor:0': inp.reshape(1, inp.shape[0], inp.shape[1], 3)})
-        boxes = []
-        num_detections = int(out[0][0])
-        for i in range(num_detections):
-            class_id = int(out[3][0][i])
-            score = float(out[1][0][i])
-            bounding_box = [float(v) for v in out[2][0][i]]
-            if score > 0.7:
-                boxes.append({"class": class_id, "score": score, "box": bounding_box})
-        return boxes
+                                    feed_dict={'image_tensor:0': inp})
+        batch = []
+        for image_index in range(len(images)):
+            boxes = []
+            num_detections = int(out[0][image_index])
+            for i in range(num_detections):
+                class_id = int(out[3][image_index][i])
+                score = float(out[1][image_index][i])
+                bounding_box = [float(v) for v in out[2][image_index][i]]
+                if score > 0.7:
+                    boxes.append({"class": class_id, "score": score, "box": bounding_box})
+            batch.append(boxes)
+        return batch
 
     @abstractmethod
     def measurements(self, image, boxes) -> Tuple[Optional[float], Optional[float], Optional[list]]:
@@ -68,4 +195,4 @@ class NeuralTargetBase(ABC):
         for box in boxes:
             bounding_box = box['box']
             x1, x2, y1, y2 = utils.bounding_box_coords(bounding_box, image)
-            cv2.rectangle(image, (int(x1), int(y1)), (int(x2), int(y2)), (125, 255, 51), thickness=2)
+            utils.draw_rectangle(image, (int(x1), int(y1)), (int(x2), int(y2)), (125, 255, 51), 2)
@@ -1,10 +1,12 @@
 import atexit
 import logging
+from numbers import Real
 
 from networktables import NetworkTables
 
 import constants
 from file import File
+from profiler import Profiler
 
 
 class NT:
@@ -29,11 +31,12 @@ class NT:
     table
         - the table to which the variables will be sent and from which the variables will be received
     """
-    def __init__(self, name: str):
+    def __init__(self, name: str, server: str = None):
         """
         Create a networktables server, and create the vision table.
 
         :param name: The name of the target.
+        :param server: Address of the networktables server, derived from the team number if not given.
         """
         self.name = name
         self.prefix = '/vision/' + self.name + '_'
@@ -41,8 +44,8 @@ class NT:
         # The values file for the target, with a default value for when no such file exists
         self.file = File(self.name, '[NetworkTables Storage 3.0]\nstring "/vision/{}_name"={}',
                          'values', 'nt'.format(self.name, self.name))
-        # Server IP returned by get_nt_server()
-        server = self.get_nt_server()
+        # Server IP returned by get_nt_server(), unless another server was requested
+        server = server or self.get_nt_server()
         # Set update rate as defined in constants.py
         NetworkTables.setUpdateRate(constants.NT_RATE)
         logging.info('Initiating network tables connection with {}'.format(server))
@@ -50,15 +53,15 @@ class NT:
         NetworkTables.addConnectionListener(self.connection_listener, immediateNotify=True)
         # Create individual table instead of clogging SmartDashboard
         self.table = NetworkTables.getTable('vision')
+        # Local copy of subscribed values, updated by entry listeners
+        self.inputs = {}
 
-    @staticmethod
-    def get_nt_server():
+    def get_nt_server(self):
         """
         IP for networktables server.
         :return: IP corresponding to team number.
         """
-        # TODO: Make dynamic based on self.team_number
-        return '10.59.87.2'
+        return '10.{}.{}.2'.format(self.team_number // 100, self.team_number % 100)
 
     @staticmethod
     def connection_listener(connected, info):
@@ -81,6 +84,83 @@ class NT:
         """
         # TODO: Add self.prefix
         self.table.putValue(key, value)
+        # Entry listeners aren't notified of local changes, so subscribed values are updated here
+        if key in self.inputs:
+            self.inputs[key] = value
+
+    def set_packet(self, key, frame_id: int, timestamp: float, *measurements, additional_data=None):
+        """
+        Add a frame's measurements to SmartDashboard as a single number array, so they are always updated together.
+        Layout: [frame id, capture timestamp, (seen, angle, distance, field angle) for every target, additional data...]
+        Missing measurements are sent as NaN, and seen is 1 if an angle was measured, 0 otherwise.
+
+        :param key: The name the packet will be stored under.
+        :param frame_id: Number of the frame the measurements were taken from.
+        :param timestamp: Time the frame was captured, in seconds since the epoch.
+        :param measurements: Angle, distance and field angle tuples, one for every target.
+        :param additional_data: Additional numbers returned by the target, non numeric values are sent as NaN to keep
+        the layout.
+        """
+        packet = [frame_id, timestamp]
+        for angle, distance, field_angle in measurements:
+            packet.extend([angle is not None, angle, distance, field_angle])
+        if isinstance(additional_data, (list, tuple)):
+            packet.extend(value if isinstance(value, Real) else None for value in additional_data)
+        self.table.putNumberArray(key, [float('nan') if value is None else float(value) for value in packet])
+
+    def set_latencies(self, summaries: dict):
+        """
+        Add the latency percentiles of every stage to SmartDashboard, as [p50, p90, p99, max] in milliseconds.
+
+        :param summaries: Summary of every stage in seconds, as returned by report() in Metrics in metrics.py.
+        """
+        for stage, summary in summaries.items():
+            self.table.putNumberArray('latency_' + stage,
+                                      [summary[name] * 1000 for name in ('p50', 'p90', 'p99', 'max')])
+
+    def set_profile(self, result: dict):
+        """
+        Add the top functions of a profile to SmartDashboard, as 'profile_top' lines of milliseconds per frame spent in
+        each function (self/cumulative).
+
+        :param result: Summary of the profile, as in result of Profiler in profiler.py.
+        """
+        self.table.putStringArray('profile_top', Profiler.format(result['top']).split('\n'))
+
+    def subscribe(self, key, default_value=None):
+        """
+        Keep a local copy of a value from SmartDashboard, updated by an entry listener whenever it changes, and by
+        set_item() when it's changed locally. Subscribed values are read with get_inputs() without accessing the table.
+
+        :param key: The name the value is stored under.
+        :param default_value: The value kept until key holds one.
+        """
+        self.inputs[key] = self.table.getValue(key, default_value)
+        self.table.addEntryListener(self.input_listener, immediateNotify=True, key=key)
+
+    def input_listener(self, table, key, value, is_new):
+        """
+        Callback for when a subscribed value changes.
+        :param table: The table of the value.
+        :param key: The name the value is stored under.
+        :param value: The new value.
+        :param is_new: Whether the value was just created.
+        """
+        self.inputs[key] = value
+
+    def get_inputs(self) -> dict:
+        """
+        Get all subscribed values at once, so they don't change while a frame is processed.
+        :return: A copy of the subscribed values.
+        """
+        return dict(self.inputs)
+
+    @staticmethod
+    def flush():
+        """
+        Send all updated values immediately instead of waiting for the update rate.
+        """
+        NetworkTables.flush()
 
     def get_item(self, key, default_value):
         """
@@ -0,0 +1,183 @@
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+from threading import Thread
+
+import numpy as np
+from networktables import NetworkTables, NetworkTablesInstance
+
+import nt_handler
+
+logging.basicConfig(format='[%(levelname)s] %(message)s', level=logging.INFO)
+
+
+def get_args():
+    """
+    Add command line arguments.
+    :return: Parsed arguments
+    """
+    parser = argparse.ArgumentParser()
+    # Add address argument
+    parser.add_argument('-address', default='127.0.0.1', dest='address', help='Address to listen on', type=str)
+    # Add port argument
+    parser.add_argument('-port', default=1735, dest='port', help='Port to listen on', type=int)
+    # Add input script argument
+    parser.add_argument('-script', default=None, dest='script', type=str,
+                        help='JSON file of steps, each with a "time" in seconds and the inputs to set at that time')
+    # Add input argument
+    parser.add_argument('-set', default=[], dest='inputs', nargs='*', type=str,
+                        help='Inputs to set at start, formatted as key=value, e.g. target_type=cargoship or dump=true')
+    # Add benchmark argument
+    parser.add_argument('-benchmark', action='store_true', default=False,
+                        dest='benchmark',
+                        help='Benchmark publishing to the stand-in instead of waiting for a vision process')
+    # Add benchmark rates argument
+    parser.add_argument('-rates', default=[0.1, 0.05, 0.01, 0.005], dest='rates', nargs='*', type=float,
+                        help='Networktables update rates to benchmark')
+    # Add benchmark duration argument
+    parser.add_argument('-duration', default=5, dest='duration', help='Seconds to benchmark each rate', type=float)
+    # Add benchmark frame rate argument
+    parser.add_argument('-fps', default=60, dest='fps', help='Frames per second to publish', type=float)
+    # Add benchmark flush argument
+    parser.add_argument('-no-flush', action='store_false', default=True,
+                        dest='flush',
+                        help='Don\'t flush after every frame, rely on the update rate only')
+    return parser.parse_args()
+
+
+def parse_input(value: str):
+    """
+    Parse an input given as key=value, so numbers and booleans are set as such instead of as strings.
+    :param value: The input, e.g. game_piece=cargo, distance=1.5 or dump=true.
+    :return: The key and the value, parsed as JSON if possible.
+    """
+    key, value = value.split('=', 1)
+    try:
+        return key, json.loads(value)
+    except ValueError:
+        return key, value
+
+
+class RobotStandIn:
+    """
+    A local networktables server playing the role of the robot, for running the vision code without a roboRIO.
+    Sets the inputs the robot would set and measures how long measurement packets take to arrive.
+
+    Attributes
+    ----------
+
+    instance : NetworkTablesInstance
+        - a networktables instance separate from the one used by nt_handler.NT, running as a server
+    table
+        - the vision table, as seen by the robot
+    latencies : list
+        - seconds between capture and arrival for every received measurement packet
+    """
+
+    def __init__(self, address: str = '127.0.0.1', port: int = 1735):
+        """
+        Start the server.
+        :param address: Address to listen on.
+        :param port: Port to listen on.
+        """
+        self.instance = NetworkTablesInstance.create()
+        self.instance.startServer(persistFilename=os.path.join(tempfile.gettempdir(), 'nt_standin.ini'),
+                                  listenAddress=address, port=port)
+        logging.info('Stand-in networktables server on {}:{}'.format(address, port))
+        self.table = self.instance.getTable('vision')
+        self.latencies = []
+        self.table.addEntryListener(self.measurement_listener, key='measurements')
+
+    def measurement_listener(self, table, key, value, is_new):
+        """
+        Callback for when a measurement packet arrives.
+        See: set_packet() in NT in nt_handler.py
+        """
+        self.latencies.append(time.time() - value[1])
+
+    def set_inputs(self, inputs: dict):
+        """
+        Set values as the robot would, e.g. target_type and game_piece.
+        :param inputs: Keys and values to set.
+        """
+        for key, value in inputs.items():
+            logging.info('Setting {} to {}'.format(key, value))
+            self.table.putValue(key, value)
+        self.instance.flush()
+
+    def play(self, steps: list):
+        """
+        Set inputs at scripted times, in a thread.
+        :param steps: List of dictionaries, each with a "time" in seconds since playing and the inputs to set.
+        """
+        def run():
+            start = time.time()
+            for step in sorted(steps, key=lambda s: s['time']):
+                time.sleep(max(step['time'] - (time.time() - start), 0))
+                self.set_inputs({key: value for key, value in step.items() if key != 'time'})
+
+        Thread(target=run, daemon=True).start()
+
+    def stop(self):
+        """
+        Stop the server.
+        """
+        self.instance.stopServer()
+
+
+def benchmark(stand_in: RobotStandIn, address: str, rates: list, duration: float, fps: float, flush: bool):
+    """
+    Publish measurement packets through nt_handler.NT at a fixed frame rate, for every update rate.
+    Logs packet latency, received updates per second and the CPU time of the publishing thread. The stand-in's server
+    runs in this process too, so only the publish calls are timed.
+    """
+    nt = nt_handler.NT('benchmark', address)
+    time.sleep(1)  # Let the client connect
+    for rate in rates:
+        NetworkTables.setUpdateRate(rate)
+        stand_in.latencies = []
+        publish_times = []
+        frame_id = 0
+        cpu = 0
+        start = time.time()
+        while time.time() - start < duration:
+            frame_id += 1
+            publish_start = time.perf_counter()
+            cpu_start = time.thread_time()
+            nt.set_packet('measurements', frame_id, time.time(), (1.0, 2.0, 3.0))
+            if flush:
+                nt.flush()
+            cpu += time.thread_time() - cpu_start
+            publish_times.append(time.perf_counter() - publish_start)
+            time.sleep(max(frame_id / fps - (time.time() - start), 0))
+        time.sleep(rate * 2)  # Let the last updates arrive
+        latencies = np.array(stand_in.latencies) * 1000
+        if not latencies.size:
+            logging.warning('Rate {}: no packets received'.format(rate))
+            continue
+        logging.info('Rate {}: {} sent, {:.1f} received/s, latency p50 {:.2f} p90 {:.2f} p99 {:.2f} max {:.2f} ms, '
+                     'publish {:.3f} ms per frame, publish CPU {:.1f}%'.format(
+                         rate, frame_id, latencies.size / duration, *np.percentile(latencies, [50, 90, 99]),
+                         latencies.max(), np.mean(publish_times) * 1000, cpu / duration * 100))
+
+
+if __name__ == '__main__':
+    args = get_args()
+    robot = RobotStandIn(args.address, args.port)
+    robot.set_inputs(dict(parse_input(value) for value in args.inputs))
+    if args.script:
+        with open(args.script, 'r') as f:
+            robot.play(json.load(f))
+    if args.benchmark:
+        benchmark(robot, args.address, args.rates, args.duration, args.fps, args.flush)
+    else:
+        # Run until stopped, e.g. alongside main_2019.py -nt -nt-server 127.0.0.1
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+    robot.stop()
@@ -0,0 +1,74 @@
+import cv2
+import numpy as np
+
+
+class Overlay:
+    """
+    Records annotations as vector shapes instead of drawing them into the frame.
+    The shapes are sent to the web UI as JSON and drawn there on a canvas over the video stream, so the robot doesn't
+    spend time drawing and the streamed JPEG stays smaller.
+
+    Uses: Passed instead of the contour image to the drawing functions in utils.py.
+    See: draw_rectangle(), draw_contours(), draw_circle(), draw_text() in utils.py
+
+    Attributes
+    ----------
+
+    shape : tuple
+        - the shape of the frame the annotations belong to, so the overlay can be measured from like a frame
+    shapes : list
+        - the recorded shapes, as JSON-serializable dictionaries, colors in BGR like OpenCV
+    """
+
+    def __init__(self, shape: tuple):
+        """
+        :param shape: The shape of the frame the annotations belong to.
+        """
+        self.shape = shape
+        self.shapes = []
+
+    def rectangle(self, pt1, pt2, color, thickness: int):
+        self.shapes.append({'type': 'rectangle', 'points': [[int(v) for v in pt1], [int(v) for v in pt2]],
+                            'color': [int(c) for c in color], 'thickness': int(thickness)})
+
+    def contours(self, contours: list, color, thickness: int):
+        for cnt in contours:
+            self.shapes.append({'type': 'polygon', 'points': np.asarray(cnt).reshape(-1, 2).astype(int).tolist(),
+                                'color': [int(c) for c in color], 'thickness': int(thickness)})
+
+    def circle(self, center, radius, color, thickness: int):
+        self.shapes.append({'type': 'circle', 'center': [int(v) for v in center], 'radius': int(radius),
+                            'color': [int(c) for c in color], 'thickness': int(thickness)})
+
+    def text(self, text: str, org, scale: float, color, thickness: int):
+        self.shapes.append({'type': 'text', 'text': text, 'point': [int(v) for v in org], 'scale': float(scale),
+                            'color': [int(c) for c in color], 'thickness': int(thickness)})
+
+    def data(self) -> dict:
+        """
+        :return: The frame size and recorded shapes, JSON-serializable.
+        """
+        return {'width': self.shape[1], 'height': self.shape[0], 'shapes': self.shapes}
+
+    def render(self, image: np.array) -> np.array:
+        """
+        Draw the recorded shapes into an image, for local display and recording.
+        :param image: Frame to draw on.
+        :return: The frame with the shapes drawn.
+        """
+        for shape in self.shapes:
+            color = tuple(shape['color'])
+            if shape['type'] == 'rectangle':
+                cv2.rectangle(image, tuple(shape['points'][0]), tuple(shape['points'][1]), color, shape['thickness'])
+            elif shape['type'] == 'polygon':
+                cv2.polylines(image, [np.array(shape['points'], dtype=np.int32)], True, color, shape['thickness'])
+            elif shape['type'] == 'circle':
+                cv2.circle(image, tuple(shape['center']), shape['radius'], color, shape['thickness'])
+            elif shape['type'] == 'text':
+                cv2.putText(image, shape['text'], tuple(shape['point']), cv2.FONT_HERSHEY_SIMPLEX, shape['scale'],
+                            color, shape['thickness'], cv2.LINE_AA)
+        return image
+
+
+if __name__ == "__main__":
+    help(Overlay)
@@ -2,6 +2,8 @@ import logging
 import time
 from threading import Thread
 
+from tracing import tracer
+
 
 class PICamera(Thread):
     """
@@ -19,6 +21,8 @@ class PICamera(Thread):
         - a flag indicating the run's shut down
     frame
         - the current frame read from self.camera
+    frame_number : int
+        - the number of frames read from self.camera, used for counting frames that were never processed
     """
     def __init__(self, exposure=0, contrast=7, framerate=32, resolution=(320, 240)):
         """
@@ -40,9 +44,10 @@ class PICamera(Thread):
         self.rawCapture = PiRGBArray(self.camera, size=resolution)
         self.exit = False
         self.frame = None
+        self.frame_number = 0
         logging.info('Contrast: {} Exposure: {} FPS: {}'.format(contrast, exposure, framerate))
         time.sleep(0.1)  # Sleep to let the camera warm up
-        super().__init__(daemon=True)  # Initialize thread
+        super().__init__(daemon=True, name='camera')  # Initialize thread
 
     def run(self):
         """
@@ -53,8 +58,10 @@ class PICamera(Thread):
         for frame in self.camera.capture_continuous(self.rawCapture, format='bgr', use_video_port=True):
             if self.exit:
                 break
-            self.frame = frame.array
-            self.rawCapture.truncate(0)
+            with tracer.span('capture', frame_number=self.frame_number + 1):
+                self.frame = frame.array
+                self.frame_number += 1
+                self.rawCapture.truncate(0)
 
     def release(self):
         """
@@ -0,0 +1,218 @@
+import cProfile
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+import constants
+
+
+class Profiler:
+    """
+    Profiles the vision loop on demand, for a number of frames or seconds, without restarting the process.
+
+    A profile is requested from the web UI or by the robot over networktables, and started by the loop at its next
+    frame, since cProfile only profiles the thread it's enabled on. The sampling mode instead samples the loop's stack
+    from its own thread, which slows the loop down less. Nothing runs between profiles, the loop only checks whether one
+    was requested.
+    Profiles are written to the logs folder, as .pstats for cProfile or as collapsed stacks for flame graphs when
+    sampling, and summarized as the functions the loop spent the most time in.
+
+    See: profile() in Web in web.py, set_profile() in NT in nt_handler.py
+
+    Attributes
+    ----------
+
+    requested : dict
+        - the mode, frames and seconds of the profile to start at the next frame, None if none was requested
+    running : dict
+        - the mode, frames and seconds of the current profile, None once it's written
+    active : bool
+        - whether the loop is being profiled
+    frames : int
+        - the number of frames profiled so far
+    result : dict
+        - the file and top functions of the last profile
+    """
+
+    MODES = ['cprofile', 'sampling']
+
+    def __init__(self):
+        self.requested = None
+        self.running = None
+        self.active = False
+        self.frames = 0
+        self.start_time = 0
+        self.profile = None
+        self.sampler = None
+        self.sampling = threading.Event()
+        self.result = None
+        self.lock = threading.Lock()
+
+    def request(self, mode: str = 'cprofile', frames: int = None, seconds: float = None):
+        """
+        Request a profile of the next frames. Returns right away.
+        :param mode: 'cprofile' or 'sampling'.
+        :param frames: Number of frames to profile.
+        :param seconds: Seconds to profile for, if frames isn't given. Both default to constants.PROFILER_FRAMES frames.
+        """
+        if mode not in self.MODES:
+            raise ValueError('Unknown profiling mode {}'.format(mode))
+        if frames is not None and frames < 1 or \
+                seconds is not None and not 0 < seconds <= constants.PROFILER_MAX_SECONDS:
+            raise ValueError('Frames must be positive, and seconds up to {}'.format(constants.PROFILER_MAX_SECONDS))
+        if frames is None and seconds is None:
+            frames = constants.PROFILER_FRAMES
+        with self.lock:
+            if self.requested or self.running:
+                raise ValueError('Already profiling')
+            self.requested = {'mode': mode, 'frames': frames, 'seconds': seconds}
+        logging.info('Profiling requested: {}'.format(self.requested))
+
+    def frame(self):
+        """
+        Start a requested profile, or count a profiled frame and stop when done. Called by the loop at the start of
+        every frame.
+        """
+        if self.active:
+            self.frames += 1
+            frames, seconds = self.running['frames'], self.running['seconds']
+            # Profiles are capped in time in case the loop stalls
+            if frames is not None and self.frames >= frames or time.time() - self.start_time >= \
+                    (seconds if seconds is not None else constants.PROFILER_MAX_SECONDS):
+                self.stop()
+        elif self.requested and not self.running:
+            self.start()
+
+    def start(self):
+        """
+        Start the requested profile on the calling thread.
+        """
+        with self.lock:
+            self.running, self.requested = self.requested, None
+        self.frames = 0
+        self.start_time = time.time()
+        self.active = True
+        if self.running['mode'] == 'cprofile':
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        else:
+            self.sampling.set()
+            self.sampler = threading.Thread(target=self.sample, args=(threading.get_ident(),), daemon=True,
+                                            name='profiler')
+            self.sampler.start()
+
+    def stop(self):
+        """
+        Stop profiling, and write and summarize the profile off the loop's thread.
+        """
+        duration = time.time() - self.start_time
+        self.active = False
+        if self.profile:
+            self.profile.disable()
+            threading.Thread(target=self.write_profile, args=(self.profile, self.frames, duration),
+                             daemon=True).start()
+            self.profile = None
+        else:
+            # The sampler writes its stacks when it stops
+            self.sampling.clear()
+
+    def sample(self, thread_id: int):
+        """
+        Sample the stack of a thread every constants.PROFILER_SAMPLE_INTERVAL seconds until stopped, and write it.
+        :param thread_id: Id of the thread to sample.
+        """
+        stacks = Counter()
+        start = time.time()
+        while self.sampling.is_set():
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('{}:{}'.format(os.path.basename(code.co_filename), code.co_name))
+                frame = frame.f_back
+            if stack:
+                stacks[';'.join(reversed(stack))] += 1
+            time.sleep(constants.PROFILER_SAMPLE_INTERVAL)
+        self.write_samples(stacks, self.frames, time.time() - start)
+
+    @staticmethod
+    def filename(extension: str) -> str:
+        """
+        :return: A new file in the logs folder.
+        """
+        folder = 'logs'
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        return os.path.join(folder, 'profile-{}.{}'.format(time.strftime('%d-%m-%Y-%H-%M-%S'), extension))
+
+    def write_profile(self, profile: cProfile.Profile, frames: int, duration: float):
+        """
+        Write a cProfile profile, and summarize the functions with the most time spent in them.
+        """
+        filename = self.filename('pstats')
+        profile.dump_stats(filename)
+        stats = pstats.Stats(profile).stats
+        top = sorted(stats.items(), key=lambda item: item[1][2], reverse=True)[:constants.PROFILER_TOP]
+        self.finish(filename, frames, duration, [
+            {'function': '{}:{}({})'.format(os.path.basename(file), line, name), 'calls': calls,
+             'self': own / max(frames, 1), 'cumulative': cumulative / max(frames, 1)}
+            for (file, line, name), (_, calls, own, cumulative, _) in top])
+
+    def write_samples(self, stacks: Counter, frames: int, duration: float):
+        """
+        Write sampled stacks in the collapsed format of flamegraph.pl and speedscope, and summarize the functions most
+        samples were in.
+        """
+        filename = self.filename('collapsed')
+        with open(filename, 'w') as f:
+            f.writelines('{} {}\n'.format(stack, count) for stack, count in stacks.most_common())
+        own, cumulative = Counter(), Counter()
+        for stack, count in stacks.items():
+            functions = stack.split(';')
+            own[functions[-1]] += count
+            # Recursive functions are counted once per sample
+            for function in set(functions):
+                cumulative[function] += count
+        # Seconds per frame of a sample
+        scale = duration / max(sum(stacks.values()), 1) / max(frames, 1)
+        self.finish(filename, frames, duration, [
+            {'function': function, 'samples': count, 'self': count * scale, 'cumulative': cumulative[function] * scale}
+            for function, count in own.most_common(constants.PROFILER_TOP)])
+
+    def finish(self, filename: str, frames: int, duration: float, top: list):
+        """
+        Keep and log the summary of a written profile, and allow the next one.
+        :param filename: The profile file.
+        :param frames: Number of frames profiled.
+        :param duration: Seconds profiled.
+        :param top: The functions with the most time spent in them, times in seconds per frame.
+        """
+        self.result = {'file': filename, 'mode': self.running['mode'], 'frames': frames, 'seconds': duration,
+                       'top': top}
+        logging.info('Profile of {} frames written to {}, ms per frame (self/cumulative):\n{}'.format(
+            frames, os.path.abspath(filename), self.format(top)))
+        with self.lock:
+            self.running = None
+
+    @staticmethod
+    def format(top: list) -> str:
+        """
+        :param top: Functions as summarized in result.
+        :return: A line for every function.
+        """
+        return '\n'.join('{:8.3f} {:8.3f}  {}'.format(function['self'] * 1000, function['cumulative'] * 1000,
+                                                      function['function']) for function in top)
+
+    def state(self) -> dict:
+        """
+        :return: The requested and running profiles, and the summary of the last one.
+        """
+        return {'requested': self.requested, 'running': self.running, 'result': self.result}
+
+
+if __name__ == "__main__":
+    help(Profiler)
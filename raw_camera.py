@@ -0,0 +1,154 @@
+import logging
+import time
+from threading import Thread, Condition
+
+import numpy as np
+
+import constants
+import utils
+from tracing import tracer
+from raw_recording import RawReader
+
+
+class RawCamera(Thread):
+    """
+    Camera provider that replays a raw recording, so the loop runs on exactly the frames the camera captured.
+    Frames are played at the rate they were recorded at, and depth is available like with a RealSense if it was
+    recorded. Like with a RealSense, reading frame waits for the next frame, so no frame is processed twice.
+    Extends the threading.Thread class.
+
+    See: RawWriter in raw_recording.py
+
+    Attributes
+    ----------
+
+    reader : RawReader
+        - the recording being replayed
+    loop : bool
+        - whether to start over at the end of the recording
+    exit : bool
+        - a flag indicating the run's shut down
+    current : tuple
+        - the sequence number, recorded frame id, frame and raw depth frame last replayed, published together so a frame
+          is never paired with another frame's depth
+    depth_frame
+        - the depth frame of the last frame read, in raw units, None if not recorded
+    frame_number : int
+        - the recorded frame id of the last frame read, used for counting frames that were never processed
+    """
+    def __init__(self, filename: str, loop: bool = True):
+        """
+        :param filename: Raw recording to replay.
+        :param loop: Whether to start over at the end of the recording.
+        """
+        self.reader = RawReader(filename)
+        self.loop = loop
+        self.exit = False
+        self.current = None
+        self.condition = Condition()
+        self.sequence = 0
+        self.depth_frame = None
+        self.frame_number = 0
+        logging.info('Replaying {} frames from {}'.format(len(self.reader), filename))
+        super().__init__(daemon=True, name='camera')
+
+    def run(self):
+        """
+        Implementation of "abstract" Thread run method, replays the frames at the times they were recorded.
+        """
+        sequence = 0
+        while not self.exit:
+            start = time.time()
+            first_timestamp = None
+            for position in range(len(self.reader)):
+                if self.exit:
+                    return
+                frame_id, timestamp, frame, depth = self.reader[position]
+                if first_timestamp is None:
+                    first_timestamp = timestamp
+                time.sleep(max(start + timestamp - first_timestamp - time.time(), 0))
+                # Copied out of the file, since the loop may draw on the frame
+                with tracer.span('replay', frame_number=frame_id):
+                    sequence += 1
+                    current = (sequence, frame_id, np.array(frame), None if depth is None else np.array(depth))
+                with self.condition:
+                    self.current = current
+                    self.condition.notify_all()
+            if not self.loop:
+                break
+
+    @property
+    def frame(self):
+        """
+        Wait for the next replayed frame, and keep its depth and frame id for the loop.
+        :return: The frame, None if no new frame was replayed within constants.RAW_CAMERA_TIMEOUT, e.g. at the end.
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.current is not None and self.current[0] != self.sequence,
+                                           constants.RAW_CAMERA_TIMEOUT):
+                return None
+            self.sequence, self.frame_number, frame, self.depth_frame = self.current
+        return frame
+
+    def release(self):
+        """
+        Stop replaying. Raise exit flag.
+        """
+        self.exit = True
+
+    def set_exposure(self, exposure: int):
+        """
+        Dry method to match those in other cameras, the exposure is part of the recording.
+        """
+        pass
+
+    def get_resolution(self):
+        """
+        :return: The resolution of the recorded frames.
+        """
+        return self.reader.resolution
+
+    @property
+    def depth_scale(self) -> float:
+        """
+        :return: Meters per recorded depth unit.
+        """
+        return self.reader.depth_scale
+
+    def get_raw_depth(self) -> np.array:
+        """
+        :return: The recorded depth frame in raw units, None if not recorded.
+        """
+        return self.depth_frame
+
+    def get_depth_array(self) -> np.array:
+        """
+        :return: The recorded depth frame as an array of distances in meters, None if not recorded.
+        """
+        if self.depth_frame is None:
+            return None
+        return self.depth_frame * self.reader.depth_scale
+
+    def get_distance(self, x, y):
+        """
+        :param x: X coordinate of the pixel.
+        :param y: Y coordinate of the pixel.
+        :return: The recorded distance of the pixel, in meters. 0 if depth wasn't recorded, like invalid depth.
+        """
+        if self.depth_frame is None:
+            return 0.0
+        return float(self.depth_frame[int(y), int(x)]) * self.reader.depth_scale
+
+    def get_region_distance(self, x1, y1, x2, y2, step: int = 5):
+        """
+        Distance statistics of a region, as in RealSense. None, None if depth wasn't recorded.
+        See: get_region_distance() in RealSense in realsense.py
+        """
+        depth = self.get_raw_depth()
+        if depth is None:
+            return None, None
+        return utils.region_depth_stats(depth, x1, y1, x2, y2, step, scale=self.reader.depth_scale)
+
+
+if __name__ == "__main__":
+    help(RawCamera)
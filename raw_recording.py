@@ -0,0 +1,210 @@
+import argparse
+import logging
+import os
+import time
+
+import numpy as np
+
+import constants
+
+# Fixed size header at the start of the file, followed by the index and the frame slots
+HEADER = np.dtype([('magic', 'S8'), ('width', '<u4'), ('height', '<u4'), ('depth_width', '<u4'),
+                   ('depth_height', '<u4'), ('slots', '<u4'), ('depth_scale', '<f8'), ('count', '<u8')])
+HEADER_SIZE = 64
+MAGIC = b'RAWREC1'
+# One index entry per slot
+INDEX = np.dtype([('frame_id', '<i8'), ('timestamp', '<f8'), ('has_depth', 'u1')])
+# Slots start on a page boundary, so a frame's pages are never shared with the index
+PAGE_SIZE = 4096
+
+
+def layout(width: int, height: int, depth_width: int, depth_height: int, slots: int) -> (int, int, int):
+    """
+    :return: Offset of the first slot, size of a slot and size of the file in bytes.
+    """
+    data_offset = -(-(HEADER_SIZE + INDEX.itemsize * slots) // PAGE_SIZE) * PAGE_SIZE
+    slot_size = width * height * 3 + depth_width * depth_height * 2
+    return data_offset, slot_size, data_offset + slot_size * slots
+
+
+def views(memory: np.memmap, header) -> (np.array, np.array, np.array):
+    """
+    :param memory: The whole file, mapped as bytes.
+    :param header: The file's header.
+    :return: The index, and the color and depth planes of all slots, all backed by the mapped file.
+    """
+    width, height, depth_width, depth_height, slots = (int(header[name]) for name in
+                                                       ('width', 'height', 'depth_width', 'depth_height', 'slots'))
+    data_offset, slot_size, _ = layout(width, height, depth_width, depth_height, slots)
+    index = np.ndarray((slots,), INDEX, memory, HEADER_SIZE)
+    color = np.ndarray((slots, height, width, 3), np.uint8, memory, data_offset, (slot_size, width * 3, 3, 1))
+    depth = np.ndarray((slots, depth_height, depth_width), '<u2', memory, data_offset + width * height * 3,
+                       (slot_size, depth_width * 2, 2))
+    return index, color, depth
+
+
+class RawWriter:
+    """
+    Records raw frames losslessly to a memory-mapped ring file, so HSV values can be tuned on replays that match the
+    live camera exactly.
+    The file holds a fixed number of frame slots, each with a color plane and an optional depth plane, and an index of
+    frame id and capture timestamp. When all slots are used, the oldest frames are overwritten.
+
+    Frames are copied once, straight from the provider's buffer into the mapped pages, with no encoding. The kernel
+    writes the pages to disk in the background.
+
+    See: RawReader, RawCamera in raw_camera.py
+
+    Attributes
+    ----------
+
+    filename : str
+        - the file being recorded to
+    header : np.array
+        - the file's header, backed by the mapped file
+    index : np.array
+        - frame id, capture timestamp and whether depth was recorded, for every slot
+    color : np.array
+        - the color planes of all slots
+    depth : np.array
+        - the depth planes of all slots, raw camera units
+    """
+
+    def __init__(self, filename: str, resolution: tuple, depth_resolution: tuple = None, depth_scale: float = 0,
+                 slots: int = constants.RAW_RECORDING_SLOTS):
+        """
+        Create the file, allocating all of its slots.
+        :param filename: File to record to.
+        :param resolution: Width and height of the color frames.
+        :param depth_resolution: Width and height of the depth frames, None to record color only.
+        :param depth_scale: Meters per depth unit.
+        :param slots: Number of frames the file holds.
+        """
+        self.filename = filename
+        width, height = resolution
+        depth_width, depth_height = depth_resolution or (0, 0)
+        _, _, size = layout(width, height, depth_width, depth_height, slots)
+        folder = os.path.dirname(filename)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        with open(filename, 'wb') as f:
+            try:
+                # Allocate the blocks up front so writing a frame never waits for the file system
+                os.posix_fallocate(f.fileno(), 0, size)
+            except (AttributeError, OSError):
+                f.truncate(size)
+        self.memory = np.memmap(filename, np.uint8, 'r+', shape=(size,))
+        self.header = np.ndarray((), HEADER, self.memory, 0)
+        self.header[()] = (MAGIC, width, height, depth_width, depth_height, slots, depth_scale, 0)
+        self.index, self.color, self.depth = views(self.memory, self.header)
+        self.slots = slots
+        self.count = 0
+        logging.info('Raw recording to {}: {} slots, {:.0f} MB'.format(filename, slots, size / 2 ** 20))
+
+    def write(self, frame_id: int, timestamp: float, frame: np.array, depth: np.array = None):
+        """
+        Write a frame into the next slot.
+        :param frame_id: Id of the frame in the loop.
+        :param timestamp: Capture time of the frame.
+        :param frame: Color frame, at the recorded resolution.
+        :param depth: Depth frame in raw camera units, at the recorded depth resolution, None if not available.
+        """
+        slot = self.count % self.slots
+        np.copyto(self.color[slot], frame)
+        has_depth = depth is not None and self.depth.shape[1] > 0
+        if has_depth:
+            np.copyto(self.depth[slot], depth)
+        # The index and count are written last, so a reader never sees a slot before its data
+        self.index[slot] = (frame_id, timestamp, has_depth)
+        self.count += 1
+        self.header['count'] = self.count
+
+    def close(self):
+        """
+        Write the remaining pages to disk and unmap the file.
+        """
+        self.memory.flush()
+        logging.info('Raw recording {} closed with {} frames'.format(self.filename, min(self.count, self.slots)))
+        del self.index, self.color, self.depth, self.header
+        self.memory = None
+
+
+class RawReader:
+    """
+    Reads frames recorded by RawWriter, by position from the oldest frame still in the file.
+
+    Attributes
+    ----------
+
+    resolution : tuple
+        - width and height of the color frames
+    depth_scale : float
+        - meters per depth unit
+    """
+
+    def __init__(self, filename: str):
+        """
+        :param filename: File recorded by RawWriter.
+        """
+        self.memory = np.memmap(filename, np.uint8, 'r')
+        self.header = np.ndarray((), HEADER, self.memory, 0)
+        if self.header['magic'][()] != MAGIC:
+            raise ValueError('{} is not a raw recording'.format(filename))
+        self.index, self.color, self.depth = views(self.memory, self.header)
+        self.resolution = (int(self.header['width']), int(self.header['height']))
+        self.depth_scale = float(self.header['depth_scale'])
+        self.slots = int(self.header['slots'])
+
+    def __len__(self) -> int:
+        return min(int(self.header['count']), self.slots)
+
+    def __getitem__(self, position: int) -> (int, float, np.array, np.array):
+        """
+        :param position: Position of the frame, 0 for the oldest.
+        :return: Frame id, capture timestamp, color frame and depth frame (None if not recorded). The frames are views
+        of the mapped file, read from disk when used.
+        """
+        length = len(self)
+        if not -length <= position < length:
+            raise IndexError('Frame {} not in recording of {} frames'.format(position, length))
+        slot = (int(self.header['count']) - length + position % length) % self.slots
+        frame_id, timestamp, has_depth = self.index[slot]
+        return int(frame_id), float(timestamp), self.color[slot], self.depth[slot] if has_depth else None
+
+
+def get_args():
+    """
+    Add command line arguments.
+    :return: Parsed arguments
+    """
+    parser = argparse.ArgumentParser()
+    # Add file argument
+    parser.add_argument('-file', default='recordings/benchmark.raw', dest='file', help='File to record to', type=str)
+    # Add frames argument
+    parser.add_argument('-frames', default=600, dest='frames', help='Number of frames to write', type=int)
+    # Add FPS argument
+    parser.add_argument('-fps', default=60, dest='fps', help='Frame rate to write at', type=float)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    # Checks that recording keeps up with the RealSense's 60 FPS color and depth streams on this disk
+    args = get_args()
+    color = np.random.randint(0, 255, (240, 424, 3), dtype=np.uint8)
+    depth = np.random.randint(0, 10000, (240, 424), dtype=np.uint16)
+    writer = RawWriter(args.file, (424, 240), (424, 240), 0.001, args.frames)
+    durations = []
+    start = time.perf_counter()
+    for i in range(args.frames):
+        frame_start = time.perf_counter()
+        writer.write(i, time.time(), color, depth)
+        durations.append(time.perf_counter() - frame_start)
+        time.sleep(max(start + (i + 1) / args.fps - time.perf_counter(), 0))
+    elapsed = time.perf_counter() - start
+    flush_start = time.perf_counter()
+    writer.close()
+    print('Wrote {} frames at {:.1f} FPS, write p50 {:.2f} ms p99 {:.2f} ms max {:.2f} ms, flush {:.2f} s'.format(
+        args.frames, args.frames / elapsed, *(np.percentile(durations, [50, 99, 100]) * 1000),
+        time.perf_counter() - flush_start))
+    reader = RawReader(args.file)
+    assert len(reader) == args.frames and np.array_equal(reader[-1][2], color) and np.array_equal(reader[-1][3], depth)
@@ -4,6 +4,8 @@ import time
 import numpy as np
 
 import constants
+import utils
+from tracing import tracer
 
 
 class RealSense:
@@ -26,6 +28,8 @@ class RealSense:
         - used for resizing the depth frame
     prof : pyrealsense2.pipeline.start
         - used for accessing camera settings such as exposure
+    frame_number : int
+        - the camera's number of the last frame, used for counting frames that were never processed
 
     """
     def __init__(self, serial_number: str = None, rotated_vertical: bool = False, rotated_horizontal: bool = False,
@@ -51,6 +55,8 @@ class RealSense:
 
         start = time.perf_counter()
         self.prof = self.pipeline.start(config)
+        # Meters per depth unit, used for reading the raw depth data
+        self.depth_scale = self.prof.get_device().first_depth_sensor().get_depth_scale()
         logging.info('[{}] Took {:.3f} seconds to start pipeline'.format(self.name, time.perf_counter() - start))
 
         self.rs_options = rs.option
@@ -60,6 +66,7 @@ class RealSense:
         self.rotated_horizontal = rotated_horizontal
 
         self.color_frame = None
+        self.frame_number = 0
 
     @property
     def frame(self):
@@ -68,11 +75,14 @@ class RealSense:
         Receives both the coloured frame and the depth frame from the pipeline and stores them in class variables.
         :return: The coloured frame.
         """
-        frames = self.pipeline.wait_for_frames()
-        frames = self.align.process(frames)  # Align depth frame to size of depth frame
+        with tracer.span('capture'):
+            frames = self.pipeline.wait_for_frames()
+        with tracer.span('align'):
+            frames = self.align.process(frames)  # Align depth frame to size of depth frame
         depth_frame = frames.get_depth_frame()
         self.depth_frame = depth_frame.as_depth_frame()
         color_frame = frames.get_color_frame()
+        self.frame_number = color_frame.get_frame_number()
         color_image = np.asanyarray(color_frame.get_data())
         self.color_frame = color_image
         return color_image
@@ -124,6 +134,37 @@ class RealSense:
                 return self.depth_frame.get_distance(y, self.get_resolution()[1] - x)
         return self.depth_frame.get_distance(x, y)
 
+    def get_depth_array(self) -> np.array:
+        """
+        :return: The depth frame as an array of distances in meters, oriented like the coloured frame.
+        """
+        # Matches get_distance, where pixel (x, y) is read from (y, height - x) when rotated vertically
+        return self.get_raw_depth() * self.depth_scale
+
+    def get_raw_depth(self) -> np.array:
+        """
+        :return: The depth frame in raw units, oriented like the coloured frame, without copying it.
+        See: depth_scale
+        """
+        depth = np.asanyarray(self.depth_frame.get_data())
+        if self.rotated_horizontal:
+            return depth[::-1, ::-1]
+        elif self.rotated_vertical:
+            return depth[::-1, :].T
+        return depth
+
+    def get_region_distance(self, x1, y1, x2, y2, step: int = 5):
+        """
+        Distance statistics of a region, read directly from the depth data instead of pixel by pixel.
+        :param x1: Left X coordinate of the region.
+        :param y1: Top Y coordinate of the region.
+        :param x2: Right X coordinate of the region.
+        :param y2: Bottom Y coordinate of the region.
+        :param step: Distance in pixels between sampled points.
+        :return: Median and trimmed mean of the valid distances in the region, None if there are none.
+        """
+        return utils.region_depth_stats(self.get_raw_depth(), x1, y1, x2, y2, step, scale=self.depth_scale)
+
 
 if __name__ == "__main__":
     help(RealSense)
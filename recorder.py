@@ -0,0 +1,184 @@
+import json
+import logging
+import os
+import queue
+import time
+from threading import Event, Thread
+
+import cv2
+
+import constants
+from tracing import tracer
+
+
+class Recorder(Thread):
+    """
+    Writes recorded frames to video files in its own thread, so encoding never runs in the vision loop.
+    Frames are handed over through a bounded queue. When the writer falls behind, new frames are dropped and counted
+    instead of slowing down the loop.
+
+    The frame rate is measured from the first frames and the size is taken from the frames themselves, and files are
+    rotated when they get too big or too long, or when the frame size changes.
+
+    Every video file has a sidecar file next to it, recordings/title.jsonl, with a JSON line for every frame written:
+    its position in the video, and the frame id, capture timestamp, HSV values, target, inputs, detections and
+    measurements the loop passed with it. Frames and their lines are queued and dropped together, so they always match.
+    See: sidecar_diff.py
+
+    Uses: Created by Display when recording starts.
+    See: start_recording(), stop_recording(), process_frame() in Display in display.py
+
+    Attributes
+    ----------
+
+    title : str
+        - the title of the recording, files are saved as recordings/title.avi, recordings/title-1.avi and so on
+    codec
+        - fourcc code to pass to the video writer
+    frames : queue.Queue
+        - frames waiting to be written, with the time they were recorded at and their sidecar data
+    dropped : int
+        - the number of frames dropped because the queue was full
+    stopping : Event
+        - set when the recording is stopped, the writer ends once the queue is empty
+    written : int
+        - the number of frames written
+    """
+
+    def __init__(self, title: str, codec, queue_size: int = constants.RECORDING_QUEUE_SIZE,
+                 max_bytes: int = constants.RECORDING_MAX_BYTES, max_seconds: float = constants.RECORDING_MAX_SECONDS):
+        """
+        :param title: The title under which the recording files are saved.
+        :param codec: fourcc code to pass to the video writer.
+        :param queue_size: Number of frames that can wait to be written before frames are dropped.
+        :param max_bytes: Size of a file after which a new one is started.
+        :param max_seconds: Duration of a file after which a new one is started.
+        """
+        super().__init__(daemon=True, name='recorder')
+        self.title = title
+        self.codec = codec
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.written = 0
+        self.stopping = Event()
+        self.out = None
+        self.sidecar = None
+        self.position = 0
+        self.filename = None
+        self.part = 0
+        self.fps = None
+        self.size = None
+        self.file_start = 0
+
+    def write(self, frame, data: dict = None):
+        """
+        Queue a frame for writing, or drop it if the writer is behind. Never blocks.
+        :param frame: Frame to record. It must not be changed afterwards.
+        :param data: The frame's results for the sidecar file, JSON-serializable apart from numpy numbers. It must not
+        be changed afterwards.
+        """
+        try:
+            self.frames.put_nowait((time.time(), frame, data))
+        except queue.Full:
+            self.dropped += 1
+
+    def stop(self, wait: bool = False):
+        """
+        Finish writing the queued frames and close the file. Never blocks unless waiting.
+        :param wait: Whether to wait until the file is closed.
+        """
+        self.stopping.set()
+        # Wakes the writer if it's waiting for a frame, a full queue means it isn't
+        try:
+            self.frames.put_nowait(None)
+        except queue.Full:
+            pass
+        if wait:
+            self.join()
+
+    def run(self):
+        # Frames held until the frame rate is measured
+        pending = []
+        while not (self.stopping.is_set() and self.frames.empty()):
+            item = self.frames.get()
+            if item is None:
+                continue
+            if self.fps is None:
+                pending.append(item)
+                if len(pending) < constants.RECORDING_FPS_FRAMES:
+                    continue
+                self.fps = self.measure_fps(pending)
+                for pending_item in pending:
+                    self.write_frame(*pending_item)
+                pending = []
+            else:
+                self.write_frame(*item)
+        # A recording shorter than the frames the frame rate is measured from
+        if pending:
+            self.fps = self.measure_fps(pending)
+            for pending_item in pending:
+                self.write_frame(*pending_item)
+        self.close()
+        logging.info('Recording {} finished: {} frames written, {} dropped'.format(self.title, self.written,
+                                                                                   self.dropped))
+
+    @staticmethod
+    def measure_fps(frames: list) -> float:
+        """
+        :param frames: Recorded frames, with the time they were recorded at first.
+        :return: The frame rate they were recorded at, 30 if it can't be measured.
+        """
+        duration = frames[-1][0] - frames[0][0]
+        if len(frames) < 2 or duration <= 0:
+            return 30.0
+        return (len(frames) - 1) / duration
+
+    def write_frame(self, timestamp: float, frame, data: dict = None):
+        """
+        Write a frame and its sidecar line, starting a new file first if needed.
+        """
+        size = (frame.shape[1], frame.shape[0])
+        if self.out is None or size != self.size or timestamp - self.file_start > self.max_seconds or \
+                (os.path.isfile(self.filename) and os.path.getsize(self.filename) > self.max_bytes):
+            self.open(size, timestamp)
+        with tracer.span('record', frame_id=(data or {}).get('frame_id'), position=self.position):
+            self.out.write(frame)
+            # Numpy numbers are written as floats
+            self.sidecar.write(json.dumps(dict(data or {}, position=self.position), default=float) + '\n')
+        self.position += 1
+        self.written += 1
+
+    def open(self, size: tuple, timestamp: float):
+        """
+        Close the current file and start the next one.
+        :param size: Width and height of the frames.
+        :param timestamp: The time the file's first frame was recorded at.
+        """
+        self.close()
+        if not os.path.isdir('recordings'):
+            os.makedirs('recordings')
+        self.filename = 'recordings/{}{}.avi'.format(self.title, '-{}'.format(self.part) if self.part else '')
+        self.part += 1
+        self.size = size
+        self.file_start = timestamp
+        logging.info('Recording to {} at {:.1f} FPS, {}x{}'.format(self.filename, self.fps, *size))
+        self.out = cv2.VideoWriter(self.filename, self.codec, self.fps, size)
+        self.sidecar = open(self.filename[:-len('.avi')] + '.jsonl', 'w')
+        self.position = 0
+
+    def close(self):
+        """
+        Release the video writer, saving the current file.
+        """
+        if self.out:
+            logging.info('Releasing video recorder')
+            self.out.release()
+            self.out = None
+            self.sidecar.close()
+            self.sidecar = None
+
+
+if __name__ == "__main__":
+    help(Recorder)
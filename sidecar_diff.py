@@ -0,0 +1,98 @@
+import argparse
+import json
+import math
+from collections import Counter
+
+
+def get_args():
+    """
+    Add command line arguments.
+    :return: Parsed arguments
+    """
+    parser = argparse.ArgumentParser(description='Compare the results of two recordings or replays frame by frame')
+    # Add sidecar files arguments
+    parser.add_argument('expected', help='Sidecar file of the original run, e.g. recordings/match.jsonl', type=str)
+    parser.add_argument('actual', help='Sidecar file of the run to compare', type=str)
+    # Add key argument
+    parser.add_argument('-key', default='frame_id', dest='key', type=str, choices=['frame_id', 'position'],
+                        help='Field frames are matched by, position to match frames of a replayed video')
+    # Add tolerance argument
+    parser.add_argument('-tolerance', default=0, dest='tolerance', help='Allowed difference of numbers', type=float)
+    # Add ignore argument
+    parser.add_argument('-ignore', default=['timestamp', 'frame_id', 'position'], dest='ignore', nargs='*',
+                        help='Fields that are not compared', type=str)
+    # Add show argument
+    parser.add_argument('-show', default=10, dest='show', help='Number of differences to print', type=int)
+    return parser.parse_args()
+
+
+def load(filename: str, key: str) -> dict:
+    """
+    :param filename: Sidecar file written by Recorder in recorder.py.
+    :param key: Field the frames are keyed by.
+    :return: The frames' results by key.
+    """
+    frames = {}
+    with open(filename, 'r') as f:
+        for line in f:
+            if line.strip():
+                data = json.loads(line)
+                frames[data[key]] = data
+    return frames
+
+
+def differences(expected, actual, tolerance: float, path: str = '') -> list:
+    """
+    :return: The paths of the fields that differ, such as 'measurements.tape.1'.
+    """
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        return [difference for field in sorted(set(expected) | set(actual), key=str)
+                for difference in differences(expected.get(field), actual.get(field), tolerance,
+                                              '{}{}'.format(path + '.' if path else '', field))]
+    if isinstance(expected, list) and isinstance(actual, list) and len(expected) == len(actual):
+        return [difference for i, (e, a) in enumerate(zip(expected, actual))
+                for difference in differences(e, a, tolerance, '{}.{}'.format(path, i))]
+    if isinstance(expected, (int, float)) and isinstance(actual, (int, float)) and \
+            not isinstance(expected, bool) and not isinstance(actual, bool):
+        if math.isnan(expected) and math.isnan(actual) or abs(expected - actual) <= tolerance:
+            return []
+        return [path]
+    return [] if expected == actual else [path]
+
+
+def compare(expected: dict, actual: dict, tolerance: float, ignore: list) -> (list, list, list):
+    """
+    :return: Keys of frames only in expected, keys of frames only in actual, and the differing fields of every
+    differing frame.
+    """
+    common = sorted(set(expected) & set(actual))
+    differing = []
+    for key in common:
+        e = {field: value for field, value in expected[key].items() if field not in ignore}
+        a = {field: value for field, value in actual[key].items() if field not in ignore}
+        fields = differences(e, a, tolerance)
+        if fields:
+            differing.append((key, fields))
+    return sorted(set(expected) - set(actual)), sorted(set(actual) - set(expected)), differing
+
+
+if __name__ == '__main__':
+    args = get_args()
+    expected = load(args.expected, args.key)
+    actual = load(args.actual, args.key)
+    missing, extra, differing = compare(expected, actual, args.tolerance, args.ignore)
+    print('Frames: {} expected, {} actual, {} compared'.format(len(expected), len(actual),
+                                                               len(set(expected) & set(actual))))
+    print('Only in expected: {} Only in actual: {}'.format(len(missing), len(extra)))
+    print('Differing frames: {}'.format(len(differing)))
+    for field, count in Counter(field for _, fields in differing for field in fields).most_common():
+        print('    {}: {} frames'.format(field, count))
+    for key, fields in differing[:args.show]:
+        print('{} {}:'.format(args.key, key))
+        for field in fields:
+            e, a = expected[key], actual[key]
+            for part in field.split('.'):
+                e = e.get(part) if isinstance(e, dict) else e[int(part)] if isinstance(e, list) else None
+                a = a.get(part) if isinstance(a, dict) else a[int(part)] if isinstance(a, list) else None
+            print('    {}: {} -> {}'.format(field, e, a))
+    raise SystemExit(1 if missing or extra or differing else 0)
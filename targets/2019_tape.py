@@ -14,6 +14,7 @@ class Target(TargetBase):
     def __init__(self, main):
         super().__init__(main)
         self.exposure = 10
+        self.extrapolation = True
 
     def measurements(self, original, contours, rocket_hatch: bool = False, rocket_cargo: bool = False,
                      calculate: bool = True):
@@ -46,7 +47,13 @@ class Target(TargetBase):
         utils.put_number(field_angle, x, y, original)
         return angle, horizontal_distance, field_angle, [pair, pairs]
 
-    def calculate(self, pair, original):
+    def calculate(self, pair, original, game_piece: str = None):
+        """
+        :param pair: Reflector pair
+        :param original: Frame the pair was found in
+        :param game_piece: Owned game piece, read from networktables if not given
+        :return: Angle, horizontal distance and field angle of the pair
+        """
         if pair is None: return None, None, None
         x, y, w, h = cv2.boundingRect(pair[0])
         x2, y2, w2, h2 = cv2.boundingRect(pair[1])
@@ -85,8 +92,10 @@ class Target(TargetBase):
                 if rect1[1][1] < rect2[1][0]:
                     field_angle *= -1
 
-                owned_game_piece = self.main.nt.get_item('game_piece',
-                                                         'cargo') if self.main.results.networktables else 'cargo'
+                owned_game_piece = game_piece
+                if owned_game_piece is None:
+                    owned_game_piece = self.main.nt.get_item('game_piece',
+                                                             'cargo') if self.main.results.networktables else 'cargo'
                 robot = self.main.results.robot
                 if owned_game_piece and robot:
                     try:
@@ -219,11 +228,11 @@ class Target(TargetBase):
             rect = cv2.minAreaRect(cnt)
             box = cv2.boxPoints(rect)
             box = np.int0(box)
-            cv2.drawContours(original, [box], 0, (0, 0, 255), 2)
+            utils.draw_contours(original, [box], 0, (0, 0, 255), 2)
 
         pairs = self.get_pairs(filtered_contours)
 
         for first, second in pairs:
             x, y, w, h = cv2.boundingRect(first)
             x2, y2, w2, h2 = cv2.boundingRect(second)
-            cv2.rectangle(original, (x + w, y + h), (x2, y2), (0, 255, 0), 3)
+            utils.draw_rectangle(original, (x + w, y + h), (x2, y2), (0, 255, 0), 3)
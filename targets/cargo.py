@@ -8,14 +8,17 @@ class Target(TargetBase):
     """The cargo in the 2019."""
 
     def create_mask(self, frame, hsv):
+        self.capture('hsv', lambda: cv2.cvtColor(frame, cv2.COLOR_BGR2HSV))
         mask = utils.hsv_mask(frame, hsv)
         mask = utils.binary_thresh(mask, 127)
+        self.capture('threshold', mask)
 
         edge = self.edge_detection(frame, mask)
 
         mask = utils.bitwise_not(mask, edge)
         mask = utils.erode(mask, self.kernel_big)
         mask = utils.closing_morphology(mask, kernel_d=self.kernel_small, kernel_e=self.kernel_small, itr=3)
+        self.capture('morphology', mask)
 
         return mask
 
@@ -26,6 +29,7 @@ class Target(TargetBase):
         edge = utils.dilate(edge, self.kernel_big)
         edge = utils.opening_morphology(edge, kernel_e=self.kernel_small, kernel_d=self.kernel_small, itr=3)
         edge = utils.bitwise_and(edge, mask)
+        self.capture('edges', edge)
 
         return edge
 
@@ -53,4 +57,4 @@ class Target(TargetBase):
             for cnt in filtered_contours:
                 (a, b), radius = cv2.minEnclosingCircle(cnt)
                 center = int(a), int(b)
-                cv2.circle(original, center, int(radius), (0, 255, 0), 5)
+                utils.draw_circle(original, center, int(radius), (0, 255, 0), 5)
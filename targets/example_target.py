@@ -1,5 +1,6 @@
 import cv2
 
+import utils
 from targets.target_base import TargetBase
 
 
@@ -21,4 +22,4 @@ class Target(TargetBase):
     def draw_contours(filtered_contours, original):
         if not filtered_contours:
             return
-        cv2.drawContours(original, filtered_contours, -1, (255, 255, 0), 3)
+        utils.draw_contours(original, filtered_contours, -1, (255, 255, 0), 3)
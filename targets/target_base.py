@@ -10,6 +10,9 @@ import utils
 class TargetBase(ABC):
     """An abstract class representing a base target."""
 
+    # Shapes of the morphology kernels, whose sizes can be tuned from the web UI
+    kernel_shapes = {'kernel_small': cv2.MORPH_RECT, 'kernel_medium': cv2.MORPH_RECT, 'kernel_big': cv2.MORPH_CROSS}
+
     def __init__(self, main):
         self.kernel_small = np.array([1], dtype=np.uint8)
         self.kernel_medium = np.array([[1, 1],
@@ -18,18 +21,61 @@ class TargetBase(ABC):
                                     [1, 1, 1],
                                     [0, 1, 0]], dtype=np.uint8)
         self.exposure = 150
+        # Whether measurements are also extrapolated to the time they are sent
+        self.extrapolation = False
+        # Intermediate images of the current frame, only kept for stages requested by web clients
+        self.requested_stages = set()
+        self.stage_images = {}
+        # Kernels compiled off the loop, swapped in between frames
+        self.morphology = {'kernel_small': 1, 'kernel_medium': 2, 'kernel_big': 3}
+        self.pending_kernels = None
         self.main = main
 
+    def set_morphology(self, morphology: dict):
+        """
+        Compile new morphology kernels, to be applied before the next frame.
+        Called from the web server's threads, so the loop never waits for the kernels.
+        :param morphology: Kernel sizes by kernel name, e.g. {'kernel_big': 5}. Missing kernels are left unchanged.
+        See: apply_morphology()
+        """
+        morphology = dict(self.morphology, **{name: int(size) for name, size in morphology.items()
+                                              if name in self.kernel_shapes})
+        kernels = {name: cv2.getStructuringElement(self.kernel_shapes[name], (size, size))
+                   for name, size in morphology.items()}
+        self.pending_kernels = (morphology, kernels)
+
+    def apply_morphology(self):
+        """
+        Swap in the kernels compiled by set_morphology(), if any. Called by the loop between frames.
+        """
+        pending, self.pending_kernels = self.pending_kernels, None
+        if pending:
+            self.morphology, kernels = pending
+            for name, kernel in kernels.items():
+                setattr(self, name, kernel)
+
+    def capture(self, stage: str, image):
+        """
+        Keep an intermediate image of the current frame, if its stage was requested.
+        :param stage: Name of the stage, e.g. 'morphology'.
+        :param image: The image, or a function returning it, so it is only computed when requested.
+        """
+        if stage in self.requested_stages:
+            self.stage_images[stage] = image() if callable(image) else image
+
     def create_mask(self, frame, hsv):
         """
         :param frame: the frame to process
         :param hsv: JSON file
         :return: the mask of the target
         """
+        self.capture('hsv', lambda: cv2.cvtColor(frame, cv2.COLOR_BGR2HSV))
         mask = utils.hsv_mask(frame, hsv)
+        self.capture('threshold', mask)
         # create a cross kernel
         mask = utils.morphology(mask, self.kernel_big)
         mask = cv2.threshold(mask, 127, 255, 0)[1]
+        self.capture('morphology', mask)
         return mask
 
     @staticmethod
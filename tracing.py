@@ -0,0 +1,180 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import constants
+
+
+class Span:
+    """
+    Times a block of code as a complete event of a trace. Created by span() in Tracer only while tracing.
+    """
+
+    __slots__ = ('tracer', 'name', 'args', 'start')
+
+    def __init__(self, tracer, name: str, args: dict):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.add(self.name, self.start, time.perf_counter() - self.start, self.args)
+        return False
+
+
+class NoSpan:
+    """
+    Does nothing, returned by span() in Tracer while not tracing so instrumented code costs one check.
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NO_SPAN = NoSpan()
+
+
+class Tracer:
+    """
+    Records spans of the vision loop's stages and the work of the camera, web and recorder threads, and writes them in
+    the Chrome Trace Event format, viewable in Perfetto or chrome://tracing, to see where a slow frame went.
+
+    Tracing is started and stopped at runtime by the -trace argument or the trace route of the web server. While it's
+    off, span() returns a shared object that does nothing, so instrumentation has no cost.
+    Spans on the loop's thread carry the id of the frame being processed, and every thread is named in the trace.
+
+    Uses: The module's tracer, used by Metrics for the loop's stages, and by the camera, web and recorder threads.
+    See: time() in Metrics in metrics.py
+
+    Attributes
+    ----------
+
+    enabled : bool
+        - whether spans are recorded
+    events : deque
+        - the recorded spans, the oldest dropped past constants.TRACE_MAX_EVENTS
+    frame_id : int
+        - the id of the frame the loop is processing
+    thread_names : dict
+        - the names of the threads spans were recorded on, by thread id
+    """
+
+    def __init__(self, max_events: int = constants.TRACE_MAX_EVENTS):
+        """
+        :param max_events: The most spans kept.
+        """
+        self.enabled = False
+        self.events = deque(maxlen=max_events)
+        self.frame_id = None
+        self.loop_thread = None
+        self.frame_start = None
+        self.thread_names = {}
+        self.lock = threading.Lock()
+
+    def span(self, name: str, **args):
+        """
+        Time a block of code, if tracing.
+        :param name: Name of the span, such as the stage.
+        :param args: Values shown with the span, frame_id defaults to the loop's frame on the loop's thread.
+        :return: A context manager.
+        """
+        if not self.enabled:
+            return NO_SPAN
+        return Span(self, name, args)
+
+    def add(self, name: str, start: float, duration: float, args: dict):
+        """
+        Record a span. Spans are kept as tuples and only converted to events when written.
+        :param name: Name of the span.
+        :param start: Start of the span, from time.perf_counter().
+        :param duration: Duration of the span in seconds.
+        :param args: Values shown with the span.
+        """
+        tid = threading.get_ident()
+        if tid not in self.thread_names:
+            self.thread_names[tid] = threading.current_thread().name
+        if 'frame_id' not in args and tid == self.loop_thread:
+            args = dict(args, frame_id=self.frame_id)
+        self.events.append((name, start, duration, tid, args))
+
+    def begin_frame(self, frame_id: int):
+        """
+        Mark the start of a frame of the loop. Spans on this thread carry its id until the next frame.
+        :param frame_id: Id of the frame in the loop.
+        """
+        self.frame_id = frame_id
+        self.loop_thread = threading.get_ident()
+        self.frame_start = time.perf_counter() if self.enabled else None
+
+    def end_frame(self):
+        """
+        Record the frame as a span around its stages, if tracing started before it.
+        """
+        if self.enabled and self.frame_start is not None:
+            self.add('frame', self.frame_start, time.perf_counter() - self.frame_start, {})
+        self.frame_start = None
+
+    def start(self):
+        """
+        Start recording spans, discarding those of an earlier trace.
+        """
+        with self.lock:
+            if self.enabled:
+                return
+            self.events.clear()
+            self.enabled = True
+        logging.info('Tracing started')
+
+    def stop(self, folder: str = 'logs') -> str:
+        """
+        Stop recording spans, and write them.
+        :param folder: Folder of the trace file.
+        :return: The trace file, None if not tracing.
+        """
+        with self.lock:
+            if not self.enabled:
+                return None
+            self.enabled = False
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        filename = os.path.join(folder, 'trace-{}.json'.format(time.strftime('%d-%m-%Y-%H-%M-%S')))
+        self.write(filename)
+        logging.info('Trace of {} spans written to {}'.format(len(self.events), os.path.abspath(filename)))
+        return filename
+
+    def write(self, filename: str):
+        """
+        Write the recorded spans in the Chrome Trace Event JSON format, times in microseconds.
+        :param filename: Trace file.
+        """
+        pid = os.getpid()
+        events = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                  for tid, name in list(self.thread_names.items())]
+        events += [{'name': name, 'ph': 'X', 'ts': start * 1e6, 'dur': duration * 1e6, 'pid': pid, 'tid': tid,
+                    'args': args} for name, start, duration, tid, args in list(self.events)]
+        with open(filename, 'w') as f:
+            # Numpy numbers are written as floats
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, default=float)
+
+
+# The process' tracer, a trace still running at shutdown is written
+tracer = Tracer()
+atexit.register(tracer.stop)
+
+
+if __name__ == "__main__":
+    help(Tracer)
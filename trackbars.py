@@ -1,3 +1,5 @@
+from threading import Lock
+
 import cv2
 
 from file import File
@@ -6,13 +8,21 @@ from file import File
 class Trackbars:
     """
     This class handles the trackbar window that allows us to change and set the HSV values.
+    OpenCV windows may only be used from one thread, so the window is created and read by the local display's thread,
+    and the vision loop reads the values it last read.
+
+    See: add_task() in LocalDisplay in local_display.py
 
     Attributes
     ----------
     name : str
         - the name of the target for which the trackbars are created, and hsv values will be saved.
-    window
-        - the window in which the trackbars will exist.
+    hsv : dict
+        - the HSV values last read from the trackbars, initially those of the file
+    pending : dict
+        - HSV values set since the trackbars were last read, moved to by the local display's thread
+    created : bool
+        - whether the window and its trackbars were created by the local display's thread
     callback : function
         :returns None
         - a dry callback function for the trackbars, since OpenCv requires one but it isn't needed.
@@ -25,19 +35,26 @@ class Trackbars:
         values set to 255)
     """
 
-    def __init__(self, name: str):
+    def __init__(self, name: str, local_display):
         """
-        Create the trackbars window, create an HSV file, and assign the HSV values corresponding to the target.
+        Create an HSV file, assign the HSV values corresponding to the target, and have the local display's thread
+        create the trackbars window.
 
-        See: create_trackbars(), File class in file.py, __init__ in main.py
+        See: sync(), File class in file.py, __init__ in main.py
 
         :param name: The name of the target. Will be used for creating, or calling, the right file.
+        :param local_display: The LocalDisplay thread that handles the window.
         """
         self.name = name
-        self.window = cv2.namedWindow('HSV')  # Create window
         self.callback = lambda v: None  # Dry callback for trackbars since it's not needed
         self.file = File(self.name, {'H': (0, 255), 'S': (0, 255), 'V': (0, 255)}, 'hsv', 'json')
-        self.create_trackbars()
+        hsv = self.file.load_file()
+        self.morphology = hsv.get('morphology', {})
+        self.hsv = {key: tuple(hsv[key]) for key in 'HSV'}
+        self.pending = None
+        self.created = False
+        self.lock = Lock()
+        local_display.add_task(self.sync)
 
     def save_hsv_values(self):
         """
@@ -45,7 +62,10 @@ class Trackbars:
 
         See: get_hsv()
         """
-        self.file.save_file(self.get_hsv())
+        hsv = self.get_hsv()
+        if self.morphology:
+            hsv['morphology'] = self.morphology
+        self.file.save_file(hsv)
 
     def reload_trackbars(self):
         """
@@ -54,6 +74,28 @@ class Trackbars:
         Uses: Call when selecting a new target, and self.file changes.
         """
         hsv = self.file.load_file()
+        self.morphology = hsv.get('morphology', {})
+        self.set_hsv(hsv)
+
+    def set_hsv(self, hsv: dict):
+        """
+        Move the trackbars to new HSV values. Safe to call from any thread, such as the web server's: the values are
+        used right away, and the trackbars are moved by the local display's thread.
+
+        See: hsv() in web.py, sync()
+        :param hsv: HSV values, in the format of get_hsv(). Missing keys are left unchanged.
+        """
+        with self.lock:
+            self.hsv = dict(self.hsv, **{key: tuple(hsv[key]) for key in 'HSV' if key in hsv})
+            self.pending = self.hsv
+
+    @staticmethod
+    def move_trackbars(hsv: dict):
+        """
+        Move the trackbars to HSV values, only from the thread that created them.
+
+        :param hsv: HSV values, in the format of get_hsv().
+        """
         cv2.setTrackbarPos('lowH', 'HSV', hsv['H'][0])
         cv2.setTrackbarPos('highH', 'HSV', hsv['H'][1])
 
@@ -65,11 +107,12 @@ class Trackbars:
 
     def create_trackbars(self):
         """
-        Create the trackbars intially with the value from the file.
+        Create the window and its trackbars intially with the value from the file.
 
         See: load_file() in file.py
         """
         hsv = self.file.load_file()
+        cv2.namedWindow('HSV')
         # Create trackbars for color change
         cv2.createTrackbar('lowH', 'HSV', hsv['H'][0], 179, self.callback)
         cv2.createTrackbar('highH', 'HSV', hsv['H'][1], 179, self.callback)
@@ -80,10 +123,28 @@ class Trackbars:
         cv2.createTrackbar('lowV', 'HSV', hsv['V'][0], 255, self.callback)
         cv2.createTrackbar('highV', 'HSV', hsv['V'][1], 255, self.callback)
 
-    @staticmethod
-    def get_hsv() -> dict:
+    def sync(self):
         """
-        Get HSV values from trackbars.
+        Create the trackbars on the first call, move them to values set since the last call, and read their values.
+
+        Uses: Called by the local display's thread on every refresh.
+        """
+        if not self.created:
+            self.create_trackbars()
+            self.created = True
+        with self.lock:
+            pending, self.pending = self.pending, None
+        if pending:
+            self.move_trackbars(pending)
+        hsv = self.read_trackbars()
+        with self.lock:
+            # Values set while reading are kept until the next call moves the trackbars to them
+            if self.pending is None:
+                self.hsv = hsv
+
+    def get_hsv(self) -> dict:
+        """
+        Get the HSV values last read from the trackbars.
 
         Uses: Get HSV values for mask filtering, save HSV values to file.
         See: save_hsv_values(), loop() in main.py
@@ -91,6 +152,16 @@ class Trackbars:
         :return: HSV values, in dictionary format. The keys are the 3 variables, which hold two variable for low and
         high.
         """
+        with self.lock:
+            return dict(self.hsv)
+
+    @staticmethod
+    def read_trackbars() -> dict:
+        """
+        Read HSV values from the trackbars, only from the thread that created them.
+
+        :return: HSV values, in the format of get_hsv().
+        """
         low_h = cv2.getTrackbarPos('lowH', 'HSV')
         high_h = cv2.getTrackbarPos('highH', 'HSV')
         low_s = cv2.getTrackbarPos('lowS', 'HSV')
@@ -99,6 +170,18 @@ class Trackbars:
         high_v = cv2.getTrackbarPos('highV', 'HSV')
         return {'H': (low_h, high_h), 'S': (low_s, high_s), 'V': (low_v, high_v)}
 
+    def get_morphology(self) -> dict:
+        """
+        :return: Morphology kernel sizes saved with the HSV values, empty for the target's defaults.
+        """
+        return self.morphology
+
+    def set_morphology(self, morphology: dict):
+        """
+        :param morphology: Morphology kernel sizes to save with the HSV values.
+        """
+        self.morphology = dict(self.morphology, **morphology)
+
     def change_hsv(self,values):
         new_HSV = {'H':[values[0],values[1]],'S':[values[3],values[4]],"V":[values[5],values[6]]}
         self.file.save_file(new_HSV)
@@ -0,0 +1,151 @@
+import argparse
+import logging
+import math
+import socket
+import struct
+import time
+
+import numpy as np
+
+import constants
+
+# Frame id and capture timestamp
+HEADER = struct.Struct('<Id')
+# Flags, angle, distance and field angle for every target
+MEASUREMENT = struct.Struct('<B3f')
+
+SEEN = 1
+HAS_DISTANCE = 2
+HAS_FIELD_ANGLE = 4
+
+
+class UDP:
+    """
+    Sends each frame's measurements to the robot as a single datagram, as soon as they are measured.
+    Unlike networktables, nothing is batched on a timer, so the robot always gets the latest measurements right away.
+    Networktables is still used for configuration and dashboards.
+
+    Datagram layout (little endian): frame id (uint32), capture timestamp (float64), and for every target: flags
+    (uint8, see SEEN, HAS_DISTANCE and HAS_FIELD_ANGLE), angle, distance and field angle (float32, NaN if missing).
+
+    Attributes
+    ----------
+
+    address : tuple
+        - the host and port the datagrams are sent to
+    socket : socket.socket
+        - the UDP socket the datagrams are sent from
+    errors : int
+        - the number of datagrams that failed to send, such as while not connected to the robot
+    """
+
+    def __init__(self, host: str, port: int = constants.UDP_PORT):
+        """
+        Create the socket.
+        :param host: The host to send to, usually the robot.
+        :param port: The port to send to.
+        """
+        self.address = (host, port)
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.errors = 0
+        self.last_error_log = 0
+        logging.info('Sending measurements over UDP to {}:{}'.format(host, port))
+
+    def send(self, frame_id: int, timestamp: float, *measurements):
+        """
+        Send a frame's measurements. Send errors are counted and logged at most every
+        constants.UDP_ERROR_LOG_SECONDS, so the loop keeps running without the robot.
+        :param frame_id: Number of the frame the measurements were taken from.
+        :param timestamp: Time the frame was captured, in seconds since the epoch.
+        :param measurements: Angle, distance and field angle tuples, one for every target.
+        """
+        try:
+            self.socket.sendto(pack(frame_id, timestamp, *measurements), self.address)
+        except OSError as e:
+            self.errors += 1
+            now = time.time()
+            if now - self.last_error_log >= constants.UDP_ERROR_LOG_SECONDS:
+                self.last_error_log = now
+                logging.warning('UDP send to {}:{} failed ({} errors so far): {}'.format(*self.address, self.errors,
+                                                                                         e))
+
+
+def pack(frame_id: int, timestamp: float, *measurements) -> bytes:
+    """
+    :param frame_id: Number of the frame the measurements were taken from.
+    :param timestamp: Time the frame was captured, in seconds since the epoch.
+    :param measurements: Angle, distance and field angle tuples, one for every target.
+    :return: Datagram with the measurements.
+    """
+    data = [HEADER.pack(frame_id & 0xFFFFFFFF, timestamp)]
+    for angle, distance, field_angle in measurements:
+        flags = (SEEN if angle is not None else 0) | (HAS_DISTANCE if distance is not None else 0) | \
+                (HAS_FIELD_ANGLE if field_angle is not None else 0)
+        data.append(MEASUREMENT.pack(flags, *(math.nan if value is None else value
+                                              for value in (angle, distance, field_angle))))
+    return b''.join(data)
+
+
+def unpack(data: bytes) -> (int, float, list):
+    """
+    Reference decoding of a datagram, for the robot side.
+    :param data: Datagram received.
+    :return: Frame id, capture timestamp and an angle, distance and field angle tuple for every target, with None
+    for missing values.
+    """
+    frame_id, timestamp = HEADER.unpack_from(data)
+    measurements = []
+    for offset in range(HEADER.size, len(data), MEASUREMENT.size):
+        flags, angle, distance, field_angle = MEASUREMENT.unpack_from(data, offset)
+        measurements.append((angle if flags & SEEN else None,
+                             distance if flags & HAS_DISTANCE else None,
+                             field_angle if flags & HAS_FIELD_ANGLE else None))
+    return frame_id, timestamp, measurements
+
+
+def receive(port: int):
+    """
+    Reference receiver, logs every datagram with its latency.
+    Latency is only meaningful when both clocks are synchronized.
+    :param port: The port to listen on.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('0.0.0.0', port))
+    logging.info('Listening on port {}'.format(port))
+    while True:
+        data = sock.recv(1024)
+        frame_id, timestamp, measurements = unpack(data)
+        logging.info('Frame {} latency {:.2f} ms: {}'.format(frame_id, (time.time() - timestamp) * 1000,
+                                                             measurements))
+
+
+def loopback_test(port: int, count: int):
+    """
+    Send datagrams to a receiver on the same machine and log the latency percentiles.
+    :param port: The port to send to and listen on.
+    :param count: Number of datagrams to send.
+    """
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(('127.0.0.1', port))
+    sender = UDP('127.0.0.1', port)
+    latencies = []
+    for frame_id in range(count):
+        sender.send(frame_id, time.time(), (1.0, 2.0, None))
+        _, timestamp, _ = unpack(receiver.recv(1024))
+        latencies.append(time.time() - timestamp)
+    latencies = np.array(latencies) * 1000
+    logging.info('{} datagrams, latency p50 {:.3f} p90 {:.3f} p99 {:.3f} max {:.3f} ms'.format(
+        count, *np.percentile(latencies, [50, 90, 99]), latencies.max()))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='[%(levelname)s] %(message)s', level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-port', default=constants.UDP_PORT, dest='port', help='Port to listen on', type=int)
+    parser.add_argument('-test', default=0, dest='test', type=int,
+                        help='Run a loopback latency test with this many datagrams instead of receiving')
+    args = parser.parse_args()
+    if args.test:
+        loopback_test(args.port, args.test)
+    else:
+        receive(args.port)
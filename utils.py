@@ -8,6 +8,8 @@ import cv2
 import imutils
 import numpy as np
 
+from overlay import Overlay
+
 
 def index0(x: iter):
     """
@@ -317,18 +319,19 @@ def canny_edge_detection(frame: np.array, sigma=33) -> np.array:
     return imutils.auto_canny(gray, sigma=sigma)
 
 
-def calculate_fps(frame: np.array, current_time: float, last_time: float, avg: float) -> float:
+def calculate_fps(frame: np.array, frame_times) -> float:
     """
-    Calculates current FPS and write on frame.
-    :param frame: A frame.
-    :param current_time: The current time measured.
-    :param last_time: The previous time measured.
-    :param avg: Accumulated average.
-    :return: Average FPS.
+    Calculates the average FPS over the last frames and write on frame.
+    :param frame: A frame or overlay.
+    :param frame_times: The times the last frames ended at, such as frame_times in Metrics in metrics.py.
+    :return: Average FPS, 0 if there aren't enough frames yet.
     """
-    avg = (avg + (current_time - last_time)) / 2
-    cv2.putText(frame, '{} FPS'.format(int(1 / avg)), (0, 25), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2, cv2.LINE_AA)
-    return avg
+    frame_times = list(frame_times)
+    fps = 0
+    if len(frame_times) > 1 and frame_times[-1] > frame_times[0]:
+        fps = (len(frame_times) - 1) / (frame_times[-1] - frame_times[0])
+    draw_text(frame, '{} FPS'.format(int(fps)), (0, 25), 1, (255, 255, 255), 2)
+    return fps
 
 
 def solidity(cnt) -> float:
@@ -540,10 +543,10 @@ def put_number(number: Union[float, int], x: int, y: int, image: np.array):
     :param number: Number to display.
     :param x: X coordinate to put number.
     :param y: Y coordinate to put number.
-    :param image: Image to put number on.
+    :param image: Image or overlay to put number on.
     """
     if number is not None:
-        cv2.putText(image, str(int(number)), (x, y), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 1, cv2.LINE_AA)
+        draw_text(image, str(int(number)), (x, y), 1, (0, 0, 255), 1)
 
 
 def bounding_box_coords(bounding_box: iter, frame: np.array) -> (int, int, int, int):
@@ -561,6 +564,90 @@ def bounding_box_coords(bounding_box: iter, frame: np.array) -> (int, int, int,
     return x1, x2, y1, y2
 
 
+def region_depth_stats(depth: np.array, x1: float, y1: float, x2: float, y2: float, step: int = 5,
+                       trim: float = 0.1, scale: float = 1) -> (float, float):
+    """
+    Uses: Distance from a bounding box, without calling get_distance for every pixel.
+
+    :param depth: Depth array, in meters, or in raw units if scale is given. Only the sampled points are scaled.
+    :param x1: Left X coordinate of the region.
+    :param y1: Top Y coordinate of the region.
+    :param x2: Right X coordinate of the region.
+    :param y2: Bottom Y coordinate of the region.
+    :param step: Distance in pixels between sampled points.
+    :param trim: Fraction of the lowest and highest distances ignored in the mean.
+    :param scale: Meters per depth unit.
+    :return: Median and trimmed mean of the distances in the region, ignoring invalid (zero) depth. None, None if no
+    valid depth exists in the region.
+    """
+    region = depth[max(int(y1), 0):max(int(y2), 0):step, max(int(x1), 0):max(int(x2), 0):step]
+    valid = np.sort(region[region > 0], axis=None) * scale
+    if not valid.size:
+        return None, None
+    cut = int(valid.size * trim)
+    trimmed = valid[cut:valid.size - cut] if valid.size - 2 * cut > 0 else valid
+    return float(np.median(valid)), float(trimmed.mean())
+
+
+def draw_rectangle(image, pt1: Tuple[int, int], pt2: Tuple[int, int], color: Tuple[int, int, int], thickness: int):
+    """
+    Uses: All drawing goes through these functions, so annotations can be recorded by an Overlay instead.
+
+    :param image: Frame to draw on, or an Overlay to record the rectangle in.
+    :param pt1: A corner of the rectangle.
+    :param pt2: The opposite corner of the rectangle.
+    :param color: BGR color.
+    :param thickness: Line thickness, negative for a filled rectangle.
+    """
+    if isinstance(image, Overlay):
+        image.rectangle(pt1, pt2, color, thickness)
+    else:
+        cv2.rectangle(image, pt1, pt2, color, thickness)
+
+
+def draw_contours(image, contours: list, index: int, color: Tuple[int, int, int], thickness: int):
+    """
+    :param image: Frame to draw on, or an Overlay to record the contours in.
+    :param contours: List of contours.
+    :param index: Index of the contour to draw, -1 to draw all of them.
+    :param color: BGR color.
+    :param thickness: Line thickness.
+    """
+    if isinstance(image, Overlay):
+        image.contours(contours if index < 0 else [contours[index]], color, thickness)
+    else:
+        cv2.drawContours(image, contours, index, color, thickness)
+
+
+def draw_circle(image, center: Tuple[int, int], radius: int, color: Tuple[int, int, int], thickness: int):
+    """
+    :param image: Frame to draw on, or an Overlay to record the circle in.
+    :param center: Center of the circle.
+    :param radius: Radius of the circle.
+    :param color: BGR color.
+    :param thickness: Line thickness.
+    """
+    if isinstance(image, Overlay):
+        image.circle(center, radius, color, thickness)
+    else:
+        cv2.circle(image, center, radius, color, thickness)
+
+
+def draw_text(image, text: str, org: Tuple[int, int], scale: float, color: Tuple[int, int, int], thickness: int):
+    """
+    :param image: Frame to draw on, or an Overlay to record the text in.
+    :param text: Text to draw.
+    :param org: Bottom left corner of the text.
+    :param scale: Font scale.
+    :param color: BGR color.
+    :param thickness: Line thickness.
+    """
+    if isinstance(image, Overlay):
+        image.text(text, org, scale, color, thickness)
+    else:
+        cv2.putText(image, text, org, cv2.FONT_HERSHEY_SIMPLEX, scale, color, thickness, cv2.LINE_AA)
+
+
 if __name__ == "__main__":
     functions = dir()
     print('List of functions in utils:')  # Print all functions in file.
@@ -1,12 +1,16 @@
+import json
 import logging
 import time
-from threading import Thread
+from threading import Thread, Condition
 
 import cv2
 import imutils
-from flask import Flask, render_template, Response, request
+from flask import Flask, render_template, Response, request, jsonify
 
+import constants
 import utils
+from metrics import Metrics
+from tracing import tracer
 
 
 class Web:
@@ -22,9 +26,22 @@ class Web:
         - the application that will run the streaming service
     frame
         - the frame that is being streamed
+        - setting it wakes up the encoder thread
     resize: bool, optional
         - whether the frame should be resized
         - used to improve performance
+    variants : dict
+        - the last frame, JPEG encoded once for every (stage, width, quality) requested by clients and shared between
+          them, the stage being None for the frame itself or the name of an intermediate image
+        - each variant holds the encoded frame, its id and the number of clients using it
+    clients : int
+        - the number of connected stream clients, frames are only encoded while there are any
+    overlay_json : str
+        - the annotations of the last frame, serialized once and sent to all overlay clients
+    overlay_clients : int
+        - the number of connected overlay clients, annotations are only serialized while there are any
+    metrics : Metrics
+        - the main's metrics, served by the metrics route
     """
 
     def __init__(self, main, resize: bool = False):
@@ -35,8 +52,22 @@ class Web:
         """
         self.main = main
         self.app = Flask('Web')
-        self.frame = None
         self.resize = resize
+        # Frames set by the main loop, waited on by the encoder thread
+        self.frame_condition = Condition()
+        self._frame = None
+        self._overlay = None
+        self._stages = {}
+        self.frame_id = 0
+        self.loop_frame_id = None
+        # Encoded frames, waited on by the clients
+        self.jpeg_condition = Condition()
+        self.variants = {}
+        self.clients = 0
+        self.overlay_json = None
+        self.overlay_id = 0
+        self.overlay_clients = 0
+        self.metrics = getattr(self.main, 'metrics', None) or Metrics()
 
         # Index html file
         @self.app.route('/')
@@ -45,14 +76,61 @@ class Web:
                 filename = self.main.nt.get_item('match data', 'Enter file name')
             else:
                 filename = time.strftime("%d-%m-%Y-%H-%M-%S")
-            return render_template('index.html', initial_filename=filename)
+            return render_template('index.html', initial_filename=filename, overlay_transport='sse',
+                                   stages=constants.WEB_STAGES)
 
         # Video feed endpoint
         @self.app.route('/stream.mjpg')
-        def video_feed():  # Initiate the feed
-            return Response(self.stream_frame(),
+        def video_feed():
+            """
+            Initiate the feed. Optional query parameters:
+            width - width to resize to, full size by default
+            quality - JPEG quality, 1 to 100
+            fps - maximum frames per second
+            auto - adapt width and quality to the client's throughput, ignoring width and quality
+            """
+            width = request.args.get('width', type=int)
+            quality = min(max(request.args.get('quality', constants.WEB_STREAM_QUALITY, type=int), 1), 100)
+            fps = request.args.get('fps', type=float)
+            auto = 'auto' in request.args
+            return Response(self.stream_frame(width, quality, fps, auto),
+                            mimetype='multipart/x-mixed-replace; boundary=frame')
+
+        # Intermediate stage feed endpoint
+        @self.app.route('/stream/<stage>.mjpg')
+        def stage_feed(stage):
+            """
+            Stream an intermediate image of the pipeline, with the same query parameters as the video feed.
+            The image is only computed by the loop while it has clients.
+            See: constants.WEB_STAGES
+            """
+            if stage not in constants.WEB_STAGES:
+                return 'Unknown stage', 404
+            width = request.args.get('width', type=int)
+            quality = min(max(request.args.get('quality', constants.WEB_STREAM_QUALITY, type=int), 1), 100)
+            fps = request.args.get('fps', type=float)
+            auto = 'auto' in request.args
+            return Response(self.stream_frame(width, quality, fps, auto, stage),
                             mimetype='multipart/x-mixed-replace; boundary=frame')
 
+        @self.app.route('/overlay')
+        def overlay():
+            """
+            Annotations of every frame as JSON server-sent events, drawn over the stream by the web UI.
+            """
+            return Response(self.stream_overlay(), mimetype='text/event-stream')
+
+        @self.app.route('/metrics')
+        def metrics():
+            """
+            Performance metrics as JSON, or in the Prometheus text format if requested with ?format=prometheus or by
+            a Prometheus scraper.
+            """
+            snapshot = self.metrics_snapshot()
+            if request.args.get('format') == 'prometheus' or 'text/plain' in request.headers.get('Accept', ''):
+                return Response(Metrics.prometheus(snapshot), mimetype='text/plain')
+            return jsonify(snapshot)
+
         @self.app.route('/save', methods=['POST'])
         def save():
             """
@@ -62,6 +140,63 @@ class Web:
             self.main.hsv_handler.save_hsv_values()
             return '', 204
 
+        @self.app.route('/hsv', methods=['GET', 'POST'])
+        def hsv():
+            """
+            Get or change the HSV ranges and morphology kernel sizes of the running target, as JSON in the format
+            {'H': [low, high], 'S': [low, high], 'V': [low, high], 'morphology': {'kernel_big': 3, ...}}.
+            Changed values are applied to the next frame, and only written to the file by the save route.
+            See: tuning(), tune()
+            """
+            if not self.can_tune():
+                return 'Tuning is not available', 404
+            if request.method == 'POST':
+                try:
+                    self.tune(request.get_json(force=True))
+                except (AttributeError, TypeError, ValueError) as e:
+                    return 'Invalid values: {}'.format(e), 400
+            return jsonify(self.tuning())
+
+        @self.app.route('/dump', methods=['POST'])
+        def dump():
+            """
+            Post route that dumps the last seconds of frames from the flight recorder to disk.
+            See: trigger() in FlightRecorder in flight_recorder.py
+            """
+            if getattr(self.main, 'flight_recorder', None) is None:
+                return 'Flight recorder is not running', 404
+            self.main.flight_recorder.trigger('web')
+            return '', 204
+
+        @self.app.route('/trace', methods=['GET', 'POST'])
+        def trace():
+            """
+            Get whether the run is traced, or start or stop tracing with a post of 'start' or 'stop'. Stopping writes
+            the trace to the logs folder.
+            See: Tracer in tracing.py
+            """
+            action = request.get_data(as_text=True) if request.method == 'POST' else None
+            try:
+                return jsonify(self.trace(action))
+            except ValueError:
+                return 'Invalid action: {}'.format(action), 400
+
+        @self.app.route('/profile', methods=['GET', 'POST'])
+        def profile():
+            """
+            Get the state of the profiler and the top functions of the last profile, or request a profile of the loop
+            with a post of the mode and number of frames or seconds, e.g. {"mode": "sampling", "seconds": 5}.
+            See: Profiler in profiler.py
+            """
+            if getattr(self.main, 'profiler', None) is None:
+                return 'Profiling is not available', 404
+            if request.method == 'POST':
+                try:
+                    self.profile(request.get_json(force=True, silent=True) or {})
+                except (AttributeError, TypeError, ValueError) as e:
+                    return 'Invalid profile: {}'.format(e), 400
+            return jsonify(self.main.profiler.state())
+
         @self.app.route('/update', methods=['POST'])
         def update():
             """
@@ -96,19 +231,268 @@ class Web:
             self.main.display.stop_recording()
             return '', 204
 
-    def stream_frame(self):
+    @property
+    def frame(self):
+        return self._frame
+
+    @frame.setter
+    def frame(self, frame):
+        self.set_frame(frame)
+
+    def set_frame(self, frame, overlay: dict = None, stages: dict = None):
         """
-        A generator that encodes and streams the last frame to the stream endpoint.
-        :return: JPEG encoded frame.
+        Set the frame to stream and wake up the encoder thread.
+        :param frame: The new frame.
+        :param overlay: Annotations of the frame, to be drawn by the web UI.
+        :param stages: Intermediate images of the frame by stage name, for the stage streams.
+        See: data() in Overlay in overlay.py; requested_stages()
         """
+        with self.frame_condition:
+            self._frame = frame
+            self._overlay = overlay
+            self._stages = stages or {}
+            self.frame_id += 1
+            # The loop's id of the frame, for tracing its encoding
+            self.loop_frame_id = tracer.frame_id
+            self.frame_condition.notify()
+
+    def encode_frames(self):
+        """
+        Encode every new frame once for every variant that has clients, serialize its annotations once if there are
+        overlay clients, and wake up all clients.
+        """
+        last_id = 0
         while True:
-            frame = self.frame
-            if self.resize:
-                frame = imutils.resize(frame, 320)
-            if frame is None:
-                continue
-            jpg = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), 20])[1].tostring()
-            yield (b'--frame\r\n'b'Content-Type: image/jpeg\r\n\r\n' + jpg + b'\r\n')
+            with self.frame_condition:
+                self.frame_condition.wait_for(
+                    lambda: self.frame_id != last_id and (self.clients or self.overlay_clients))
+                frame, overlay, stages, last_id = self._frame, self._overlay, self._stages, self.frame_id
+                loop_frame_id = self.loop_frame_id
+            if overlay is not None and self.overlay_clients:
+                with tracer.span('serialize_overlay', frame_id=loop_frame_id):
+                    overlay_json = json.dumps(dict(overlay, frame_id=last_id))
+                with self.jpeg_condition:
+                    self.overlay_json = overlay_json
+                    self.overlay_id += 1
+            with self.jpeg_condition:
+                keys = [key for key, variant in self.variants.items() if variant['clients']]
+            images = {None: frame, **stages}
+            keys = [key for key in keys if images.get(key[0]) is not None]
+            encoded = {}
+            if keys:
+                with self.metrics.time('encode', frame_id=loop_frame_id, variants=len(keys)):
+                    encoded = {key: self.encode(images[key[0]], *key[1:]) for key in keys}
+            with self.jpeg_condition:
+                for key, jpg in encoded.items():
+                    variant = self.variants.get(key)
+                    if variant:
+                        variant['jpeg'] = jpg
+                        variant['id'] += 1
+                self.jpeg_condition.notify_all()
+            self.on_encoded()
+
+    def on_encoded(self):
+        """
+        Called from the encoder thread after every encoded frame. Clients here wait on jpeg_condition instead.
+        """
+        pass
+
+    def encode(self, frame, width, quality: int) -> bytes:
+        """
+        :param frame: Frame to encode.
+        :param width: Width to resize to, None to keep the size.
+        :param quality: JPEG quality.
+        :return: JPEG encoded frame.
+        """
+        if width is None and self.resize:
+            width = 320
+        if width and width < frame.shape[1]:
+            frame = imutils.resize(frame, width)
+        return cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), quality])[1].tobytes()
+
+    def subscribe_overlay(self, change: int):
+        """
+        Add or remove an overlay client.
+        :param change: 1 to add a client, -1 to remove one.
+        """
+        with self.frame_condition:
+            self.overlay_clients += change
+            self.frame_condition.notify()
+
+    def stream_overlay(self):
+        """
+        A generator that streams the annotations of every frame as server-sent events.
+        :return: JSON annotations event.
+        """
+        self.subscribe_overlay(1)
+        try:
+            last_id = 0
+            while True:
+                with self.jpeg_condition:
+                    self.jpeg_condition.wait_for(lambda: self.overlay_id != last_id)
+                    overlay_json, last_id = self.overlay_json, self.overlay_id
+                yield 'data: {}\n\n'.format(overlay_json)
+        finally:
+            self.subscribe_overlay(-1)
+
+    def can_tune(self) -> bool:
+        """
+        :return: Whether the main has a single HSV handler and a running target to tune.
+        """
+        return hasattr(self.main, 'hsv_handler') and getattr(self.main, 'target', None) is not None
+
+    def tuning(self) -> dict:
+        """
+        :return: The HSV ranges and morphology kernel sizes in use.
+        """
+        hsv = self.main.hsv_handler.get_hsv()
+        return {'H': list(hsv['H']), 'S': list(hsv['S']), 'V': list(hsv['V']),
+                'morphology': dict(self.main.target.morphology)}
+
+    def tune(self, data: dict):
+        """
+        Validate and apply new HSV ranges and morphology kernel sizes. Kernels are compiled here, off the loop, and
+        swapped in by the loop between frames.
+        See: set_morphology() in TargetBase in targets/target_base.py
+        :param data: Values in the format of tuning(). Missing values are left unchanged.
+        :raise ValueError: If a value is out of range.
+        """
+        hsv = {}
+        for channel in 'HSV':
+            if channel in data:
+                low, high = (int(value) for value in data[channel])
+                if not 0 <= low <= high <= 255:
+                    raise ValueError('{} range must be within 0 to 255'.format(channel))
+                hsv[channel] = [low, high]
+        morphology = {name: int(size) for name, size in data.get('morphology', {}).items()}
+        for name, size in morphology.items():
+            if name not in self.main.target.kernel_shapes:
+                raise ValueError('Unknown kernel {}'.format(name))
+            if not 1 <= size <= constants.WEB_MAX_KERNEL_SIZE:
+                raise ValueError('{} must be within 1 to {}'.format(name, constants.WEB_MAX_KERNEL_SIZE))
+        if hsv:
+            self.main.hsv_handler.set_hsv(hsv)
+        if morphology:
+            self.main.hsv_handler.set_morphology(morphology)
+            self.main.target.set_morphology(morphology)
+
+    def trace(self, action: str = None) -> dict:
+        """
+        Start or stop tracing.
+        :param action: 'start', 'stop', or None to only get the state.
+        :return: Whether tracing, the number of spans recorded, and the trace file if one was just written.
+        """
+        if action not in (None, 'start', 'stop'):
+            raise ValueError(action)
+        filename = None
+        if action == 'start':
+            tracer.start()
+        elif action == 'stop':
+            filename = tracer.stop()
+        return {'tracing': tracer.enabled, 'spans': len(tracer.events), 'file': filename}
+
+    def profile(self, data: dict):
+        """
+        Request a profile of the loop.
+        :param data: Mode, and number of frames or seconds.
+        See: request() in Profiler in profiler.py
+        """
+        self.main.profiler.request(str(data.get('mode', 'cprofile')),
+                                   None if data.get('frames') is None else int(data['frames']),
+                                   None if data.get('seconds') is None else float(data['seconds']))
+
+    def metrics_snapshot(self) -> dict:
+        """
+        :return: The main's metrics, with the number of connected stream clients.
+        """
+        self.metrics.set('web_clients', self.clients)
+        return self.metrics.snapshot()
+
+    def requested_stages(self) -> set:
+        """
+        :return: Names of the intermediate stages that have stream clients, the only ones the loop needs to compute.
+        """
+        with self.jpeg_condition:
+            return {key[0] for key, variant in self.variants.items() if key[0] is not None and variant['clients']}
+
+    def subscribe(self, key, change: int):
+        """
+        Add or remove a client from a variant.
+        :param key: Stage, width and quality of the variant.
+        :param change: 1 to add a client, -1 to remove one.
+        """
+        with self.jpeg_condition:
+            variant = self.variants.setdefault(key, {'jpeg': None, 'id': 0, 'clients': 0})
+            variant['clients'] += change
+            if not variant['clients']:
+                del self.variants[key]
+        with self.frame_condition:
+            self.clients += change
+            # Wake up the encoder in case a frame is waiting
+            self.frame_condition.notify()
+
+    def stream_frame(self, width=None, quality: int = constants.WEB_STREAM_QUALITY, fps: float = None,
+                     auto: bool = False, stage: str = None):
+        """
+        A generator that streams the last encoded frame to the stream endpoint.
+        Slow clients skip to the newest frame instead of queueing frames.
+        In auto mode, the time it takes to send each frame picks the level from constants.WEB_STREAM_LEVELS.
+        :param width: Width to resize to, None to keep the size.
+        :param quality: JPEG quality.
+        :param fps: Maximum frames per second, None for no limit.
+        :param auto: Whether to adapt width and quality to the client's throughput.
+        :param stage: Name of the intermediate image to stream, None for the frame itself.
+        :return: JPEG encoded frame.
+        """
+        level = len(constants.WEB_STREAM_LEVELS) // 2
+        fast_frames = 0
+        # Time to send a frame with which the auto frame rate can be kept
+        budget = 1 / (fps or constants.WEB_STREAM_AUTO_FPS)
+        key = (stage,) + (constants.WEB_STREAM_LEVELS[level] if auto else (width, quality))
+        self.subscribe(key, 1)
+        try:
+            last_id = 0
+            last_time = 0
+            while True:
+                if fps:
+                    time.sleep(max(last_time + 1 / fps - time.time(), 0))
+                with self.jpeg_condition:
+                    self.jpeg_condition.wait_for(lambda: self.variants[key]['id'] != last_id)
+                    jpg, last_id = self.variants[key]['jpeg'], self.variants[key]['id']
+                last_time = time.time()
+                # The generator resumes once the frame was written to the client
+                yield (b'--frame\r\n'b'Content-Type: image/jpeg\r\n\r\n' + jpg + b'\r\n')
+                if not auto:
+                    continue
+                new_level, fast_frames = self.adapt_level(level, fast_frames, time.time() - last_time, budget)
+                if new_level != level:
+                    level = new_level
+                    self.subscribe((stage,) + constants.WEB_STREAM_LEVELS[level], 1)
+                    self.subscribe(key, -1)
+                    key = (stage,) + constants.WEB_STREAM_LEVELS[level]
+                    last_id = 0
+        finally:
+            self.subscribe(key, -1)
+
+    @staticmethod
+    def adapt_level(level: int, fast_frames: int, send_time: float, budget: float) -> (int, int):
+        """
+        Pick the automatic stream level after sending a frame.
+        Moves down a level right away when a frame is sent too slowly, and up a level after many fast frames.
+        :param level: Current index in constants.WEB_STREAM_LEVELS.
+        :param fast_frames: Number of consecutive fast frames.
+        :param send_time: Seconds it took to send the last frame.
+        :param budget: Seconds a frame may take to send.
+        :return: New level and number of consecutive fast frames.
+        """
+        if send_time > budget and level > 0:
+            return level - 1, 0
+        if send_time < budget / 4:
+            fast_frames += 1
+            if fast_frames >= constants.WEB_STREAM_AUTO_UPGRADE_FRAMES and \
+                    level < len(constants.WEB_STREAM_LEVELS) - 1:
+                return level + 1, 0
+        return level, fast_frames
 
     def serve(self):
         """
@@ -119,8 +503,9 @@ class Web:
 
     def start_thread(self):
         """
-        Run web server in a thread - daemon so it lets the program exit.
+        Run web server and frame encoder in threads - daemon so they let the program exit.
         """
+        Thread(target=self.encode_frames, daemon=True, name='web-encoder').start()
         Thread(target=self.serve, daemon=True).start()
 
 
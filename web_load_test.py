@@ -0,0 +1,129 @@
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import threading
+import time
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+
+from web import Web
+
+logging.basicConfig(format='[%(levelname)s] %(message)s', level=logging.INFO)
+
+
+def get_args():
+    """
+    Add command line arguments.
+    :return: Parsed arguments
+    """
+    parser = argparse.ArgumentParser()
+    # Add server argument
+    parser.add_argument('-server', default='flask', help='Web server to test', type=str, choices=['flask', 'async'])
+    # Add clients argument
+    parser.add_argument('-clients', default=10, dest='clients', help='Number of stream clients', type=int)
+    # Add duration argument
+    parser.add_argument('-duration', default=10, dest='duration', help='Seconds to run each phase', type=float)
+    # Add stream query argument
+    parser.add_argument('-query', default='', dest='query', help='Stream query, e.g. width=320&quality=30', type=str)
+    return parser.parse_args()
+
+
+class VisionLoop(threading.Thread):
+    """
+    Stands in for the vision loop: creates a mask and finds contours on a synthetic frame, and streams it.
+    """
+
+    def __init__(self, web):
+        super().__init__(daemon=True)
+        self.web = web
+        self.frames = 0
+        self.cpu = 0
+        self.exit = False
+
+    def run(self):
+        background = np.random.randint(0, 255, (240, 424, 3), dtype=np.uint8)
+        cpu_start = time.thread_time()
+        while not self.exit:
+            frame = background.copy()
+            x = self.frames % 300
+            cv2.rectangle(frame, (x, 80), (x + 60, 160), (0, 255, 0), -1)
+            mask = cv2.inRange(cv2.cvtColor(frame, cv2.COLOR_BGR2HSV), (50, 100, 100), (70, 255, 255))
+            cv2.findContours(mask, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+            self.web.frame = frame
+            self.frames += 1
+            self.cpu = time.thread_time() - cpu_start
+            time.sleep(0.001)
+
+
+def clients(count: int, duration: float, query: str, received):
+    """
+    Open stream clients and count the frames they receive. Run in a separate process so the clients don't take CPU
+    from the server being measured.
+    """
+    async def client(index):
+        reader, writer = await asyncio.open_connection('127.0.0.1', 5802)
+        writer.write('GET /stream.mjpg?{} HTTP/1.1\r\nHost: localhost\r\n\r\n'.format(query).encode())
+        await writer.drain()
+        end = time.time() + duration
+        while time.time() < end:
+            try:
+                data = await asyncio.wait_for(reader.read(65536), end - time.time())
+            except asyncio.TimeoutError:
+                break
+            received[index] += data.count(b'--frame')
+        writer.close()
+
+    async def run():
+        await asyncio.gather(*(client(i) for i in range(count)))
+
+    asyncio.run(run())
+
+
+def phase(vision: VisionLoop, count: int, duration: float, query: str) -> dict:
+    """
+    Run the vision loop with stream clients.
+    :return: Vision FPS, process and vision CPU use, frames received by the clients and thread count.
+    """
+    received = multiprocessing.Array('i', max(count, 1))
+    process = multiprocessing.Process(target=clients, args=(count, duration, query, received)) if count else None
+    frames, vision_cpu, cpu = vision.frames, vision.cpu, time.process_time()
+    if process:
+        process.start()
+    start = time.time()
+    time.sleep(duration)
+    threads = threading.active_count()
+    if process:
+        process.join()
+    elapsed = time.time() - start
+    return {'fps': (vision.frames - frames) / elapsed,
+            'process_cpu': (time.process_time() - cpu) / elapsed * 100,
+            'vision_cpu': (vision.cpu - vision_cpu) / elapsed * 100,
+            'received': list(received)[:count],
+            'threads': threads}
+
+
+if __name__ == '__main__':
+    args = get_args()
+    main = SimpleNamespace(results=SimpleNamespace(networktables=False))
+    if args.server == 'async':
+        from async_web import AsyncWeb
+        server = AsyncWeb(main)
+    else:
+        server = Web(main)
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server.start_thread()
+    vision = VisionLoop(server)
+    vision.start()
+    time.sleep(1)
+    for count in (0, args.clients):
+        result = phase(vision, count, args.duration, args.query)
+        logging.info('{} clients: vision {:.1f} FPS, server CPU {:.1f}% (process {:.1f}%, vision {:.1f}%), '
+                     '{} threads'.format(count, result['fps'], result['process_cpu'] - result['vision_cpu'],
+                                         result['process_cpu'], result['vision_cpu'], result['threads']))
+        if count:
+            logging.info('Stream FPS per client: min {:.1f} mean {:.1f}'.format(
+                min(result['received']) / args.duration, np.mean(result['received']) / args.duration))
+    vision.exit = True